@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+class MFAModelBackend(ModelBackend):
+    """``ModelBackend`` that loads the user's ``UserMFA`` row in the same query.
+
+    ``MFAAuthenticationForm.confirm_login_allowed`` reads ``user.mfa_config``
+    right after authentication; with the join that costs no further query,
+    also for users without a configuration.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.select_related("mfa_config").get(
+                **{UserModel.USERNAME_FIELD: username}
+            )
+        except UserModel.DoesNotExist:
+            # Hash anyway, so a missing user takes as long as a wrong password.
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
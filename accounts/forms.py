@@ -4,6 +4,7 @@ from django import forms
 from django.contrib.auth.forms import AuthenticationForm
 from django.utils.translation import gettext_lazy as _
 
+from .lockout import get_lockout
 from .models import UserMFA
 
 
@@ -19,12 +20,14 @@ class MFAAuthenticationForm(AuthenticationForm):
         **AuthenticationForm.error_messages,
         "mfa_required": _("Enter the code from your authenticator app to continue."),
         "invalid_mfa": _("The authentication code you entered is invalid or has expired."),
+        "mfa_locked": _("Too many invalid codes. Try again in %(seconds)s seconds."),
     }
 
     def confirm_login_allowed(self, user):
         super().confirm_login_allowed(user)
 
         try:
+            # Joined by accounts.backends.MFAModelBackend, so no query here.
             config = user.mfa_config
         except UserMFA.DoesNotExist:
             return
@@ -38,5 +41,15 @@ class MFAAuthenticationForm(AuthenticationForm):
         if not token:
             raise forms.ValidationError(self.error_messages["mfa_required"], code="mfa_required")
 
+        # Reserved before verifying, so parallel guesses cannot all get in
+        # ahead of the lockout.
+        lockout = get_lockout()
+        retry_after = lockout.reserve(user.pk).retry_after()
+        if retry_after:
+            raise forms.ValidationError(
+                self.error_messages["mfa_locked"], code="mfa_locked", params={"seconds": retry_after}
+            )
+
         if not config.verify_token(token):
             raise forms.ValidationError(self.error_messages["invalid_mfa"], code="invalid_mfa")
+        lockout.reset(user.pk)
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+
+FAILURES_KEY = "accounts:mfa-failures:{user_id}"
+LOCKED_KEY = "accounts:mfa-locked:{user_id}"
+
+
+@dataclass(frozen=True)
+class LockoutState:
+    failures: int = 0
+    locked_until: float = 0.0
+
+    def retry_after(self, now: Optional[float] = None) -> int:
+        """Seconds until another code may be tried, 0 if one may be now."""
+
+        remaining = self.locked_until - (time.time() if now is None else now)
+        return math.ceil(remaining) if remaining > 0 else 0
+
+
+class MFALockout:
+    """Per-user count of wrong one-time codes, locking the user out with backoff.
+
+    Every code check is reserved with ``reserve()`` before the code is
+    verified, which counts it with an atomic increment. From the
+    ``threshold``-th check on, a check is only allowed if it can take the
+    user's lock, which it holds for ``backoff`` seconds (doubling with every
+    further check, up to ``max_backoff``), so of parallel guesses past the
+    threshold only one is verified. A correct code releases the lock and
+    forgets the count with ``reset()``; otherwise the count is forgotten
+    ``window`` seconds after the last check.
+
+    The counts are only shared by the workers that use the same cache:
+    ``cache_alias`` should name a shared backend (memcached in production).
+    With the per-process local-memory cache each process counts on its own.
+    """
+
+    def __init__(
+        self,
+        threshold: int = 5,
+        backoff: float = 30.0,
+        max_backoff: float = 3600.0,
+        window: float = 900.0,
+        cache_alias: str = "default",
+    ) -> None:
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.window = window
+        self.cache_alias = cache_alias
+
+    @classmethod
+    def from_settings(cls) -> "MFALockout":
+        return cls(
+            threshold=getattr(settings, "MFA_LOCKOUT_THRESHOLD", 5),
+            backoff=getattr(settings, "MFA_LOCKOUT_BACKOFF", 30),
+            max_backoff=getattr(settings, "MFA_LOCKOUT_MAX_BACKOFF", 3600),
+            window=getattr(settings, "MFA_LOCKOUT_WINDOW", 900),
+            cache_alias=getattr(settings, "MFA_LOCKOUT_CACHE_ALIAS", "default"),
+        )
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def state(self, user_id) -> LockoutState:
+        failures_key, locked_key = FAILURES_KEY.format(user_id=user_id), LOCKED_KEY.format(user_id=user_id)
+        values = self.cache.get_many([failures_key, locked_key])
+        return LockoutState(values.get(failures_key, 0), values.get(locked_key, 0.0))
+
+    def reserve(self, user_id, now: Optional[float] = None) -> LockoutState:
+        """Count a code check for ``user_id``; it is refused if ``retry_after()`` is not 0."""
+
+        now = time.time() if now is None else now
+        failures_key, locked_key = FAILURES_KEY.format(user_id=user_id), LOCKED_KEY.format(user_id=user_id)
+        self.cache.add(failures_key, 0, self.window)
+        try:
+            failures = self.cache.incr(failures_key)
+        except ValueError:
+            # Expired between add() and incr().
+            self.cache.add(failures_key, 0, self.window)
+            failures = self.cache.incr(failures_key)
+        self.cache.touch(failures_key, self.window)
+        if failures < self.threshold:
+            return LockoutState(failures)
+
+        # Locked in advance for as long as a failure of this check would lock
+        # the user; add() lets only one check take the lock at a time.
+        delay = min(self.backoff * 2 ** (failures - self.threshold), self.max_backoff)
+        if self.cache.add(locked_key, now + delay, math.ceil(delay)):
+            return LockoutState(failures)
+
+        # A refused check is not verified, so it does not count.
+        try:
+            self.cache.decr(failures_key)
+        except ValueError:
+            pass
+        # The lock may be about to expire; the check still waits for it.
+        locked_until = max(self.cache.get(locked_key, 0.0), now + 1)
+        return LockoutState(failures - 1, locked_until)
+
+    def reset(self, user_id) -> None:
+        self.cache.delete_many([FAILURES_KEY.format(user_id=user_id), LOCKED_KEY.format(user_id=user_id)])
+
+
+_lockout: Optional[MFALockout] = None
+
+
+def get_lockout() -> MFALockout:
+    global _lockout
+    if _lockout is None:
+        _lockout = MFALockout.from_settings()
+    return _lockout
+
+
+def _reset_lockout(*, setting: str, **kwargs) -> None:
+    global _lockout
+    if setting.startswith("MFA_LOCKOUT_"):
+        _lockout = None
+
+
+setting_changed.connect(_reset_lockout)
@@ -0,0 +1,67 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.totp import TOTPVerifier, generate_base32_secret, get_verifier, totp_at
+
+
+def _verify_per_call(secret, token, valid_window=1, time_step=30):
+    # The previous verify_totp: the secret is decoded and the HMAC keyed for
+    # every counter, and codes are compared with ==.
+    current = int(time.time() // time_step)
+    for offset in range(-valid_window, valid_window + 1):
+        if totp_at(secret, (current + offset) * time_step, time_step=time_step) == token:
+            return True
+    return False
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare TOTP verifications per second of the per-call path (decode the "
+        "secret and key an HMAC for every counter) with the precomputed "
+        "TOTPVerifier, for a wrong token, which checks the whole window."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--window", type=int, default=1, help="Steps accepted on either side.")
+
+    def _time(self, verify, iterations, repeat):
+        rates = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                verify()
+            rates.append(iterations / (time.perf_counter() - started))
+        return statistics.median(rates)
+
+    def _wrong_token(self, secret, window, time_step=30):
+        # Not the code of any counter the window covers now or a couple of
+        # steps on, so every run tries the whole window.
+        now = time.time()
+        codes = {
+            totp_at(secret, now + offset * time_step, time_step=time_step)
+            for offset in range(-window, window + 3)
+        }
+        return next(token for token in ("%06d" % n for n in range(1000000)) if token not in codes)
+
+    def handle(self, *args, **options):
+        secret = generate_base32_secret()
+        window = options["window"]
+        token = self._wrong_token(secret, window)
+        verifier = get_verifier(secret)
+
+        cases = [
+            ("per call", lambda: _verify_per_call(secret, token, window)),
+            ("verifier, cached", lambda: verifier.match(token, valid_window=window)),
+            ("verifier, new", lambda: TOTPVerifier(secret).match(token, valid_window=window)),
+        ]
+        baseline = None
+        for name, verify in cases:
+            rate = self._time(verify, options["iterations"], options["repeat"])
+            baseline = baseline or rate
+            self.stdout.write(
+                f"{name:<18} {rate:10.0f} verifications/s  {1e6 / rate:7.2f} us each  {rate / baseline:5.2f}x"
+            )
@@ -0,0 +1,17 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usermfa',
+            name='last_counter',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
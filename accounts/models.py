@@ -4,9 +4,10 @@ from urllib.parse import quote
 
 from django.conf import settings
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 
-from .totp import generate_base32_secret, verify_totp
+from .totp import generate_base32_secret, get_verifier
 
 
 class UserMFA(models.Model):
@@ -20,6 +21,8 @@ class UserMFA(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     last_verified = models.DateTimeField(null=True, blank=True)
+    # TOTP time step of the last accepted token; it and earlier ones are refused.
+    last_counter = models.BigIntegerField(null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = "Multi-factor authentication"
@@ -40,8 +43,20 @@ class UserMFA(models.Model):
         if not token:
             return False
 
-        if verify_totp(self.secret, token, valid_window=valid_window):
-            self.last_verified = timezone.now()
-            self.save(update_fields=["last_verified"])
-            return True
-        return False
+        counter = get_verifier(self.secret).match(token, valid_window=valid_window, after=self.last_counter)
+        if counter is None:
+            return False
+
+        # Claimed with a conditional update, so a token replayed concurrently
+        # is accepted only once.
+        now = timezone.now()
+        claimed = (
+            UserMFA.objects.filter(pk=self.pk)
+            .filter(Q(last_counter__isnull=True) | Q(last_counter__lt=counter))
+            .update(last_counter=counter, last_verified=now)
+        )
+        if not claimed:
+            return False
+        self.last_counter = counter
+        self.last_verified = now
+        return True
@@ -1,11 +1,17 @@
 from __future__ import annotations
 
-from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import authenticate, get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
+from .forms import MFAAuthenticationForm
+from .lockout import LockoutState, MFALockout
 from .models import UserMFA
-from .totp import totp_at
+from .totp import TOTPVerifier, generate_base32_secret, totp_at, verify_totp
 
 
 class MFAAuthenticationTests(TestCase):
@@ -67,3 +73,153 @@ class MFAAuthenticationTests(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertIn("_auth_user_id", self.client.session)
         self.assertEqual(str(user.pk), self.client.session.get("_auth_user_id"))
+
+
+class TOTPVerifierTests(TestCase):
+    def setUp(self):
+        self.secret = generate_base32_secret()
+        self.verifier = TOTPVerifier(self.secret)
+        self.now = 1_700_000_000.0
+        self.counter = int(self.now // 30)
+
+    def test_codes_match_the_reference_implementation(self):
+        for step in range(-2, 3):
+            timestamp = self.now + step * 30
+            self.assertEqual(
+                self.verifier.code(self.counter + step).decode(), totp_at(self.secret, timestamp)
+            )
+
+    def test_match_returns_the_counter_in_the_window(self):
+        previous = totp_at(self.secret, self.now - 30)
+
+        self.assertEqual(self.verifier.match(previous, timestamp=self.now), self.counter - 1)
+        self.assertIsNone(self.verifier.match(totp_at(self.secret, self.now - 60), timestamp=self.now))
+        self.assertIsNone(self.verifier.match(previous, timestamp=self.now, after=self.counter - 1))
+
+    def test_malformed_tokens_are_rejected(self):
+        for token in ("", "12345", "1234567", "abcdef"):
+            self.assertIsNone(self.verifier.match(token, timestamp=self.now))
+        self.assertTrue(verify_totp(self.secret, " ".join(totp_at(self.secret))))
+
+    def test_comparison_is_constant_time(self):
+        with patch("accounts.totp.hmac.compare_digest", return_value=False) as compare:
+            self.verifier.match("123456", valid_window=2, timestamp=self.now)
+
+        self.assertEqual(compare.call_count, 5)
+
+
+class UserMFAReplayTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username="admin", password="p455w0rd")
+        self.mfa = UserMFA.objects.create(user=user)
+
+    def test_a_token_is_accepted_once(self):
+        now = time.time()
+        token = totp_at(self.mfa.secret, now)
+
+        self.assertTrue(self.mfa.verify_token(token))
+        self.assertFalse(self.mfa.verify_token(token))
+        self.mfa.refresh_from_db()
+        self.assertEqual(self.mfa.last_counter, int(now // 30))
+        self.assertIsNotNone(self.mfa.last_verified)
+
+    def test_replay_through_a_stale_instance_is_refused(self):
+        token = totp_at(self.mfa.secret)
+        stale = UserMFA.objects.get(pk=self.mfa.pk)
+
+        self.assertTrue(self.mfa.verify_token(token))
+        self.assertFalse(stale.verify_token(token))
+
+    def test_earlier_tokens_are_refused_after_a_later_one(self):
+        now = time.time()
+        self.assertTrue(self.mfa.verify_token(totp_at(self.mfa.secret, now)))
+
+        self.assertFalse(self.mfa.verify_token(totp_at(self.mfa.secret, now - 30)))
+
+
+@override_settings(MFA_LOCKOUT_THRESHOLD=3, MFA_LOCKOUT_BACKOFF=30)
+class MFALoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username="admin", password="p455w0rd", is_staff=True
+        )
+        self.mfa = UserMFA.objects.create(user=self.user)
+
+    def _form(self, token):
+        form = MFAAuthenticationForm(
+            data={"username": "admin", "password": "p455w0rd", "token": token}
+        )
+        form.is_valid()
+        return form
+
+    def _wrong(self):
+        return "%06d" % ((int(totp_at(self.mfa.secret)) + 500000) % 1000000)
+
+    def test_backend_loads_the_mfa_configuration_with_the_user(self):
+        with self.assertNumQueries(1):
+            user = authenticate(username="admin", password="p455w0rd")
+            self.assertEqual(user.mfa_config, self.mfa)
+
+    def test_backend_handles_users_without_mfa(self):
+        get_user_model().objects.create_user(username="other", password="p455w0rd")
+        with self.assertNumQueries(1):
+            user = authenticate(username="other", password="p455w0rd")
+            with self.assertRaises(UserMFA.DoesNotExist):
+                user.mfa_config
+
+    def test_correct_code_costs_one_update(self):
+        with self.assertNumQueries(2):
+            form = self._form(totp_at(self.mfa.secret))
+
+        self.assertTrue(form.is_valid())
+
+    def test_repeated_wrong_codes_lock_the_user_out_before_verifying(self):
+        for _ in range(3):
+            errors = self._form(self._wrong()).errors["__all__"]
+            self.assertEqual(errors, [MFAAuthenticationForm.error_messages["invalid_mfa"]])
+
+        with patch.object(UserMFA, "verify_token") as verify, self.assertNumQueries(1):
+            form = self._form(totp_at(self.mfa.secret))
+
+        verify.assert_not_called()
+        self.assertIn("Try again in 30 seconds", form.errors["__all__"][0])
+
+    def test_correct_code_clears_earlier_failures(self):
+        self._form(self._wrong())
+        self._form(self._wrong())
+        self.assertTrue(self._form(totp_at(self.mfa.secret)).is_valid())
+
+        self.assertEqual(MFALockout.from_settings().state(self.user.pk).failures, 0)
+
+
+class MFALockoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.lockout = MFALockout(threshold=2, backoff=10, max_backoff=25)
+
+    def test_backoff_doubles_up_to_the_maximum(self):
+        delays = []
+        with patch("time.time", return_value=1000.0) as clock:
+            for _ in range(5):
+                self.assertEqual(self.lockout.reserve(1).retry_after(), 0)
+                delays.append(self.lockout.state(1).retry_after())
+                clock.return_value += delays[-1]
+            failures = self.lockout.state(1).failures
+
+        self.assertEqual(delays, [0, 10, 20, 25, 25])
+        self.assertEqual(failures, 5)
+        self.assertEqual(self.lockout.state(2).failures, 0)
+
+    def test_only_one_check_past_the_threshold_is_let_through(self):
+        allowed = [self.lockout.reserve(1, now=1000.0).retry_after(1000.0) for _ in range(4)]
+
+        self.assertEqual(allowed, [0, 0, 10, 10])
+        self.assertEqual(self.lockout.state(1).failures, 2)
+
+    def test_reset_forgets_failures(self):
+        self.lockout.reserve(1)
+        self.lockout.reserve(1)
+        self.lockout.reset(1)
+
+        self.assertEqual(self.lockout.state(1), LockoutState())
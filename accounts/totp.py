@@ -6,6 +6,7 @@ import hmac
 import secrets
 import struct
 import time
+from functools import lru_cache
 from typing import Optional
 
 
@@ -40,17 +41,64 @@ def totp_at(secret: str, timestamp: Optional[float] = None, *, digits: int = 6,
     return str(token).zfill(digits)
 
 
+def _clean_token(token: str) -> str:
+    return (token or "").strip().replace(" ", "")
+
+
+class TOTPVerifier:
+    """Checks tokens for one secret, decoding it and keying the HMAC only once.
+
+    Each code is computed from a ``copy()`` of the keyed HMAC, every counter of
+    the window is compared in constant time, and ``match`` returns the counter
+    that matched so callers can refuse it, and anything older, next time.
+    """
+
+    def __init__(self, secret: str, *, digits: int = 6, time_step: int = 30) -> None:
+        self.digits = digits
+        self.time_step = time_step
+        self._mac = hmac.new(_normalize_base32(secret), digestmod=hashlib.sha1)
+        self._modulus = 10 ** digits
+
+    def code(self, counter: int) -> bytes:
+        mac = self._mac.copy()
+        mac.update(struct.pack(">Q", counter))
+        digest = mac.digest()
+        offset = digest[-1] & 0x0F
+        truncated = struct.unpack(">I", digest[offset : offset + 4])[0] & 0x7FFFFFFF
+        return b"%0*d" % (self.digits, truncated % self._modulus)
+
+    def match(
+        self,
+        token: str,
+        *,
+        valid_window: int = 1,
+        timestamp: Optional[float] = None,
+        after: Optional[int] = None,
+    ) -> Optional[int]:
+        """Return the counter within ``valid_window`` steps whose code is ``token``, if any.
+
+        Counters up to ``after`` are not accepted.
+        """
+
+        token = _clean_token(token)
+        if len(token) != self.digits or not token.isdigit():
+            return None
+        candidate = token.encode()
+        current = _totp_counter(timestamp, time_step=self.time_step)
+        matched = None
+        # Every counter is computed and compared, so the timing does not
+        # reveal which one matched.
+        for counter in range(current - valid_window, current + valid_window + 1):
+            if hmac.compare_digest(self.code(counter), candidate) and (after is None or counter > after):
+                matched = counter
+        return matched
+
+
+@lru_cache(maxsize=256)
+def get_verifier(secret: str, digits: int = 6, time_step: int = 30) -> TOTPVerifier:
+    return TOTPVerifier(secret, digits=digits, time_step=time_step)
+
+
 def verify_totp(secret: str, token: str, *, valid_window: int = 1, digits: int = 6, time_step: int = 30) -> bool:
-    if not token:
-        return False
-
-    token = token.strip().replace(" ", "")
-    if not token.isdigit():
-        return False
-
-    current_counter = _totp_counter(time_step=time_step)
-    for offset in range(-valid_window, valid_window + 1):
-        counter_time = (current_counter + offset) * time_step
-        if totp_at(secret, counter_time, digits=digits, time_step=time_step) == token:
-            return True
-    return False
+    verifier = get_verifier(secret, digits, time_step)
+    return verifier.match(token, valid_window=valid_window) is not None
@@ -1,12 +1,33 @@
+import csv
+import ipaddress
+import json
+
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.utils.html import format_html
-from django.utils.translation import ugettext_lazy as _
+from django.utils.translation import gettext_lazy as _
+
+from admin_honeypot import aggregates
+from admin_honeypot.models import AttackerStat, LoginAttempt
+
 
-from admin_honeypot.models import LoginAttempt
+# Spreadsheets evaluate cells starting with these as formulas.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def csv_cell(value):
+    # Usernames and paths are whatever the attackers sent.
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
 
 
 class LoginAttemptAdmin(admin.ModelAdmin):
-    list_display = ('username', 'password','get_ip_address', 'get_session_key', 'timestamp', 'get_path')
+    list_display = ('username', 'password','get_ip_address', 'get_session_key', 'timestamp', 'attempts', 'get_path')
     list_filter = ('timestamp',)
     readonly_fields = ('ip_address', 'username', 'password', 'path', 'session_key', 'user_agent')
     search_fields = ('username', 'ip_address', 'user_agent', 'path')
@@ -17,6 +38,13 @@ class LoginAttemptAdmin(admin.ModelAdmin):
             del actions['delete_selected']
         return actions
 
+    def get_search_results(self, request, queryset, search_term):
+        # Addresses use the ip_address index rather than a LIKE scan.
+        try:
+            ip_address = str(ipaddress.ip_address(search_term.strip()))
+        except ValueError:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(ip_address=ip_address), False
 
 
     def get_session_key(self, instance):
@@ -41,3 +69,95 @@ class LoginAttemptAdmin(admin.ModelAdmin):
         return False
 
 admin.site.register(LoginAttempt, LoginAttemptAdmin)
+
+
+class AttackerStatAdmin(admin.ModelAdmin):
+    """Top attackers and their CSV/JSON export, read from the aggregates only."""
+
+    limit = 20
+    export_chunk_size = 500
+    export_fields = ('kind', 'value', 'attempts', 'first_seen', 'last_seen', 'top_paths')
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('export/', self.admin_site.admin_view(self.export_view), name='%s_%s_export' % info),
+        ] + super().get_urls()
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        sections = [
+            (label, kind, aggregates.top(kind, self.limit))
+            for kind, label in AttackerStat.KIND_CHOICES
+        ]
+        context = {
+            **self.admin_site.each_context(request),
+            'title': _('Attacker summary'),
+            'opts': self.model._meta,
+            'limit': self.limit,
+            'sections': sections,
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/admin_honeypot/attackerstat/summary.html', context)
+
+    def _export_rows(self, kinds):
+        for kind in kinds:
+            queryset = AttackerStat.objects.filter(kind=kind).order_by('-attempts', 'value')
+            chunk = []
+            for stat in queryset.iterator(self.export_chunk_size):
+                chunk.append(stat)
+                if len(chunk) == self.export_chunk_size:
+                    yield from aggregates.with_top_paths(kind, chunk)
+                    chunk = []
+            yield from aggregates.with_top_paths(kind, chunk)
+
+    def export_view(self, request):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        kinds = [kind for kind, _label in AttackerStat.KIND_CHOICES]
+        kind = request.GET.get('kind')
+        if kind:
+            if kind not in kinds:
+                return HttpResponseBadRequest('Unknown kind')
+            kinds = [kind]
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in ('csv', 'json'):
+            return HttpResponseBadRequest('Unknown format')
+
+        filename = 'attackers-{0}.{1}'.format(kind or 'all', export_format)
+        if export_format == 'json':
+            rows = [
+                {
+                    'kind': stat.kind,
+                    'value': stat.value,
+                    'attempts': stat.attempts,
+                    'first_seen': stat.first_seen,
+                    'last_seen': stat.last_seen,
+                    'top_paths': [{'path': p, 'attempts': n} for p, n in stat.top_paths],
+                }
+                for stat in self._export_rows(kinds)
+            ]
+            response = HttpResponse(json.dumps(rows, cls=DjangoJSONEncoder), content_type='application/json')
+        else:
+            response = HttpResponse(content_type='text/csv; charset=utf-8')
+            writer = csv.writer(response)
+            writer.writerow(self.export_fields)
+            for stat in self._export_rows(kinds):
+                writer.writerow([csv_cell(cell) for cell in (
+                    stat.kind, stat.value, stat.attempts, stat.first_seen.isoformat(), stat.last_seen.isoformat(),
+                    '; '.join('{0} ({1})'.format(p, n) for p, n in stat.top_paths),
+                )])
+        response['Content-Disposition'] = 'attachment; filename="{0}"'.format(filename)
+        return response
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+admin.site.register(AttackerStat, AttackerStatAdmin)
@@ -0,0 +1,164 @@
+"""Per-attacker totals of the honeypot login attempts.
+
+Every stored attempt is added to an ``AttackerStat`` row for its address, its
+subnet (/24 for IPv4, /64 for IPv6), its username and its path, holding the
+number of attempts and the first and last time they were seen, and to an
+``AttackerPath`` row per address, subnet and username counting the paths
+they targeted. The recorders in ``ingest`` update them in the transaction
+that stores the attempts, so the admin summary and the exports read a few
+rows instead of scanning ``LoginAttempt``.
+
+The totals outlive the retention of the raw rows. ``manage.py
+rebuild_honeypot_aggregates`` recomputes them from whatever rows remain.
+"""
+
+import ipaddress
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from admin_honeypot.models import AttackerPath, AttackerStat
+
+
+SUBNET_PREFIXES = {4: 24, 6: 64}
+# Values longer than the columns are cut to fit.
+MAX_VALUE_LENGTH = 255
+# Paths listed per address, subnet or username in the summary and exports.
+TOP_PATHS = 3
+
+
+def subnet_of(address):
+    return str(ipaddress.ip_network('{0}/{1}'.format(address, SUBNET_PREFIXES[address.version]), strict=False))
+
+
+def _keys(attempt):
+    path = (attempt.path or '')[:MAX_VALUE_LENGTH]
+    keys = [(AttackerStat.USERNAME, (attempt.username or '')[:MAX_VALUE_LENGTH])]
+    try:
+        # The form LoginAttempt stores, whether or not the attempt was reloaded.
+        address = ipaddress.ip_address(attempt.ip_address or '')
+    except ValueError:
+        return keys, path
+    keys += [(AttackerStat.IP, str(address)), (AttackerStat.SUBNET, subnet_of(address))]
+    return keys, path
+
+
+def accumulate(attempts):
+    """Sum ``attempts`` into ``(stats, paths)`` dictionaries keyed like the tables."""
+
+    stats = {}
+    paths = defaultdict(int)
+    now = timezone.now()
+    for attempt in attempts:
+        count = getattr(attempt, 'attempts', 1) or 1
+        seen = attempt.timestamp or now
+        keys, path = _keys(attempt)
+        for key in keys + [(AttackerStat.PATH, path)]:
+            total, first, last = stats.get(key, (0, seen, seen))
+            stats[key] = (total + count, min(first, seen), max(last, seen))
+        for kind, value in keys:
+            paths[(kind, value, path)] += count
+    return stats, paths
+
+
+def _increment(model, lookup, count, update=None, create=None):
+    queryset = model.objects.filter(**lookup)
+    if queryset.update(attempts=F('attempts') + count, **(update or {})):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(attempts=count, **lookup, **(create or {}))
+    except IntegrityError:
+        # Created by another writer since the update.
+        queryset.update(attempts=F('attempts') + count, **(update or {}))
+
+
+def record(attempts):
+    """Add stored ``attempts`` to the totals."""
+
+    stats, paths = accumulate(attempts)
+    with transaction.atomic():
+        # A fixed order, so concurrent writers lock rows in the same sequence.
+        for (kind, value), (count, first, last) in sorted(stats.items()):
+            _increment(
+                AttackerStat,
+                {'kind': kind, 'value': value},
+                count,
+                update={'first_seen': Least(F('first_seen'), first), 'last_seen': Greatest(F('last_seen'), last)},
+                create={'first_seen': first, 'last_seen': last},
+            )
+        for (kind, value, path), count in sorted(paths.items()):
+            _increment(AttackerPath, {'kind': kind, 'value': value, 'path': path}, count)
+
+
+def rebuild(queryset, chunk_size=5000):
+    """Replace the totals with those of the rows in ``queryset``; return the rows read."""
+
+    stats, paths = {}, defaultdict(int)
+    rows = 0
+    chunk = []
+    for attempt in queryset.only('ip_address', 'username', 'path', 'timestamp', 'attempts').iterator(chunk_size):
+        chunk.append(attempt)
+        if len(chunk) >= chunk_size:
+            rows += _merge(chunk, stats, paths)
+            chunk = []
+    rows += _merge(chunk, stats, paths)
+
+    with transaction.atomic():
+        AttackerStat.objects.all().delete()
+        AttackerPath.objects.all().delete()
+        AttackerStat.objects.bulk_create(
+            (
+                AttackerStat(kind=kind, value=value, attempts=count, first_seen=first, last_seen=last)
+                for (kind, value), (count, first, last) in stats.items()
+            ),
+            batch_size=chunk_size,
+        )
+        AttackerPath.objects.bulk_create(
+            (
+                AttackerPath(kind=kind, value=value, path=path, attempts=count)
+                for (kind, value, path), count in paths.items()
+            ),
+            batch_size=chunk_size,
+        )
+    return rows
+
+
+def _merge(chunk, stats, paths):
+    chunk_stats, chunk_paths = accumulate(chunk)
+    for key, (count, first, last) in chunk_stats.items():
+        total, seen_first, seen_last = stats.get(key, (0, first, last))
+        stats[key] = (total + count, min(first, seen_first), max(last, seen_last))
+    for key, count in chunk_paths.items():
+        paths[key] += count
+    return len(chunk)
+
+
+def top(kind, limit=20):
+    """The ``limit`` biggest ``AttackerStat`` rows of ``kind``, each with its ``top_paths``."""
+
+    stats = list(AttackerStat.objects.filter(kind=kind).order_by('-attempts', 'value')[:limit])
+    return with_top_paths(kind, stats)
+
+
+def with_top_paths(kind, stats):
+    """Set ``top_paths``, a list of ``(path, attempts)``, on each of ``stats``, in one query."""
+
+    by_value = {stat.value: stat for stat in stats}
+    for stat in stats:
+        stat.top_paths = []
+    if kind == AttackerStat.PATH or not by_value:
+        return stats
+    rows = (
+        AttackerPath.objects.filter(kind=kind, value__in=list(by_value))
+        .order_by('value', '-attempts', 'path')
+        .values_list('value', 'path', 'attempts')
+    )
+    for value, path, attempts in rows:
+        listed = by_value[value].top_paths
+        if len(listed) < TOP_PATHS:
+            listed.append((path, attempts))
+    return stats
@@ -0,0 +1,282 @@
+"""Digested, rate-capped delivery of honeypot alerts off the request thread.
+
+``notify_admins`` only queues an ``Attempt``. A daemon worker groups the
+attempts of each address into a ``Digest`` that stays open for
+``ADMIN_HONEYPOT_ALERT_WINDOW`` seconds after its first attempt and is then
+mailed to the admins as one email. At most ``ADMIN_HONEYPOT_ALERT_MAX_PER_HOUR``
+emails are sent per hour; the attempts of digests over that cap are counted and
+reported in the next email instead. A failed delivery is retried up to
+``ADMIN_HONEYPOT_ALERT_RETRIES`` times, waiting ``ADMIN_HONEYPOT_ALERT_RETRY_DELAY``
+seconds and doubling the wait after each failure.
+"""
+
+import atexit
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.mail import mail_admins
+from django.core.signals import setting_changed
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+
+log = logging.getLogger(__name__)
+
+# Attempts listed in a digest email; the rest are only counted.
+MAX_LISTED = 20
+
+
+@dataclass(frozen=True)
+class Attempt:
+    ip_address: Optional[str]
+    username: Optional[str]
+    path: Optional[str]
+    user_agent: Optional[str]
+    timestamp: datetime
+    host: str
+
+    @classmethod
+    def from_request(cls, instance, request):
+        return cls(
+            ip_address=instance.ip_address,
+            username=instance.username,
+            path=instance.path,
+            user_agent=instance.user_agent,
+            timestamp=instance.timestamp or timezone.now(),
+            host=request.get_host(),
+        )
+
+
+@dataclass
+class Digest:
+    ip_address: Optional[str]
+    host: str
+    opened: float
+    attempts: List[Attempt] = field(default_factory=list)
+    count: int = 0
+    usernames: Counter = field(default_factory=Counter)
+    paths: Counter = field(default_factory=Counter)
+    suppressed: int = 0
+    tries: int = 0
+    # Kept apart from the attempts, which stop being listed after MAX_LISTED.
+    last_seen: Optional[datetime] = None
+
+    def add(self, attempt):
+        self.count += 1
+        if self.last_seen is None or attempt.timestamp > self.last_seen:
+            self.last_seen = attempt.timestamp
+        self.usernames[attempt.username or ''] += 1
+        self.paths[attempt.path or ''] += 1
+        if len(self.attempts) < MAX_LISTED:
+            self.attempts.append(attempt)
+
+    # Templates look Counter attributes up as keys, which default to 0.
+    @property
+    def top_usernames(self):
+        return self.usernames.most_common()
+
+    @property
+    def top_paths(self):
+        return self.paths.most_common()
+
+    @property
+    def first_seen(self):
+        return self.attempts[0].timestamp
+
+    def admin_url(self):
+        path = reverse('admin:admin_honeypot_loginattempt_changelist')
+        if self.ip_address:
+            path += '?' + urlencode({'q': self.ip_address})
+        return 'http://{0}{1}'.format(self.host, path)
+
+
+class AlertDispatcher:
+    def __init__(
+        self,
+        window=300.0,
+        max_per_hour=12,
+        retries=3,
+        retry_delay=30.0,
+        max_queue_size=10000,
+        poll_interval=1.0,
+        autostart=True,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.window = window
+        self.max_per_hour = max_per_hour
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.autostart = autostart
+        self.clock = clock
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.suppressed = 0
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._open: Dict[Optional[str], Digest] = {}
+        self._retries: List[Tuple[float, int, Digest]] = []
+        self._order = itertools.count()
+        self._sent_at: Deque[float] = deque()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._state_lock = threading.RLock()
+        self._atexit_registered = False
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            window=getattr(settings, 'ADMIN_HONEYPOT_ALERT_WINDOW', 300),
+            max_per_hour=getattr(settings, 'ADMIN_HONEYPOT_ALERT_MAX_PER_HOUR', 12),
+            retries=getattr(settings, 'ADMIN_HONEYPOT_ALERT_RETRIES', 3),
+            retry_delay=getattr(settings, 'ADMIN_HONEYPOT_ALERT_RETRY_DELAY', 30),
+        )
+
+    @property
+    def pending(self):
+        return self._queue.qsize() + sum(digest.count for digest in self._open.values()) + len(self._retries)
+
+    def enqueue(self, attempt):
+        if self.autostart:
+            self.start()
+        try:
+            self._queue.put_nowait(attempt)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def start(self):
+        """Start the background worker if it is not already running."""
+
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._stop.clear()
+            self._worker = threading.Thread(target=self._run, name='honeypot-alerts', daemon=True)
+            self._worker.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def stop(self, timeout=5.0):
+        """Stop the worker and send every open digest once."""
+
+        self._stop.set()
+        worker = self._worker
+        if worker is not None and worker is not threading.current_thread():
+            worker.join(timeout)
+        self._worker = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                attempt = self._queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                pass
+            else:
+                with self._state_lock:
+                    self._collect(attempt, self.clock())
+            self.process()
+
+    def _collect(self, attempt, now):
+        digest = self._open.get(attempt.ip_address)
+        if digest is None:
+            digest = self._open[attempt.ip_address] = Digest(attempt.ip_address, attempt.host, opened=now)
+        digest.add(attempt)
+
+    def process(self, now=None):
+        """Group the queued attempts, then send the digests and retries that are due."""
+
+        now = self.clock() if now is None else now
+        with self._state_lock:
+            while True:
+                try:
+                    attempt = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._collect(attempt, now)
+            for ip_address, digest in list(self._open.items()):
+                if now - digest.opened >= self.window:
+                    del self._open[ip_address]
+                    self._deliver(digest, now)
+            while self._retries and self._retries[0][0] <= now:
+                _, _, digest = heapq.heappop(self._retries)
+                self._deliver(digest, now)
+
+    def flush(self):
+        """Send every queued attempt and open digest now, without retrying failures."""
+
+        with self._state_lock:
+            self.process()
+            digests = list(self._open.values()) + [digest for _, _, digest in self._retries]
+            self._open.clear()
+            self._retries.clear()
+            for digest in digests:
+                digest.tries = self.retries
+                self._deliver(digest, self.clock())
+
+    def _deliver(self, digest, now):
+        while self._sent_at and now - self._sent_at[0] >= 3600:
+            self._sent_at.popleft()
+        if len(self._sent_at) >= self.max_per_hour:
+            self.suppressed += digest.count
+            return
+
+        digest.suppressed, self.suppressed = self.suppressed, 0
+        context = {'digest': digest, 'admin_url': digest.admin_url()}
+        try:
+            subject = render_to_string('admin_honeypot/email_subject.txt', context).strip()
+            message = render_to_string('admin_honeypot/email_message.txt', context).strip()
+            mail_admins(subject=subject, message=message)
+        except Exception:
+            self.suppressed += digest.suppressed
+            digest.tries += 1
+            if digest.tries > self.retries:
+                self.failed += 1
+                log.exception('Giving up on a honeypot alert for %s after %d tries', digest.ip_address, digest.tries)
+            else:
+                log.warning('Failed to send a honeypot alert for %s, retrying', digest.ip_address, exc_info=True)
+                retry_at = now + self.retry_delay * 2 ** (digest.tries - 1)
+                heapq.heappush(self._retries, (retry_at, next(self._order), digest))
+            return
+        self._sent_at.append(now)
+        self.sent += 1
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = AlertDispatcher.from_settings()
+    return _dispatcher
+
+
+def _reset_dispatcher(*, setting, **kwargs):
+    global _dispatcher
+    if setting.startswith('ADMIN_HONEYPOT_ALERT_') and _dispatcher is not None:
+        _dispatcher.stop()
+        _dispatcher = None
+
+
+setting_changed.connect(_reset_dispatcher)
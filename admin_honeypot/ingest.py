@@ -0,0 +1,188 @@
+"""How honeypot login attempts reach the database.
+
+``AttemptRecorder`` saves every attempt on the request thread.
+``BufferedAttemptRecorder`` keeps them in memory instead and a daemon worker
+writes them with one ``bulk_create`` every ``flush_interval`` seconds, or as
+soon as ``batch_size`` distinct attempts are waiting; a batch that fails to
+write is kept for the next flush. Attempts with the same
+address, username and path that arrive before a flush are stored as one row
+whose ``attempts`` column counts them, so a brute-force burst costs a handful
+of inserts and the honeypot answers without waiting for the database.
+
+Both add the stored attempts to the per-attacker totals of ``aggregates`` in
+the same transaction, unless ``ADMIN_HONEYPOT_AGGREGATES`` is off.
+``ADMIN_HONEYPOT_RECORDER`` names the class and ``ADMIN_HONEYPOT_RECORDER_OPTIONS``
+its keyword arguments.
+"""
+
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+from admin_honeypot import aggregates
+from admin_honeypot.models import LoginAttempt
+
+
+log = logging.getLogger(__name__)
+
+
+def _store_aggregates():
+    return getattr(settings, 'ADMIN_HONEYPOT_AGGREGATES', True)
+
+
+class AttemptRecorder:
+    def record(self, instance):
+        with transaction.atomic():
+            instance.save()
+            if _store_aggregates():
+                aggregates.record([instance])
+
+    def flush(self):
+        return 0
+
+    def stop(self):
+        pass
+
+
+class BufferedAttemptRecorder(AttemptRecorder):
+    def __init__(self, batch_size=500, flush_interval=1.0, max_pending=10000, autostart=True):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.autostart = autostart
+        self.dropped = 0
+        self.written = 0
+
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._full = threading.Event()
+        self._stop = threading.Event()
+        self._worker = None
+        self._atexit_registered = False
+
+    @property
+    def pending(self):
+        with self._lock:
+            return sum(instance.attempts for instance in self._pending.values())
+
+    @staticmethod
+    def _key(instance):
+        return (instance.ip_address, instance.username, instance.path)
+
+    def record(self, instance):
+        if self.autostart:
+            self.start()
+        key = self._key(instance)
+        with self._lock:
+            queued = self._pending.get(key)
+            if queued is not None:
+                queued.attempts += 1
+                return
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending[key] = instance
+            if len(self._pending) >= self.batch_size:
+                self._full.set()
+
+    def start(self):
+        """Start the background worker if it is not already running."""
+
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._stop.clear()
+            self._worker = threading.Thread(target=self._run, name='honeypot-ingest', daemon=True)
+            self._worker.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def stop(self, timeout=5.0):
+        """Stop the worker and write everything still buffered."""
+
+        self._stop.set()
+        self._full.set()
+        worker = self._worker
+        if worker is not None and worker is not threading.current_thread():
+            worker.join(timeout)
+        self._worker = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._full.wait(self.flush_interval)
+            self._full.clear()
+            close_old_connections()
+            self.flush()
+        close_old_connections()
+
+    def flush(self):
+        """Write the buffered attempts on the calling thread; return how many rows were inserted."""
+
+        with self._lock:
+            batch, self._pending = list(self._pending.values()), {}
+        if not batch:
+            return 0
+        try:
+            with transaction.atomic():
+                LoginAttempt.objects.bulk_create(batch, batch_size=self.batch_size)
+                if _store_aggregates():
+                    aggregates.record(batch)
+        except Exception:
+            log.exception('Failed to store %d buffered login attempts, retrying', len(batch))
+            self._requeue(batch)
+            return 0
+        self.written += len(batch)
+        return len(batch)
+
+    def _requeue(self, batch):
+        """Put a batch that failed to write back in front of the attempts buffered since."""
+
+        for instance in batch:
+            # bulk_create may have assigned keys that the rollback discarded.
+            instance.pk = None
+            instance._state.adding = True
+        with self._lock:
+            merged = {self._key(instance): instance for instance in batch}
+            for key, queued in self._pending.items():
+                if key in merged:
+                    merged[key].attempts += queued.attempts
+                elif len(merged) < self.max_pending:
+                    merged[key] = queued
+                else:
+                    self.dropped += queued.attempts
+            self._pending = merged
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder():
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                recorder_class = import_string(
+                    getattr(settings, 'ADMIN_HONEYPOT_RECORDER', 'admin_honeypot.ingest.AttemptRecorder')
+                )
+                _recorder = recorder_class(**getattr(settings, 'ADMIN_HONEYPOT_RECORDER_OPTIONS', {}))
+    return _recorder
+
+
+def _reset_recorder(*, setting, **kwargs):
+    global _recorder
+    if setting.startswith('ADMIN_HONEYPOT_RECORDER') and _recorder is not None:
+        _recorder.stop()
+        _recorder = None
+
+
+setting_changed.connect(_reset_recorder)
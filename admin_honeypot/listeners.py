@@ -1,21 +1,11 @@
 from django.conf import settings
-from django.core.mail import mail_admins
-from django.template.loader import render_to_string
-from django.urls import reverse
+from admin_honeypot.alerts import Attempt, get_dispatcher
 from admin_honeypot.signals import honeypot
 
 
 def notify_admins(instance, request, **kwargs):
-    path = reverse('admin:admin_honeypot_loginattempt_change', args=(instance.pk,))
-    admin_detail_url = 'http://{0}{1}'.format(request.get_host(), path)
-    context = {
-        'request': request,
-        'instance': instance,
-        'admin_detail_url': admin_detail_url,
-    }
-    subject = render_to_string('admin_honeypot/email_subject.txt', context).strip()
-    message = render_to_string('admin_honeypot/email_message.txt', context).strip()
-    mail_admins(subject=subject, message=message)
+    # Mailed in a per-address digest by a background worker; see alerts.py.
+    get_dispatcher().enqueue(Attempt.from_request(instance, request))
 
 if getattr(settings, 'ADMIN_HONEYPOT_EMAIL_ADMINS', True):
     honeypot.connect(notify_admins)
@@ -0,0 +1,20 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_honeypot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loginattempt',
+            index=models.Index(fields=['timestamp'], name='loginattempt_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loginattempt',
+            index=models.Index(fields=['ip_address'], name='loginattempt_ip_address_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_honeypot', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loginattempt',
+            name='attempts',
+            field=models.PositiveIntegerField(default=1, verbose_name='attempts'),
+        ),
+    ]
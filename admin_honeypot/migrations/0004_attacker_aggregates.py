@@ -0,0 +1,44 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_honeypot', '0003_loginattempt_attempts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttackerStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('ip', 'IP address'), ('subnet', 'subnet'), ('username', 'username'), ('path', 'path')], max_length=10, verbose_name='kind')),
+                ('value', models.CharField(max_length=255, verbose_name='value')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('first_seen', models.DateTimeField(verbose_name='first seen')),
+                ('last_seen', models.DateTimeField(verbose_name='last seen')),
+            ],
+            options={
+                'verbose_name': 'attacker summary',
+                'verbose_name_plural': 'attacker summary',
+                'indexes': [models.Index(fields=['kind', '-attempts'], name='attackerstat_top_idx')],
+                'unique_together': {('kind', 'value')},
+            },
+        ),
+        migrations.CreateModel(
+            name='AttackerPath',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('ip', 'IP address'), ('subnet', 'subnet'), ('username', 'username'), ('path', 'path')], max_length=10, verbose_name='kind')),
+                ('value', models.CharField(max_length=255, verbose_name='value')),
+                ('path', models.CharField(max_length=255, verbose_name='path')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+            ],
+            options={
+                'verbose_name': 'attacker path',
+                'verbose_name_plural': 'attacker paths',
+                'unique_together': {('kind', 'value', 'path')},
+            },
+        ),
+    ]
@@ -1,5 +1,5 @@
 from django.db import models
-from django.utils.translation import ugettext_lazy as _
+from django.utils.translation import gettext_lazy as _
 from admin_honeypot import listeners
 
 
@@ -11,11 +11,66 @@ class LoginAttempt(models.Model):
     user_agent = models.TextField(_("user-agent"), blank=True, null=True)
     timestamp = models.DateTimeField(_("timestamp"), auto_now_add=True)
     path = models.TextField(_("path"), blank=True, null=True)
+    # Identical attempts buffered together are stored as one row.
+    attempts = models.PositiveIntegerField(_("attempts"), default=1)
 
     class Meta:
         verbose_name = _("login attempt")
         verbose_name_plural = _("login attempts")
         ordering = ('timestamp',)
+        indexes = [
+            models.Index(fields=['timestamp'], name='loginattempt_timestamp_idx'),
+            models.Index(fields=['ip_address'], name='loginattempt_ip_address_idx'),
+        ]
 
     def __str__(self):
         return self.username
+
+
+class AttackerStat(models.Model):
+    """Running totals of the login attempts per address, subnet, username and path."""
+
+    IP = 'ip'
+    SUBNET = 'subnet'
+    USERNAME = 'username'
+    PATH = 'path'
+    KIND_CHOICES = [
+        (IP, _("IP address")),
+        (SUBNET, _("subnet")),
+        (USERNAME, _("username")),
+        (PATH, _("path")),
+    ]
+
+    kind = models.CharField(_("kind"), max_length=10, choices=KIND_CHOICES)
+    value = models.CharField(_("value"), max_length=255)
+    attempts = models.PositiveIntegerField(_("attempts"), default=0)
+    first_seen = models.DateTimeField(_("first seen"))
+    last_seen = models.DateTimeField(_("last seen"))
+
+    class Meta:
+        verbose_name = _("attacker summary")
+        verbose_name_plural = _("attacker summary")
+        unique_together = [('kind', 'value')]
+        indexes = [
+            models.Index(fields=['kind', '-attempts'], name='attackerstat_top_idx'),
+        ]
+
+    def __str__(self):
+        return '{0} {1}: {2}'.format(self.kind, self.value, self.attempts)
+
+
+class AttackerPath(models.Model):
+    """Attempts per path of each address, subnet and username in ``AttackerStat``."""
+
+    kind = models.CharField(_("kind"), max_length=10, choices=AttackerStat.KIND_CHOICES)
+    value = models.CharField(_("value"), max_length=255)
+    path = models.CharField(_("path"), max_length=255)
+    attempts = models.PositiveIntegerField(_("attempts"), default=0)
+
+    class Meta:
+        verbose_name = _("attacker path")
+        verbose_name_plural = _("attacker paths")
+        unique_together = [('kind', 'value', 'path')]
+
+    def __str__(self):
+        return '{0} {1} {2}: {3}'.format(self.kind, self.value, self.path, self.attempts)
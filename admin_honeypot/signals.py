@@ -1,3 +1,4 @@
 from django.dispatch import Signal
 
-honeypot = Signal(providing_args=['instance', 'request'])
+# Sent with instance and request.
+honeypot = Signal()
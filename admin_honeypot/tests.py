@@ -0,0 +1,461 @@
+from __future__ import annotations
+
+import csv
+import json
+import socketserver
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .alerts import MAX_LISTED, AlertDispatcher, Attempt
+from . import aggregates
+from .ingest import AttemptRecorder, BufferedAttemptRecorder, get_recorder
+from .listeners import notify_admins
+from .models import AttackerPath, AttackerStat, LoginAttempt
+
+
+ADMINS = [("Admin", "admin@example.com")]
+
+
+def _attempt(ip_address="203.0.113.9", username="admin", path="/admin/login/", seconds=0):
+    return Attempt(
+        ip_address=ip_address,
+        username=username,
+        path=path,
+        user_agent="curl/8.0",
+        timestamp=timezone.now() + timedelta(seconds=seconds),
+        host="example.com",
+    )
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        self.reply("220 stub")
+        while True:
+            line = self.rfile.readline().decode()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in ("EHLO", "HELO"):
+                self.reply("250 stub")
+            elif command == "MAIL":
+                if server.failures:
+                    server.failures -= 1
+                    self.reply("451 try again later")
+                else:
+                    self.reply("250 ok")
+            elif command == "RCPT":
+                self.reply("250 ok")
+            elif command == "DATA":
+                self.reply("354 go ahead")
+                lines = []
+                while True:
+                    data = self.rfile.readline().decode()
+                    if data in (".\r\n", ""):
+                        break
+                    lines.append(data)
+                server.messages.append("".join(lines))
+                self.reply("250 queued")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+class _SMTPStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, failures=0):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.failures = failures
+        self.messages = []
+
+
+@override_settings(ADMINS=ADMINS)
+class AlertDispatcherTests(TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        self.dispatcher = AlertDispatcher(
+            window=60, max_per_hour=2, retries=2, retry_delay=10, autostart=False, clock=self.clock
+        )
+
+    def test_attempts_are_digested_per_address_and_window(self):
+        for n in range(3):
+            self.dispatcher.enqueue(_attempt(username=f"user{n}", seconds=n))
+        self.dispatcher.enqueue(_attempt(ip_address="198.51.100.1"))
+        self.dispatcher.process()
+        self.assertEqual(mail.outbox, [])
+
+        self.clock.now += 60
+        self.dispatcher.process()
+
+        self.assertEqual(len(mail.outbox), 2)
+        subjects = sorted(message.subject for message in mail.outbox)
+        self.assertIn("3 attempted logins from 203.0.113.9 at example.com", subjects[0])
+        self.assertIn("attempted login from 198.51.100.1 at example.com", subjects[1])
+        body = next(message.body for message in mail.outbox if "203.0.113.9" in message.subject)
+        self.assertIn("user0 (1), user1 (1), user2 (1)", body)
+        self.assertIn(reverse("admin:admin_honeypot_loginattempt_changelist") + "?q=203.0.113.9", body)
+
+    def test_last_seen_covers_attempts_past_the_listed_ones(self):
+        attempts = [_attempt(seconds=n) for n in range(MAX_LISTED + 5)]
+        for attempt in attempts:
+            self.dispatcher.enqueue(attempt)
+        self.dispatcher.process()
+        digest = self.dispatcher._open["203.0.113.9"]
+
+        self.assertEqual(len(digest.attempts), MAX_LISTED)
+        self.assertEqual(digest.first_seen, attempts[0].timestamp)
+        self.assertEqual(digest.last_seen, attempts[-1].timestamp)
+
+    def test_emails_over_the_hourly_cap_are_counted_in_the_next_one(self):
+        for n in range(3):
+            self.dispatcher.enqueue(_attempt(ip_address=f"203.0.113.{n}"))
+        self.dispatcher.process()
+        self.clock.now += 60
+        self.dispatcher.process()
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(self.dispatcher.suppressed, 1)
+
+        self.clock.now += 3600
+        self.dispatcher.enqueue(_attempt())
+        self.dispatcher.process()
+        self.clock.now += 60
+        self.dispatcher.process()
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn("1 further attempt was not reported", mail.outbox[-1].body)
+        self.assertEqual(self.dispatcher.suppressed, 0)
+
+    def test_failed_sends_are_retried_with_backoff(self):
+        self.dispatcher.enqueue(_attempt())
+        self.dispatcher.process()
+        self.clock.now += 60
+        with patch("admin_honeypot.alerts.mail_admins", side_effect=OSError("down")) as send:
+            with self.assertLogs("admin_honeypot.alerts", "WARNING"):
+                self.dispatcher.process()
+                self.clock.now += 10
+                self.dispatcher.process()
+            self.clock.now += 10
+            self.dispatcher.process()
+            self.assertEqual(send.call_count, 2)
+        self.clock.now += 10
+        self.dispatcher.process()
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self.dispatcher.sent, 1)
+        self.assertEqual(self.dispatcher.failed, 0)
+
+    def test_gives_up_after_the_last_retry(self):
+        self.dispatcher.enqueue(_attempt())
+        self.dispatcher.process()
+        self.clock.now += 60
+        with patch("admin_honeypot.alerts.mail_admins", side_effect=OSError("down")):
+            with self.assertLogs("admin_honeypot.alerts", "WARNING"):
+                for _ in range(4):
+                    self.dispatcher.process()
+                    self.clock.now += 40
+
+        self.assertEqual(self.dispatcher.failed, 1)
+        self.assertEqual(self.dispatcher.pending, 0)
+
+    def test_stop_flushes_open_digests(self):
+        self.dispatcher.enqueue(_attempt())
+        self.dispatcher.stop()
+
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_worker_sends_off_the_request_thread(self):
+        dispatcher = AlertDispatcher(window=0, poll_interval=0.01)
+        self.addCleanup(dispatcher.stop)
+        dispatcher.enqueue(_attempt())
+        for _ in range(500):
+            if dispatcher.sent:
+                break
+            threading.Event().wait(0.01)
+
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_delivery_over_smtp_with_retry(self):
+        server = _SMTPStub(failures=1)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        smtp = override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=server.server_address[1],
+            EMAIL_TIMEOUT=5,
+        )
+        with smtp, self.assertLogs("admin_honeypot.alerts", "WARNING"):
+            self.dispatcher.enqueue(_attempt())
+            self.dispatcher.process()
+            self.clock.now += 60
+            self.dispatcher.process()
+            self.clock.now += 10
+            self.dispatcher.process()
+
+        self.assertEqual(len(server.messages), 1)
+        self.assertIn("203.0.113.9", server.messages[0])
+
+
+@override_settings(ADMINS=ADMINS)
+class NotifyAdminsTests(TestCase):
+    def setUp(self):
+        # Empties the throttle's buckets.
+        cache.clear()
+
+    def test_honeypot_login_queues_an_alert_without_sending(self):
+        dispatcher = AlertDispatcher(autostart=False)
+        with patch("admin_honeypot.listeners.get_dispatcher", return_value=dispatcher):
+            response = self.client.post(
+                reverse("admin_honeypot:login"), {"username": "admin", "password": "secret"}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(dispatcher.pending, 1)
+        dispatcher.flush()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("testserver", mail.outbox[0].subject)
+
+    def test_attempt_is_copied_from_the_instance(self):
+        instance = LoginAttempt(username="root", ip_address="192.0.2.1", path="/admin/login/")
+        dispatcher = AlertDispatcher(autostart=False)
+        request = type("Request", (), {"get_host": lambda self: "example.com"})()
+        with patch("admin_honeypot.listeners.get_dispatcher", return_value=dispatcher):
+            notify_admins(instance, request)
+        dispatcher.process()
+
+        self.assertEqual(dispatcher.pending, 1)
+
+
+def _login_attempt(ip_address="203.0.113.9", username="admin", path="/admin/login/"):
+    return LoginAttempt(username=username, password="x", ip_address=ip_address, path=path)
+
+
+class BufferedAttemptRecorderTests(TestCase):
+    def test_identical_attempts_collapse_into_one_row(self):
+        recorder = BufferedAttemptRecorder(autostart=False)
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                recorder.record(_login_attempt())
+            recorder.record(_login_attempt(username="root"))
+        self.assertEqual(recorder.pending, 4)
+
+        self.assertEqual(recorder.flush(), 2)
+        self.assertEqual(
+            dict(LoginAttempt.objects.values_list("username", "attempts")), {"admin": 3, "root": 1}
+        )
+        self.assertEqual(recorder.pending, 0)
+
+    def test_distinct_attempts_beyond_the_limit_are_dropped(self):
+        recorder = BufferedAttemptRecorder(max_pending=2, autostart=False)
+        for n in range(3):
+            recorder.record(_login_attempt(ip_address=f"203.0.113.{n}"))
+        recorder.record(_login_attempt(ip_address="203.0.113.0"))
+        recorder.flush()
+
+        self.assertEqual(recorder.dropped, 1)
+        self.assertEqual(LoginAttempt.objects.count(), 2)
+
+    def test_a_failed_flush_is_retried_with_the_attempts_since(self):
+        recorder = BufferedAttemptRecorder(autostart=False)
+        recorder.record(_login_attempt())
+        recorder.record(_login_attempt(username="root"))
+        with patch("admin_honeypot.aggregates.record", side_effect=DatabaseError("unavailable")):
+            self.assertEqual(recorder.flush(), 0)
+        self.assertFalse(LoginAttempt.objects.exists())
+        recorder.record(_login_attempt())
+
+        self.assertEqual(recorder.pending, 3)
+        self.assertEqual(recorder.flush(), 2)
+        self.assertEqual(
+            dict(LoginAttempt.objects.values_list("username", "attempts")), {"admin": 2, "root": 1}
+        )
+        self.assertEqual(AttackerStat.objects.get(kind=AttackerStat.IP).attempts, 3)
+
+    @override_settings(
+        ADMIN_HONEYPOT_RECORDER="admin_honeypot.ingest.BufferedAttemptRecorder",
+        ADMIN_HONEYPOT_RECORDER_OPTIONS={"autostart": False},
+    )
+    def test_honeypot_view_does_not_touch_the_database(self):
+        cache.clear()
+        dispatcher = AlertDispatcher(autostart=False)
+        with patch("admin_honeypot.listeners.get_dispatcher", return_value=dispatcher):
+            with self.assertNumQueries(0):
+                for _ in range(2):
+                    response = self.client.post(
+                        reverse("admin_honeypot:login"), {"username": "admin", "password": "secret"}
+                    )
+            get_recorder().flush()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(LoginAttempt.objects.get().attempts, 2)
+        self.assertEqual(dispatcher.pending, 2)
+
+
+class BufferedAttemptWorkerTests(TransactionTestCase):
+    def test_worker_flushes_when_a_batch_is_full(self):
+        recorder = BufferedAttemptRecorder(batch_size=2, flush_interval=60)
+        self.addCleanup(recorder.stop)
+        recorder.record(_login_attempt(ip_address="203.0.113.1"))
+        recorder.record(_login_attempt(ip_address="203.0.113.2"))
+        for _ in range(500):
+            if recorder.written:
+                break
+            threading.Event().wait(0.01)
+
+        self.assertEqual(LoginAttempt.objects.count(), 2)
+
+
+class AggregateTests(TestCase):
+    def _record(self, recorder=None, **kwargs):
+        (recorder or AttemptRecorder()).record(_login_attempt(**kwargs))
+
+    def _totals(self, kind):
+        return dict(AttackerStat.objects.filter(kind=kind).values_list("value", "attempts"))
+
+    def test_attempts_update_the_totals(self):
+        self._record(ip_address="203.0.113.1")
+        self._record(ip_address="203.0.113.1", path="/admin/")
+        self._record(ip_address="203.0.113.2", username="root")
+
+        self.assertEqual(self._totals(AttackerStat.IP), {"203.0.113.1": 2, "203.0.113.2": 1})
+        self.assertEqual(self._totals(AttackerStat.SUBNET), {"203.0.113.0/24": 3})
+        self.assertEqual(self._totals(AttackerStat.USERNAME), {"admin": 2, "root": 1})
+        self.assertEqual(self._totals(AttackerStat.PATH), {"/admin/login/": 2, "/admin/": 1})
+        self.assertEqual(
+            AttackerPath.objects.get(kind=AttackerStat.SUBNET, path="/admin/login/").attempts, 2
+        )
+
+    def test_first_and_last_seen(self):
+        self._record()
+        LoginAttempt.objects.update(timestamp=timezone.now() - timedelta(days=1))
+        first = LoginAttempt.objects.get().timestamp
+        aggregates.record(LoginAttempt.objects.all())
+        self._record()
+
+        stat = AttackerStat.objects.get(kind=AttackerStat.IP)
+        self.assertEqual(stat.first_seen, first)
+        self.assertEqual(stat.last_seen, LoginAttempt.objects.latest("pk").timestamp)
+
+    def test_collapsed_attempts_count_in_full(self):
+        recorder = BufferedAttemptRecorder(autostart=False)
+        for _ in range(3):
+            self._record(recorder)
+        recorder.flush()
+
+        self.assertEqual(self._totals(AttackerStat.IP), {"203.0.113.9": 3})
+
+    def test_can_be_disabled(self):
+        with self.settings(ADMIN_HONEYPOT_AGGREGATES=False):
+            self._record()
+
+        self.assertFalse(AttackerStat.objects.exists())
+
+    def test_rebuild_matches_the_incremental_totals(self):
+        for n in range(5):
+            self._record(ip_address=f"2001:db8::{n % 2}", username=f"user{n % 3}", path=f"/p{n % 2}/")
+        incremental = sorted(AttackerStat.objects.values_list("kind", "value", "attempts", "first_seen", "last_seen"))
+        paths = sorted(AttackerPath.objects.values_list("kind", "value", "path", "attempts"))
+
+        stdout = StringIO()
+        call_command("rebuild_honeypot_aggregates", "--chunk-size", "2", stdout=stdout)
+
+        self.assertIn("from 5 login attempts", stdout.getvalue())
+        self.assertEqual(
+            sorted(AttackerStat.objects.values_list("kind", "value", "attempts", "first_seen", "last_seen")),
+            incremental,
+        )
+        self.assertEqual(sorted(AttackerPath.objects.values_list("kind", "value", "path", "attempts")), paths)
+        self.assertEqual(self._totals(AttackerStat.SUBNET), {"2001:db8::/64": 5})
+
+    def test_top_lists_the_busiest_with_their_paths(self):
+        for path in ("/a/", "/a/", "/b/", "/c/", "/d/"):
+            self._record(path=path)
+        self._record(ip_address="198.51.100.1")
+
+        with self.assertNumQueries(2):
+            stats = aggregates.top(AttackerStat.IP, limit=1)
+
+        self.assertEqual([stat.value for stat in stats], ["203.0.113.9"])
+        self.assertEqual(stats[0].top_paths, [("/a/", 2), ("/b/", 1), ("/c/", 1)])
+
+
+class AttackerSummaryAdminTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_superuser("admin", "admin@example.com", "p455w0rd")
+        self.client.force_login(user)
+        for ip_address in ("203.0.113.1", "203.0.113.1", "198.51.100.7"):
+            AttemptRecorder().record(_login_attempt(ip_address=ip_address))
+
+    def test_summary_is_read_from_the_aggregates(self):
+        with patch.object(LoginAttempt.objects, "get_queryset", side_effect=AssertionError):
+            response = self.client.get(reverse("admin:admin_honeypot_attackerstat_changelist"))
+
+        self.assertContains(response, "203.0.113.0/24")
+        self.assertContains(response, "/admin/login/ (2)")
+
+    def test_csv_export(self):
+        response = self.client.get(
+            reverse("admin:admin_honeypot_attackerstat_export"), {"format": "csv", "kind": "ip"}
+        )
+
+        lines = response.content.decode().splitlines()
+        self.assertEqual(lines[0], "kind,value,attempts,first_seen,last_seen,top_paths")
+        self.assertTrue(lines[1].startswith("ip,203.0.113.1,2,"))
+        self.assertTrue(lines[1].endswith("/admin/login/ (2)"))
+        self.assertEqual(len(lines), 3)
+        self.assertIn('filename="attackers-ip.csv"', response["Content-Disposition"])
+
+    def test_csv_export_neutralises_formulas(self):
+        AttemptRecorder().record(_login_attempt(username="=HYPERLINK(\"http://x\")", path="@SUM(1)"))
+        response = self.client.get(
+            reverse("admin:admin_honeypot_attackerstat_export"), {"format": "csv", "kind": "username"}
+        )
+
+        rows = list(csv.reader(response.content.decode().splitlines()))
+        values = {row[1]: row[5] for row in rows[1:]}
+        self.assertEqual(values["'=HYPERLINK(\"http://x\")"], "'@SUM(1) (1)")
+
+    def test_json_export(self):
+        response = self.client.get(reverse("admin:admin_honeypot_attackerstat_export"), {"format": "json"})
+
+        rows = json.loads(response.content)
+        self.assertEqual({row["kind"] for row in rows}, {"ip", "subnet", "username", "path"})
+        subnet = next(row for row in rows if row["kind"] == "subnet" and row["value"] == "203.0.113.0/24")
+        self.assertEqual(subnet["top_paths"], [{"path": "/admin/login/", "attempts": 2}])
+
+    def test_export_rejects_unknown_options(self):
+        url = reverse("admin:admin_honeypot_attackerstat_export")
+
+        self.assertEqual(self.client.get(url, {"kind": "country"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"format": "xml"}).status_code, 400)
@@ -6,6 +6,7 @@ from django.urls import reverse
 from django.utils.translation import gettext as _
 from django.views import generic
 from admin_honeypot.forms import HoneypotLoginForm
+from admin_honeypot.ingest import get_recorder
 from admin_honeypot.models import LoginAttempt
 from admin_honeypot.signals import honeypot
 
@@ -43,7 +44,7 @@ class AdminHoneypot(generic.FormView):
         return self.form_invalid(form)
 
     def form_invalid(self, form):
-        instance = LoginAttempt.objects.create(
+        instance = LoginAttempt(
             username=self.request.POST.get('username'),
             password=self.request.POST.get('password'),
             session_key=self.request.session.session_key,
@@ -51,5 +52,6 @@ class AdminHoneypot(generic.FormView):
             user_agent=self.request.META.get('HTTP_USER_AGENT'),
             path=self.request.get_full_path(),
         )
+        get_recorder().record(instance)
         honeypot.send(sender=LoginAttempt, instance=instance, request=self.request)
         return super(AdminHoneypot, self).form_invalid(form)
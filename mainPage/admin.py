@@ -1,15 +1,37 @@
+import ipaddress
+from datetime import timedelta
+
 from django.contrib import admin
 from django.contrib.auth.models import Group
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.utils import timezone
 from django.utils.html import format_html, mark_safe
 from django.urls import reverse
-from mainPage.models import Portfolio, Background_img, Specialisation, About, Blog, Contact, People, Visit_detail
+from mainPage import analytics, imagejobs
+from mainPage.models import Portfolio, Background_img, Specialisation, About, Blog, Contact, People, Visit_detail, FilteredVisit, VisitBreakdown, VisitRollup
+
 
+@admin.action(description="Recompress selected images")
+def recompress_images(modeladmin, request, queryset):
+    for instance in queryset:
+        imagejobs.enqueue(instance, force=True)
+    modeladmin.message_user(request, "Queued {} image(s) for compression.".format(len(queryset)))
 
 class Background_imgInline(admin.StackedInline):
-    fields = ['image']
+    fields = ['image', 'processing_status']
+    readonly_fields = ['processing_status']
     model = Background_img
     extra = 1
 
+class Background_imgAdmin(admin.ModelAdmin):
+    fields = ['portfolio', 'image', 'processing_status', 'processing_error']
+    readonly_fields = ['processing_status', 'processing_error']
+    list_display = ('__str__', 'portfolio', 'processing_status')
+    list_select_related = ['portfolio']
+    list_filter = ['processing_status']
+    actions = [recompress_images]
+
 class SpecialisationInline(admin.StackedInline):
     fields = ['specialisation_name']
     model = Specialisation
@@ -21,9 +43,10 @@ class PortfolioAdmin(admin.ModelAdmin):
     list_display = ('name_content', 'last_updated')
 
 class AboutAdmin(admin.ModelAdmin):
-    fields = ['preview', 'image', 'content']
-    list_display = ('name', 'last_updated')
-    readonly_fields = ["preview"]
+    fields = ['preview', 'image', 'processing_status', 'processing_error', 'content']
+    list_display = ('name', 'processing_status', 'last_updated')
+    readonly_fields = ["preview", 'processing_status', 'processing_error']
+    actions = [recompress_images]
 
     def preview(self, instance):
         return mark_safe('<img src="{url}" width="{width}" height={height} />'.format(
@@ -79,8 +102,19 @@ class PeopleAdmin(admin.ModelAdmin):
 
 class Visit_detailAdmin(admin.ModelAdmin):
     list_display = ['get_people_ip', 'user_agent', 'city' ,'region' ,'country' ,'name', 'email_id', 'message', 'visit_time']
+    list_select_related = ['people']
+    ordering = ['-visit_time']
     search_fields = ['people__ip_address', 'user_agent', 'city' ,'region' ,'country' ,'name', 'email_id', 'message', 'visit_time']
-    
+
+    def get_search_results(self, request, queryset, search_term):
+        # An address is looked up exactly, through the indexes, instead of
+        # with a LIKE scan over every text column.
+        try:
+            ip_address = str(ipaddress.ip_address(search_term.strip()))
+        except ValueError:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(people__ip_address=ip_address), False
+
     def has_add_permission(self, request, obj=None):
         return False
 
@@ -92,13 +126,66 @@ class Visit_detailAdmin(admin.ModelAdmin):
     
     
 
+class FilteredVisitAdmin(admin.ModelAdmin):
+    list_display = ('day', 'reason', 'hits')
+    list_filter = ['reason']
+    date_hierarchy = 'day'
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+class VisitRollupAdmin(admin.ModelAdmin):
+    """Traffic dashboard built from the rollups only, never from Visit_detail."""
+
+    hours = 48
+    days = 30
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        now = timezone.now()
+        hourly = analytics.totals(VisitRollup.HOUR, now - timedelta(hours=self.hours))
+        daily = analytics.totals(VisitRollup.DAY, now - timedelta(days=self.days))
+        since = analytics.day_bounds(timezone.localdate(now) - timedelta(days=self.days - 1))[0]
+        peak = max((row.visits for row in hourly + daily), default=0) or 1
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Visit analytics',
+            'opts': self.model._meta,
+            'hours': self.hours,
+            'days': self.days,
+            'hourly': hourly,
+            'daily': daily,
+            'peak': peak,
+            'countries': analytics.top_values(VisitBreakdown.COUNTRY, since),
+            'agents': analytics.top_values(VisitBreakdown.AGENT, since),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/mainPage/visitrollup/dashboard.html', context)
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 # Register your models here.
 admin.site.register(Portfolio, PortfolioAdmin)
+admin.site.register(Background_img, Background_imgAdmin)
 admin.site.register(About, AboutAdmin)
 admin.site.register(Blog, BlogAdmin)
 admin.site.register(Contact, ContactAdmin)
 admin.site.register(People, PeopleAdmin)
 admin.site.register(Visit_detail, Visit_detailAdmin)
+admin.site.register(FilteredVisit, FilteredVisitAdmin)
+admin.site.register(VisitRollup, VisitRollupAdmin)
 
 admin.site.site_header = "Admin"
 admin.site.site_title = "Admin"
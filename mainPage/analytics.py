@@ -0,0 +1,185 @@
+"""Hourly and daily rollups of ``Visit_detail``.
+
+Reporting reads ``VisitRollup`` (visits and distinct addresses per bucket)
+and ``VisitBreakdown`` (visits per country and user-agent family per bucket)
+instead of scanning the raw visit table. ``refresh_rollups`` brings them up to
+date incrementally: ``RollupState`` remembers the last visit id it has seen,
+and only the local days containing newer visits are recomputed, each with a
+handful of grouped queries over that day's ``visit_time`` range. Distinct
+addresses cannot be summed across hours, which is why whole days are rebuilt
+rather than adding new rows to the existing counts.
+
+Visits change after they are saved when their location is resolved later
+(``GEOIP_DEFERRED``), so days that ended less than ``ANALYTICS_SETTLE_SECONDS``
+before the previous run are recomputed as well.
+
+Run ``manage.py rollup_visits`` from cron, or let the command loop with
+``--interval``.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from mainPage.models import RollupState, Visit_detail, VisitBreakdown, VisitRollup
+
+
+STATE_NAME = "visits"
+OTHER_AGENT = "Other"
+
+# First match wins, so browsers whose user agents also name the engines they
+# build on come before those engines.
+AGENT_FAMILIES = (
+    ("Edge", r"\bEdg(?:e|A|iOS)?/"),
+    ("Opera", r"\bOPR/|\bOpera\b"),
+    ("Samsung Internet", r"\bSamsungBrowser/"),
+    ("Chrome", r"\bChrome/|\bCriOS/|\bChromium/"),
+    ("Firefox", r"\bFirefox/|\bFxiOS/"),
+    ("Safari", r"\bSafari/"),
+    ("Internet Explorer", r"\bMSIE |\bTrident/"),
+)
+
+_AGENT_RES = tuple((family, re.compile(pattern)) for family, pattern in AGENT_FAMILIES)
+
+
+@lru_cache(maxsize=1024)
+def agent_family(user_agent: str) -> str:
+    for family, pattern in _AGENT_RES:
+        if pattern.search(user_agent):
+            return family
+    return OTHER_AGENT
+
+
+@dataclass(frozen=True)
+class RollupResult:
+    days: int
+    visits: int
+    last_visit_id: int
+
+
+def settle_window() -> timedelta:
+    return timedelta(seconds=getattr(settings, "ANALYTICS_SETTLE_SECONDS", 60 * 60))
+
+
+def day_bounds(day: date) -> Tuple[datetime, datetime]:
+    """Return the aware start and end of a day in the current time zone."""
+
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def _days(first: date, last: date) -> Iterator[date]:
+    day = first
+    while day <= last:
+        yield day
+        day += timedelta(days=1)
+
+
+def rollup_day(day: date) -> int:
+    """Recompute the hourly and daily rollups of one local day; return its visits."""
+
+    start, end = day_bounds(day)
+    rows = (
+        Visit_detail.objects.filter(visit_time__gte=start, visit_time__lt=end)
+        .annotate(bucket=TruncHour("visit_time", tzinfo=timezone.get_current_timezone()))
+        .order_by()
+    )
+
+    hours = [
+        VisitRollup(period=VisitRollup.HOUR, start=row["bucket"], visits=row["visits"], unique_ips=row["unique_ips"])
+        for row in rows.values("bucket").annotate(
+            visits=Count("id"), unique_ips=Count("people_id", distinct=True)
+        )
+    ]
+    breakdowns: Dict[Tuple[datetime, str, str], int] = {}
+    for row in rows.values("bucket", "country").annotate(visits=Count("id")):
+        key = (row["bucket"], VisitBreakdown.COUNTRY, row["country"] or "")
+        breakdowns[key] = breakdowns.get(key, 0) + row["visits"]
+    # Grouped by the raw string in SQL, so each distinct agent is classified once.
+    for row in rows.values("bucket", "user_agent").annotate(visits=Count("id")):
+        key = (row["bucket"], VisitBreakdown.AGENT, agent_family(row["user_agent"]))
+        breakdowns[key] = breakdowns.get(key, 0) + row["visits"]
+
+    rollups = list(hours)
+    daily: Dict[Tuple[str, str], int] = {}
+    for (_, dimension, value), visits in breakdowns.items():
+        daily[(dimension, value)] = daily.get((dimension, value), 0) + visits
+    total = sum(hour.visits for hour in hours)
+    if total:
+        unique_ips = rows.aggregate(n=Count("people_id", distinct=True))["n"]
+        rollups.append(VisitRollup(period=VisitRollup.DAY, start=start, visits=total, unique_ips=unique_ips))
+
+    details: List[VisitBreakdown] = [
+        VisitBreakdown(period=VisitRollup.HOUR, start=bucket, dimension=dimension, value=value, visits=visits)
+        for (bucket, dimension, value), visits in breakdowns.items()
+    ]
+    details.extend(
+        VisitBreakdown(period=VisitRollup.DAY, start=start, dimension=dimension, value=value, visits=visits)
+        for (dimension, value), visits in daily.items()
+    )
+
+    with transaction.atomic():
+        VisitRollup.objects.filter(start__gte=start, start__lt=end).delete()
+        VisitBreakdown.objects.filter(start__gte=start, start__lt=end).delete()
+        VisitRollup.objects.bulk_create(rollups)
+        VisitBreakdown.objects.bulk_create(details)
+    return total
+
+
+def refresh_rollups(now: Optional[datetime] = None, full: bool = False) -> RollupResult:
+    """Bring the rollups up to date with the visits saved since the last run.
+
+    ``full`` recomputes every day from the oldest visit still stored.
+    """
+
+    now = now or timezone.now()
+    state, _ = RollupState.objects.get_or_create(name=STATE_NAME)
+    since = 0 if full else state.last_visit_id
+    new = Visit_detail.objects.filter(pk__gt=since).aggregate(
+        first=Min("visit_time"), last_id=Max("pk")
+    )
+
+    starts = [now - settle_window()]
+    if state.updated_at is not None and not full:
+        starts.append(state.updated_at - settle_window())
+    if new["first"] is not None:
+        starts.append(new["first"])
+    first = timezone.localdate(min(starts))
+    last = timezone.localdate(now)
+
+    days = visits = 0
+    for day in _days(first, last):
+        visits += rollup_day(day)
+        days += 1
+
+    state.last_visit_id = max(state.last_visit_id, new["last_id"] or 0)
+    state.updated_at = now
+    state.save(update_fields=["last_visit_id", "updated_at"])
+    return RollupResult(days=days, visits=visits, last_visit_id=state.last_visit_id)
+
+
+def totals(period: str, since: datetime) -> List[VisitRollup]:
+    return list(VisitRollup.objects.filter(period=period, start__gte=since).order_by("start"))
+
+
+def top_values(dimension: str, since: datetime, limit: int = 10) -> List[Tuple[str, int]]:
+    """Return the values of ``dimension`` with the most visits since ``since``."""
+
+    rows = (
+        VisitBreakdown.objects.filter(period=VisitRollup.DAY, dimension=dimension, start__gte=since)
+        .values("value")
+        .annotate(total=Sum("visits"))
+        .order_by("-total", "value")[:limit]
+    )
+    return [(row["value"], row["total"]) for row in rows]
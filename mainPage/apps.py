@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MainpageConfig(AppConfig):
     name = 'mainPage'
+
+    def ready(self):
+        from mainPage import signals  # noqa: F401
@@ -0,0 +1,57 @@
+"""CPU-bound image compression.
+
+Kept free of Django imports so it can run in a worker process.
+
+Uploads are bounded to ``max_dimension`` while they are decoded: JPEG sources
+are decoded at 1/2, 1/4 or 1/8 scale through ``Image.draft`` and any remainder
+is shrunk with ``Image.reduce`` before the final resample, so a 50-megapixel
+photo never exists in memory at full size. The JPEG is written straight to a
+file rather than collected in a buffer.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import BinaryIO, Tuple, Union
+
+from PIL import Image, ImageOps
+
+
+JPEG_QUALITY = 70
+MAX_DIMENSION = 2560
+
+Source = Union[str, BinaryIO]
+
+
+def _bounded_size(size: Tuple[int, int], max_dimension: int) -> Tuple[int, int]:
+    width, height = size
+    scale = min(1.0, max_dimension / max(width, height))
+    return max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale))
+
+
+def compress_file(
+    source: Source,
+    destination: Source,
+    max_dimension: int = MAX_DIMENSION,
+    quality: int = JPEG_QUALITY,
+) -> Tuple[int, int]:
+    """Write ``source`` to ``destination`` as an optimized, upright RGB JPEG.
+
+    The longer side is limited to ``max_dimension`` (``0`` keeps the original
+    size). Returns the size of the written image.
+    """
+
+    with Image.open(source) as image:
+        if max_dimension:
+            target = _bounded_size(image.size, max_dimension)
+            # Let the JPEG decoder skip DCT detail down to the smallest scale
+            # still at least as large as the target, then reduce/resample the
+            # rest. The bound is square, so the EXIF rotation applied
+            # afterwards cannot exceed it.
+            image.draft("RGB", target)
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS, reducing_gap=2.0)
+        processed = ImageOps.exif_transpose(image)
+        if processed.mode != "RGB":
+            processed = processed.convert("RGB")
+        processed.save(destination, format="JPEG", optimize=True, quality=quality)
+        return processed.size
@@ -0,0 +1,42 @@
+"""Per-connection database tuning.
+
+``SQLITE_PRAGMAS`` are run on every new SQLite connection from the
+``connection_created`` signal (see ``mainPage.signals``). Django opens one
+connection per thread and worker, so this is the one place every connection
+passes through before its first query.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, Union
+
+from django.conf import settings
+
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_]+$")
+
+
+def pragma_statements(pragmas: Dict[str, Union[str, int]]):
+    for name, value in pragmas.items():
+        if not _IDENTIFIER.match(name):
+            raise ValueError(f"Invalid SQLite pragma name: {name!r}")
+        if not isinstance(value, int) and not _IDENTIFIER.match(str(value)):
+            raise ValueError(f"Invalid value for SQLite pragma {name}: {value!r}")
+        yield f"PRAGMA {name} = {value}"
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs) -> None:
+    if connection.vendor != "sqlite":
+        return
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", {})
+    if not pragmas:
+        return
+    # On the DB-API connection, so connection setup is not counted as the
+    # queries of the request that happened to open it (mainPage.queries).
+    cursor = connection.connection.cursor()
+    try:
+        for statement in pragma_statements(pragmas):
+            cursor.execute(statement)
+    finally:
+        cursor.close()
@@ -0,0 +1,343 @@
+"""Geo-IP resolution with caching, pluggable backends and deferred enrichment."""
+
+from __future__ import annotations
+
+import ipaddress
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Hashable, Optional, Sequence, Tuple, Union
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from mainPage.geoindex import load_index
+
+
+Location = Dict[str, Optional[str]]
+
+log = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 24 * 60 * 60) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: object = MISSING) -> object:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: object, ttl: Optional[float] = None) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class GeoBackend:
+    """Resolve an IP to a location.
+
+    ``lookup`` returns ``None`` when the address is unknown and raises when the
+    backend itself failed, so the resolver can fall through to the next one.
+    """
+
+    def lookup(self, ip_addr: str) -> Optional[Location]:
+        raise NotImplementedError
+
+
+class DbIpCityBackend(GeoBackend):
+    """The remote db-ip.com API used historically by the site."""
+
+    def __init__(self, api_key: str = "free") -> None:
+        self.api_key = api_key
+
+    def lookup(self, ip_addr: str) -> Optional[Location]:
+        from ip2geotools.databases.noncommercial import DbIpCity
+
+        response = DbIpCity.get(str(ip_addr), api_key=self.api_key)
+        return {
+            "city": response.city,
+            "region": response.region,
+            "country": response.country,
+        }
+
+
+class RangeFileBackend(GeoBackend):
+    """Offline lookups against a local range file.
+
+    ``path`` is either a CSV of ``network,city,region,country`` (or
+    ``start,end,city,region,country``) rows, or a binary index built by the
+    ``build_geoindex`` command, which is memory-mapped and shared by workers.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.index = load_index(path)
+
+    def lookup(self, ip_addr: str) -> Optional[Location]:
+        return self.index.lookup(ip_addr)
+
+
+def _build_backend(spec) -> GeoBackend:
+    if isinstance(spec, GeoBackend):
+        return spec
+    if isinstance(spec, str):
+        return import_string(spec)()
+    path, options = spec
+    return import_string(path)(**options)
+
+
+class GeoResolver:
+    """Resolve IPs through an in-memory cache, an optional table and the backends."""
+
+    def __init__(
+        self,
+        backends: Sequence[GeoBackend],
+        cache_size: int = 4096,
+        cache_ttl: float = 24 * 60 * 60,
+        negative_ttl: float = 10 * 60,
+        persistent: bool = False,
+    ) -> None:
+        self.backends = list(backends)
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.cache_ttl = cache_ttl
+        self.negative_ttl = negative_ttl
+        self.persistent = persistent
+
+    @classmethod
+    def from_settings(cls) -> "GeoResolver":
+        backends = getattr(settings, "GEOIP_BACKENDS", ["mainPage.geo.DbIpCityBackend"])
+        return cls(
+            backends=[_build_backend(spec) for spec in backends],
+            cache_size=getattr(settings, "GEOIP_CACHE_SIZE", 4096),
+            cache_ttl=getattr(settings, "GEOIP_CACHE_TTL", 24 * 60 * 60),
+            negative_ttl=getattr(settings, "GEOIP_NEGATIVE_TTL", 10 * 60),
+            persistent=getattr(settings, "GEOIP_PERSISTENT_CACHE", False),
+        )
+
+    def resolve(self, ip_addr: str) -> Optional[Location]:
+        address = global_address(ip_addr)
+        if address is None:
+            return None
+
+        key = str(address)
+        cached = self.cache.get(key)
+        if cached is not MISSING:
+            return dict(cached) if cached else None
+
+        if self.persistent:
+            stored = self._load_persistent(key)
+            if stored is not MISSING:
+                self._remember(key, stored)
+                return dict(stored) if stored else None
+
+        location = self._lookup(key)
+        self._remember(key, location)
+        if self.persistent:
+            self._store_persistent(key, location)
+        return dict(location) if location else None
+
+    def _lookup(self, ip_addr: str) -> Optional[Location]:
+        for backend in self.backends:
+            try:
+                location = backend.lookup(ip_addr)
+            except Exception:
+                log.debug("Geo backend %r failed for %s", backend, ip_addr, exc_info=True)
+                continue
+            if location:
+                return location
+        return None
+
+    def _remember(self, key: str, location: Optional[Location]) -> None:
+        self.cache.set(key, location, ttl=self.cache_ttl if location else self.negative_ttl)
+
+    def _load_persistent(self, key: str) -> object:
+        from mainPage.models import IpLocation
+
+        entry = IpLocation.objects.filter(ip_address=key).first()
+        if entry is None:
+            return MISSING
+        ttl = self.cache_ttl if entry.found else self.negative_ttl
+        if entry.resolved_at < timezone.now() - timedelta(seconds=ttl):
+            return MISSING
+        return entry.as_location()
+
+    def _store_persistent(self, key: str, location: Optional[Location]) -> None:
+        from mainPage.models import IpLocation
+
+        location = location or {}
+        IpLocation.objects.update_or_create(
+            ip_address=key,
+            defaults={
+                "city": location.get("city"),
+                "region": location.get("region"),
+                "country": location.get("country"),
+                "found": bool(location),
+                "resolved_at": timezone.now(),
+            },
+        )
+
+
+class EnrichmentWorker:
+    """Fill in city/region/country for visits saved without them.
+
+    IPs are queued (deduplicated while pending) and a daemon thread resolves
+    each one and updates every unresolved ``Visit_detail`` row for it.
+    """
+
+    def __init__(self, max_queue_size: int = 10000, autostart: bool = True) -> None:
+        self.autostart = autostart
+        self._queue: "queue.Queue[str]" = queue.Queue(maxsize=max_queue_size)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def enqueue(self, ip_addr: str) -> None:
+        with self._lock:
+            if ip_addr in self._pending:
+                return
+            try:
+                self._queue.put_nowait(ip_addr)
+            except queue.Full:
+                return
+            self._pending.add(ip_addr)
+        if self.autostart:
+            self.start()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name="geo-enrichment", daemon=True)
+            self._worker.start()
+
+    def drain(self) -> int:
+        """Process everything queued on the calling thread."""
+
+        processed = 0
+        while True:
+            try:
+                ip_addr = self._queue.get_nowait()
+            except queue.Empty:
+                return processed
+            self._process(ip_addr)
+            processed += 1
+
+    def _run(self) -> None:
+        while True:
+            ip_addr = self._queue.get()
+            close_old_connections()
+            self._process(ip_addr)
+
+    def _process(self, ip_addr: str) -> None:
+        with self._lock:
+            self._pending.discard(ip_addr)
+        try:
+            enrich_visits(ip_addr)
+        except Exception:
+            log.exception("Failed to enrich visits for %s", ip_addr)
+
+
+def global_address(ip_addr: str) -> Optional[Union[ipaddress.IPv4Address, ipaddress.IPv6Address]]:
+    """``ip_addr`` parsed, or ``None`` if it is invalid or not globally routable."""
+
+    try:
+        address = ipaddress.ip_address(ip_addr or "")
+    except ValueError:
+        return None
+    return address if address.is_global else None
+
+
+def enrich_visits(ip_addr: str) -> int:
+    """Resolve ``ip_addr`` once and store the location on its unresolved visits.
+
+    Visits from addresses that can never be resolved get an empty country,
+    so later runs no longer pick them up.
+    """
+
+    from mainPage.models import Visit_detail
+    from mainPage.utils import Utility
+
+    if global_address(ip_addr) is None:
+        Visit_detail.objects.filter(people__ip_address=ip_addr, country__isnull=True).update(country="")
+        return 0
+    location = Utility.get_location_via_ip(ip_addr)
+    if not location:
+        return 0
+    return Visit_detail.objects.filter(
+        people__ip_address=ip_addr, country__isnull=True
+    ).update(
+        city=location.get("city"),
+        region=location.get("region"),
+        country=location.get("country"),
+    )
+
+
+_resolver: Optional[GeoResolver] = None
+_enrichment_worker: Optional[EnrichmentWorker] = None
+_singleton_lock = threading.Lock()
+
+
+def get_resolver() -> GeoResolver:
+    global _resolver
+    if _resolver is None:
+        with _singleton_lock:
+            if _resolver is None:
+                _resolver = GeoResolver.from_settings()
+    return _resolver
+
+
+def get_enrichment_worker() -> EnrichmentWorker:
+    global _enrichment_worker
+    if _enrichment_worker is None:
+        with _singleton_lock:
+            if _enrichment_worker is None:
+                _enrichment_worker = EnrichmentWorker()
+    return _enrichment_worker
+
+
+def is_deferred() -> bool:
+    return getattr(settings, "GEOIP_DEFERRED", False)
+
+
+def _reset_resolver(*, setting: str, **kwargs) -> None:
+    global _resolver
+    if setting.startswith("GEOIP_"):
+        _resolver = None
+
+
+setting_changed.connect(_reset_resolver)
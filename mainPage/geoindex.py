@@ -0,0 +1,253 @@
+"""Compact, memory-mappable IP range index for offline geo lookups.
+
+Ranges are stored as parallel sorted arrays (range start, range end and a
+location id) so a lookup is a bisection over the starts. Locations are
+interned: each distinct ``(city, region, country)`` triple is stored once as
+three ids into a table of distinct strings.
+
+On disk the index is a small header followed by the raw arrays and a JSON
+string table. ``GeoIndex.open`` maps the file read-only and views the arrays
+in place, so every worker process shares the same pages of the OS cache.
+IPv6 addresses are split into high/low 64-bit halves.
+"""
+
+from __future__ import annotations
+
+import bisect
+import csv
+import ipaddress
+import json
+import mmap
+import struct
+import sys
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+Location = Dict[str, Optional[str]]
+Row = Tuple[int, int, int, Tuple[str, str, str]]
+
+MAGIC = b"GEOIDX1\0"
+# magic, byte order, v4 count, v6 count, location count, string table length
+HEADER = struct.Struct("<8s1sxxxIIIQ")
+_MASK64 = (1 << 64) - 1
+_ALIGN = 8
+
+# The file is written and read in native byte order with fixed-width codes.
+_U32 = "I" if array("I").itemsize == 4 else "L"
+_U64 = "Q"
+
+
+def _parse_address(value: str) -> ipaddress._BaseAddress:
+    value = value.strip()
+    if value.isdigit():
+        return ipaddress.ip_address(int(value))
+    return ipaddress.ip_address(value)
+
+
+def read_csv(path: str) -> List[Row]:
+    """Read ``network,city,region,country`` or ``start,end,city,region,country`` rows.
+
+    Returns ``(version, start, end, (city, region, country))`` tuples.
+    """
+
+    rows: List[Row] = []
+    with open(path, newline="", encoding="utf-8") as handle:
+        for record in csv.reader(handle):
+            if not record or record[0].lstrip().startswith("#"):
+                continue
+            try:
+                if "/" in record[0]:
+                    network = ipaddress.ip_network(record[0].strip(), strict=False)
+                    version = network.version
+                    start, end = int(network.network_address), int(network.broadcast_address)
+                    fields = record[1:]
+                else:
+                    first, last = _parse_address(record[0]), _parse_address(record[1])
+                    if first.version != last.version:
+                        continue
+                    version, start, end = first.version, int(first), int(last)
+                    fields = record[2:]
+            except (ValueError, IndexError):
+                continue
+            city, region, country = ([field.strip() for field in fields] + [""] * 3)[:3]
+            rows.append((version, start, end, (city, region, country)))
+    return rows
+
+
+class GeoIndex:
+    """Sorted parallel arrays answering IP -> location lookups by bisection."""
+
+    def __init__(
+        self,
+        v4: Tuple[Sequence[int], Sequence[int], Sequence[int]],
+        v6: Tuple[Sequence[int], Sequence[int], Sequence[int], Sequence[int], Sequence[int]],
+        locations: Sequence[int],
+        strings: List[str],
+        buffer: Optional[mmap.mmap] = None,
+    ) -> None:
+        self._v4_starts, self._v4_ends, self._v4_locs = v4
+        (
+            self._v6_start_hi,
+            self._v6_start_lo,
+            self._v6_end_hi,
+            self._v6_end_lo,
+            self._v6_locs,
+        ) = v6
+        self._locations = locations
+        self._strings = [value or None for value in strings]
+        self._buffer = buffer
+
+    def __len__(self) -> int:
+        return len(self._v4_starts) + len(self._v6_start_hi)
+
+    @classmethod
+    def build(cls, rows: Iterable[Row]) -> "GeoIndex":
+        strings: Dict[str, int] = {}
+        location_ids: Dict[Tuple[int, int, int], int] = {}
+        locations = array(_U32)
+
+        def intern(location: Tuple[str, str, str]) -> int:
+            key = tuple(strings.setdefault(value, len(strings)) for value in location)
+            if key not in location_ids:
+                location_ids[key] = len(location_ids)
+                locations.extend(key)
+            return location_ids[key]
+
+        v4 = (array(_U32), array(_U32), array(_U32))
+        v6 = (array(_U64), array(_U64), array(_U64), array(_U64), array(_U32))
+        for version, start, end, location in sorted(rows, key=lambda row: (row[0], row[1])):
+            location_id = intern(location)
+            if version == 4:
+                v4[0].append(start)
+                v4[1].append(end)
+                v4[2].append(location_id)
+            else:
+                v6[0].append(start >> 64)
+                v6[1].append(start & _MASK64)
+                v6[2].append(end >> 64)
+                v6[3].append(end & _MASK64)
+                v6[4].append(location_id)
+
+        ordered = sorted(strings, key=strings.__getitem__)
+        return cls(v4, v6, locations, ordered)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "GeoIndex":
+        return cls.build(read_csv(path))
+
+    def save(self, path: str) -> None:
+        strings = json.dumps(
+            [value or "" for value in self._strings], ensure_ascii=False
+        ).encode("utf-8")
+        sections = [
+            self._v4_starts, self._v4_ends, self._v4_locs,
+            self._v6_start_hi, self._v6_start_lo, self._v6_end_hi, self._v6_end_lo,
+            self._v6_locs, self._locations,
+        ]
+        with open(path, "wb") as handle:
+            handle.write(
+                HEADER.pack(
+                    MAGIC,
+                    b"<" if sys.byteorder == "little" else b">",
+                    len(self._v4_starts),
+                    len(self._v6_start_hi),
+                    len(self._locations) // 3,
+                    len(strings),
+                )
+            )
+            offset = HEADER.size
+            for section in sections:
+                data = memoryview(section).cast("B")
+                padding = -offset % _ALIGN
+                handle.write(b"\0" * padding)
+                handle.write(data)
+                offset += padding + len(data)
+            handle.write(strings)
+
+    @classmethod
+    def open(cls, path: str) -> "GeoIndex":
+        """Memory-map an index written by :meth:`save`."""
+
+        with open(path, "rb") as handle:
+            buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, order, v4_count, v6_count, location_count, strings_size = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a geo index file")
+        if order != (b"<" if sys.byteorder == "little" else b">"):
+            raise ValueError(f"{path} was built on a machine with a different byte order")
+
+        view = memoryview(buffer)
+        offset = HEADER.size
+
+        def take(code: str, count: int) -> memoryview:
+            nonlocal offset
+            offset += -offset % _ALIGN
+            size = array(code).itemsize * count
+            section = view[offset : offset + size].cast(code)
+            offset += size
+            return section
+
+        v4 = (take(_U32, v4_count), take(_U32, v4_count), take(_U32, v4_count))
+        v6 = (
+            take(_U64, v6_count), take(_U64, v6_count),
+            take(_U64, v6_count), take(_U64, v6_count),
+            take(_U32, v6_count),
+        )
+        locations = take(_U32, location_count * 3)
+        strings = json.loads(bytes(view[offset : offset + strings_size]).decode("utf-8"))
+        return cls(v4, v6, locations, strings, buffer=buffer)
+
+    def _location(self, location_id: int) -> Location:
+        base = location_id * 3
+        return {
+            "city": self._strings[self._locations[base]],
+            "region": self._strings[self._locations[base + 1]],
+            "country": self._strings[self._locations[base + 2]],
+        }
+
+    def lookup(self, ip_addr: str) -> Optional[Location]:
+        address = ipaddress.ip_address(ip_addr)
+        value = int(address)
+
+        if address.version == 4:
+            index = bisect.bisect_right(self._v4_starts, value) - 1
+            if index < 0 or value > self._v4_ends[index]:
+                return None
+            return self._location(self._v4_locs[index])
+
+        hi, lo = value >> 64, value & _MASK64
+        starts_hi, starts_lo = self._v6_start_hi, self._v6_start_lo
+        low, high = 0, len(starts_hi)
+        while low < high:
+            middle = (low + high) // 2
+            if (hi, lo) < (starts_hi[middle], starts_lo[middle]):
+                high = middle
+            else:
+                low = middle + 1
+        index = low - 1
+        if index < 0 or (hi, lo) > (self._v6_end_hi[index], self._v6_end_lo[index]):
+            return None
+        return self._location(self._v6_locs[index])
+
+
+_open_indexes: Dict[str, GeoIndex] = {}
+_open_lock = threading.Lock()
+
+
+def load_index(path: str) -> GeoIndex:
+    """Return the index at ``path``, mapping each binary file once per process."""
+
+    index = _open_indexes.get(path)
+    if index is None:
+        with _open_lock:
+            index = _open_indexes.get(path)
+            if index is None:
+                if path.endswith(".csv"):
+                    index = GeoIndex.from_csv(path)
+                else:
+                    index = GeoIndex.open(path)
+                _open_indexes[path] = index
+    return index
@@ -0,0 +1,206 @@
+"""Background compression of uploaded images.
+
+Admin saves only store the upload and mark it pending. After the transaction
+commits, a job is queued on a small dispatcher thread pool; the CPU-heavy
+decode/encode runs in a process pool (``IMAGE_JOBS_MODE = "process"``) on
+temporary files, so only paths cross the process boundary. The dispatcher
+then stores the JPEG and its responsive variants, records its SHA-256 and
+status on the row and removes the original. A job whose
+source already matches the recorded hash is skipped.
+
+``IMAGE_JOBS_MODE = "thread"`` keeps the encoding on the dispatcher thread and
+``"sync"`` runs the whole job inline when the transaction commits.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from tempfile import NamedTemporaryFile
+from typing import Optional, Tuple, Type
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from mainPage.compression import MAX_DIMENSION, compress_file
+from mainPage.models import About, ProcessedImage
+from mainPage.variants import delete_variants, generate_variants
+
+
+log = logging.getLogger(__name__)
+
+SKIPPED = "skipped"
+
+# Sent with ``instance`` after a job replaced a model's image file.
+image_processed = Signal()
+
+_dispatcher: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _mode() -> str:
+    return getattr(settings, "IMAGE_JOBS_MODE", "process")
+
+
+def _get_dispatcher() -> ThreadPoolExecutor:
+    global _dispatcher
+    with _pool_lock:
+        if _dispatcher is None:
+            _dispatcher = ThreadPoolExecutor(
+                max_workers=getattr(settings, "IMAGE_JOBS_DISPATCHERS", 2),
+                thread_name_prefix="image-jobs",
+            )
+        return _dispatcher
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, "IMAGE_JOBS_PROCESSES", 2),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _process_pool
+
+
+def _encode(source_path: str, destination_path: str) -> None:
+    args = (source_path, destination_path, getattr(settings, "IMAGE_MAX_DIMENSION", MAX_DIMENSION))
+    if _mode() == "process":
+        _get_process_pool().submit(compress_file, *args).result()
+    else:
+        compress_file(*args)
+
+
+def _hash_file(handle) -> str:
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: handle.read(64 * 1024), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _spool(field) -> Tuple[str, str, bool]:
+    """Return ``(path, sha256, is_temporary)`` of a local copy of ``field``."""
+
+    try:
+        path = field.storage.path(field.name)
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        with open(path, "rb") as handle:
+            return path, _hash_file(handle), False
+
+    digest = hashlib.sha256()
+    with field.storage.open(field.name, "rb") as source, NamedTemporaryFile(
+        suffix=os.path.splitext(field.name)[1], delete=False
+    ) as spool:
+        for chunk in source.chunks():
+            digest.update(chunk)
+            spool.write(chunk)
+    return spool.name, digest.hexdigest(), True
+
+
+def _remove(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _set_status(model: Type[ProcessedImage], pk, status: str, error: str = "") -> None:
+    model.objects.filter(pk=pk).update(processing_status=status, processing_error=error)
+
+
+def run_job(model: Type[ProcessedImage], pk, force: bool = False) -> str:
+    """Compress the image of ``model`` row ``pk``; return the resulting status."""
+
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not instance.image:
+        return SKIPPED
+
+    field = instance.image
+    storage, source_name = field.storage, field.name
+    source_path, source_hash, spooled = _spool(field)
+    try:
+        if not force and source_hash == instance.image_hash:
+            _set_status(model, pk, ProcessedImage.DONE)
+            return SKIPPED
+
+        _set_status(model, pk, ProcessedImage.PROCESSING)
+        with NamedTemporaryFile(suffix=".jpg", delete=False) as output:
+            output_path = output.name
+        try:
+            _encode(source_path, output_path)
+            # Saved under a fresh name before the original goes, so a failed
+            # job never leaves the row pointing at a missing file.
+            with open(output_path, "rb") as handle:
+                output_hash = _hash_file(handle)
+                handle.seek(0)
+                new_name = storage.save(os.path.splitext(source_name)[0] + ".jpg", File(handle))
+        finally:
+            _remove(output_path)
+
+        updates = {
+            "image": new_name,
+            "image_hash": output_hash,
+            "processing_status": ProcessedImage.DONE,
+            "processing_error": "",
+        }
+        if model is About:
+            updates["last_updated"] = timezone.now()
+        # Written before the row names the image, so a worker that caches
+        # which variants exist never sees it without them.
+        generate_variants(storage, new_name)
+        if not model.objects.filter(pk=pk, image=source_name).update(**updates):
+            # A new image was uploaded meanwhile; its own job compresses it.
+            delete_variants(storage, new_name)
+            storage.delete(new_name)
+            return SKIPPED
+
+        delete_variants(storage, source_name)
+        storage.delete(source_name)
+    except Exception as error:
+        log.exception("Image job failed for %s %s", model.__name__, pk)
+        _set_status(model, pk, ProcessedImage.FAILED, str(error))
+        return ProcessedImage.FAILED
+    finally:
+        if spooled:
+            _remove(source_path)
+
+    instance.refresh_from_db()
+    image_processed.send(sender=model, instance=instance)
+    return ProcessedImage.DONE
+
+
+def _run_job_safely(model: Type[ProcessedImage], pk, force: bool) -> str:
+    close_old_connections()
+    try:
+        return run_job(model, pk, force)
+    finally:
+        close_old_connections()
+
+
+def enqueue(instance: ProcessedImage, force: bool = False) -> None:
+    """Queue processing of ``instance`` once the current transaction commits."""
+
+    model, pk = type(instance), instance.pk
+    if _mode() == "sync":
+        transaction.on_commit(lambda: run_job(model, pk, force))
+        return
+    if force:
+        _set_status(model, pk, ProcessedImage.PENDING)
+    transaction.on_commit(lambda: _get_dispatcher().submit(_run_job_safely, model, pk, force))
+
+
+def submit(instance: ProcessedImage, force: bool = False) -> Future:
+    """Queue ``instance`` immediately and return the job's future."""
+
+    return _get_dispatcher().submit(_run_job_safely, type(instance), instance.pk, force)
@@ -0,0 +1,284 @@
+"""Serving of the site's images from an in-process byte cache.
+
+Images only change through admin saves, so their bytes are kept in a
+size-bounded LRU cache (cleared by ``mainPage.signals``) together with a
+SHA-256 content hash used as a strong ``ETag``. Responses answer conditional
+requests and single byte ranges. Files larger than ``max_item_bytes`` are
+read from storage on every request instead.
+
+With ``IMAGE_SENDFILE`` set to ``"x-sendfile"`` or ``"x-accel-redirect"`` the
+body is left to the front-end server and only the headers are produced here.
+
+``aserve`` is the async view variant: cache misses are read on a worker
+thread and uncached files are streamed in ``STREAM_CHUNK_SIZE`` chunks, each
+read off the event loop.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mimetypes
+import re
+import threading
+import time
+from calendar import timegm
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+from mainPage.versioning import file_version
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class CachedImage:
+    name: str
+    size: int
+    etag: str
+    last_modified: Optional[datetime]
+    content_type: str
+    data: Optional[bytes]
+    loaded_at: float
+
+
+class ImageCache:
+    """LRU cache of image bytes bounded by their total size."""
+
+    def __init__(self, max_bytes: int, max_item_bytes: int, ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CachedImage]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def lookup(self, name: str) -> Optional[CachedImage]:
+        """Return the fresh cached entry for ``name`` without touching storage."""
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return entry
+        return None
+
+    def fetch(self, field) -> CachedImage:
+        entry = self.lookup(field.name)
+        if entry is not None:
+            return entry
+        self.misses += 1
+        entry = self._load(field)
+        if entry.data is not None:
+            self._store(entry)
+        return entry
+
+    def _load(self, field) -> CachedImage:
+        content_type = mimetypes.guess_type(field.name)[0] or "image/jpeg"
+        size = field.size
+        if size > self.max_item_bytes:
+            etag, last_modified = file_version(field)
+            return CachedImage(
+                field.name, size, etag, last_modified, content_type, None, time.monotonic()
+            )
+
+        with field.storage.open(field.name, "rb") as handle:
+            data = handle.read()
+        try:
+            last_modified = field.storage.get_modified_time(field.name)
+        except (NotImplementedError, OSError):
+            last_modified = None
+        return CachedImage(
+            field.name,
+            len(data),
+            hashlib.sha256(data).hexdigest(),
+            last_modified,
+            content_type,
+            data,
+            time.monotonic(),
+        )
+
+    def _store(self, entry: CachedImage) -> None:
+        with self._lock:
+            previous = self._entries.pop(entry.name, None)
+            if previous is not None:
+                self._size -= previous.size
+            self._entries[entry.name] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+
+
+image_cache = ImageCache(
+    max_bytes=getattr(settings, "IMAGE_CACHE_MAX_BYTES", 32 * 1024 * 1024),
+    max_item_bytes=getattr(settings, "IMAGE_CACHE_MAX_ITEM_BYTES", 4 * 1024 * 1024),
+    ttl=getattr(settings, "IMAGE_CACHE_TTL", 60 * 60),
+)
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Return the inclusive ``(start, end)`` of a single ``bytes=`` range.
+
+    ``None`` means the header should be ignored and the full body sent.
+    """
+
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def _sendfile_response(field, content_type: str, sendfile: str) -> HttpResponse:
+    response = HttpResponse(content_type=content_type)
+    if sendfile == "x-accel-redirect":
+        prefix = getattr(settings, "IMAGE_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+        response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + field.name
+    else:
+        response["X-Sendfile"] = field.path
+    return response
+
+
+def _read_range(field, start: int, end: int) -> bytes:
+    with field.storage.open(field.name, "rb") as handle:
+        handle.seek(start)
+        return handle.read(end - start + 1)
+
+
+def serve(request, field) -> HttpResponse:
+    """Build the response for ``field``, honouring conditional and range requests."""
+
+    sendfile = getattr(settings, "IMAGE_SENDFILE", None)
+    if sendfile:
+        version = file_version(field)
+        image = None
+    else:
+        image = image_cache.fetch(field)
+        version = None
+    return _respond(request, field, image, version, sendfile, asynchronous=False)
+
+
+async def aserve(request, field) -> HttpResponse:
+    sendfile = getattr(settings, "IMAGE_SENDFILE", None)
+    if sendfile:
+        version = await sync_to_async(file_version, thread_sensitive=False)(field)
+        image = None
+    else:
+        image = image_cache.lookup(field.name)
+        if image is None:
+            image = await sync_to_async(image_cache.fetch, thread_sensitive=False)(field)
+        version = None
+    return _respond(request, field, image, version, sendfile, asynchronous=True)
+
+
+def _respond(request, field, image, version, sendfile, asynchronous: bool) -> HttpResponse:
+    if image is None:
+        etag, last_modified = version
+        content_type = mimetypes.guess_type(field.name)[0] or "image/jpeg"
+    else:
+        etag, last_modified, content_type = image.etag, image.last_modified, image.content_type
+
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+    headers = {"ETag": quote_etag(etag), "Accept-Ranges": "bytes"}
+    if timestamp is not None:
+        headers["Last-Modified"] = http_date(timestamp)
+
+    response = get_conditional_response(request, etag=headers["ETag"], last_modified=timestamp)
+    if response is None and sendfile:
+        response = _sendfile_response(field, content_type, sendfile)
+    elif response is None:
+        response = _body_response(request, field, image, headers["ETag"], asynchronous)
+
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def _body_response(request, field, image: CachedImage, etag: str, asynchronous: bool) -> HttpResponse:
+    range_header = request.META.get("HTTP_RANGE")
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, image.size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{image.size}"
+            return response
+        if byte_range is not None:
+            start, end = byte_range
+            if image.data is not None:
+                response = HttpResponse(image.data[start : end + 1], status=206, content_type=image.content_type)
+            elif asynchronous:
+                response = _streaming_response(field, start, end, image.content_type, status=206)
+            else:
+                response = HttpResponse(_read_range(field, start, end), status=206, content_type=image.content_type)
+            response["Content-Range"] = f"bytes {start}-{end}/{image.size}"
+            return response
+
+    if image.data is not None:
+        return HttpResponse(image.data, content_type=image.content_type)
+    if asynchronous:
+        return _streaming_response(field, 0, image.size - 1, image.content_type)
+    return FileResponse(field.storage.open(field.name, "rb"), content_type=image.content_type)
+
+
+def _streaming_response(field, start: int, end: int, content_type: str, status: int = 200) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(_astream(field, start, end), status=status, content_type=content_type)
+    response["Content-Length"] = str(end - start + 1)
+    return response
+
+
+async def _astream(field, start: int, end: int):
+    def run(func, *args):
+        return sync_to_async(func, thread_sensitive=False)(*args)
+
+    handle = await run(field.storage.open, field.name, "rb")
+    try:
+        if start:
+            await run(handle.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await run(handle.read, min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await run(handle.close)
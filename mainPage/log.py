@@ -2,19 +2,32 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
-from datetime import timedelta
-from typing import Mapping, MutableMapping, Optional
+import atexit
+import logging
+import queue
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Mapping, MutableMapping, Optional
 
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
 from django.db.models import F
+from django.db.models.functions import Greatest
 from django.utils import timezone
+from django.utils.module_loading import import_string
 
+from mainPage import geo, tasks
 from mainPage.models import People, Visit_detail
+from mainPage.traffic import get_traffic_filter
+from mainPage.utils import Utility
 
 
 ANONYMOUS_EMAIL = "anonymous@example.com"
 ANONYMOUS_NAME = "Visitor"
 
+log = logging.getLogger(__name__)
+
 
 @dataclass
 class Feedback:
@@ -34,41 +47,366 @@ class Feedback:
         )
 
 
+@dataclass(frozen=True)
+class VisitRecord:
+    """A single visit captured on the request thread, persisted later."""
+
+    ip_address: str
+    user_agent: str
+    feedback: Feedback
+    visit_time: datetime = field(default_factory=timezone.now)
+
+
+def _upsert_sql(connection) -> str:
+    quote = connection.ops.quote_name
+    meta = People._meta
+    table = quote(meta.db_table)
+    pk, ip, visits, visited = (
+        quote(meta.get_field(name).column)
+        for name in ("id", "ip_address", "no_of_visits", "last_visited")
+    )
+    # A visit written late, from a buffer, never moves last_visited back.
+    latest = "MAX" if connection.vendor == "sqlite" else "GREATEST"
+    return (
+        f"INSERT INTO {table} ({ip}, {visits}, {visited}) VALUES (%s, 1, %s) "
+        f"ON CONFLICT ({ip}) DO UPDATE SET "
+        f"{visits} = {table}.{visits} + "
+        f"CASE WHEN {table}.{visited} <= %s THEN 1 ELSE 0 END, "
+        f"{visited} = {latest}({table}.{visited}, excluded.{visited}) "
+        f"RETURNING {pk}, {visits}"
+    )
+
+
+def _supports_upsert(connection) -> bool:
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        import sqlite3
+
+        return sqlite3.sqlite_version_info >= (3, 35)
+    return False
+
+
+def upsert_visitor(ip_addr: str, visited: datetime, cooldown: timedelta) -> People:
+    """Record a visit from ``ip_addr`` and return its ``People`` row.
+
+    New addresses are inserted with one visit; known ones get ``last_visited``
+    moved forward to ``visited`` and, if their previous visit is at least
+    ``cooldown`` before it, one more visit counted. On PostgreSQL and SQLite 3.35+ this is a
+    single ``INSERT ... ON CONFLICT DO UPDATE ... RETURNING`` statement, so
+    concurrent first visits cannot collide on the unique address.
+    """
+
+    connection = connections[router.db_for_write(People)]
+    if not _supports_upsert(connection):
+        return _upsert_visitor_portably(ip_addr, visited, cooldown)
+
+    adapt = connection.ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _upsert_sql(connection), [ip_addr, adapt(visited), adapt(visited - cooldown)]
+        )
+        pk, no_of_visits = cursor.fetchone()
+
+    person = People(pk=pk, ip_address=ip_addr, no_of_visits=no_of_visits, last_visited=visited)
+    person._state.adding = False
+    person._state.db = connection.alias
+    return person
+
+
+def _upsert_visitor_portably(ip_addr: str, visited: datetime, cooldown: timedelta) -> People:
+    person, created = People.objects.get_or_create(
+        ip_address=ip_addr, defaults={"last_visited": visited}
+    )
+    if created:
+        return person
+    update_kwargs: MutableMapping[str, object] = {"last_visited": Greatest(F("last_visited"), visited)}
+    if visited - person.last_visited >= cooldown:
+        update_kwargs["no_of_visits"] = F("no_of_visits") + 1
+    People.objects.filter(pk=person.pk).update(**update_kwargs)
+    person.refresh_from_db()
+    return person
+
+
 class VisitorLogger:
     """Persist visitor metadata to the database."""
 
     cooldown = timedelta(minutes=5)
 
+    def admit(self, ip_addr: str, user_agent: str, feedback: Optional[Mapping[str, str]]) -> bool:
+        """Whether to persist this visit; bots and denied networks are only counted."""
+
+        # Feedback is always kept, whoever sends it.
+        return feedback is not None or get_traffic_filter().admit(ip_addr, user_agent)
+
     def add(self, ip_addr: str, user_agent: str, feedback: Optional[Mapping[str, str]] = None) -> None:
-        if not ip_addr:
+        if not ip_addr or not self.admit(ip_addr, user_agent, feedback):
             return
+        self.record(ip_addr, user_agent, feedback)
+
+    async def aadd(self, ip_addr: str, user_agent: str, feedback: Optional[Mapping[str, str]] = None) -> None:
+        """``add`` for async views: the visit is written by a background task."""
+
+        # admit() only counts filtered visits in memory, so it may run on the loop.
+        if not ip_addr or not self.admit(ip_addr, user_agent, feedback):
+            return
+        tasks.run_in_thread(self.record, ip_addr, user_agent, feedback)
+
+    def record(self, ip_addr: str, user_agent: str, feedback: Optional[Mapping[str, str]]) -> None:
+        """Persist an admitted visit."""
 
         feedback_payload = Feedback.from_mapping(feedback)
-        person, created = People.objects.get_or_create(
-            ip_address=ip_addr,
-            defaults={"last_visited": timezone.now()},
-        )
+        # Resolved before the transaction so a slow lookup never holds it open.
+        deferred = geo.is_deferred()
+        location = {} if deferred else Utility.get_location_via_ip(ip_addr) or {}
 
-        should_increment_visits = (not created) and (
-            timezone.now() - person.last_visited >= self.cooldown
-        )
-        update_kwargs: MutableMapping[str, object] = {"last_visited": timezone.now()}
+        with transaction.atomic():
+            person = upsert_visitor(ip_addr, timezone.now(), self.cooldown)
+            # bulk_create skips Visit_detail.save(), which would look the
+            # location up again.
+            Visit_detail.objects.bulk_create(
+                [
+                    Visit_detail(
+                        people=person,
+                        user_agent=user_agent,
+                        name=feedback_payload.name,
+                        email_id=feedback_payload.email,
+                        message=feedback_payload.message,
+                        city=location.get("city"),
+                        region=location.get("region"),
+                        country=location.get("country"),
+                    )
+                ]
+            )
+
+        if deferred:
+            geo.get_enrichment_worker().enqueue(ip_addr)
+
+
+class BufferedVisitorLogger(VisitorLogger):
+    """Write-behind logger: visits are queued and persisted in batches.
+
+    ``add`` only appends to a bounded in-process queue, so the request thread
+    never touches the database or the geo lookup. A daemon worker drains the
+    queue and writes each batch with bulk inserts. When the queue is full the
+    ``drop_policy`` decides what happens:
 
-        if should_increment_visits:
-            update_kwargs["no_of_visits"] = F("no_of_visits") + 1
+    * ``"drop_newest"`` discards the incoming visit,
+    * ``"drop_oldest"`` evicts the oldest queued visit to make room,
+    * ``"block"`` waits up to ``block_timeout`` seconds, then drops.
+    """
 
-        People.objects.filter(pk=person.pk).update(**update_kwargs)
-        person.refresh_from_db()
+    DROP_POLICIES = ("drop_newest", "drop_oldest", "block")
 
-        Visit_detail.objects.create(
-            people=person,
+    def __init__(
+        self,
+        max_queue_size: int = 1000,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        drop_policy: str = "drop_newest",
+        block_timeout: float = 0.05,
+        autostart: bool = True,
+    ) -> None:
+        if drop_policy not in self.DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy!r}")
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self.autostart = autostart
+        self.dropped = 0
+
+        self._queue: "queue.Queue[VisitRecord]" = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+
+    async def aadd(self, ip_addr: str, user_agent: str, feedback: Optional[Mapping[str, str]] = None) -> None:
+        if self.drop_policy == "block":
+            # Waiting for room in the queue would stall the event loop.
+            await super().aadd(ip_addr, user_agent, feedback)
+        else:
+            self.add(ip_addr, user_agent, feedback)
+
+    def record(self, ip_addr: str, user_agent: str, feedback: Optional[Mapping[str, str]]) -> None:
+        record = VisitRecord(
+            ip_address=ip_addr,
             user_agent=user_agent,
-            name=feedback_payload.name,
-            email_id=feedback_payload.email,
-            message=feedback_payload.message,
+            feedback=Feedback.from_mapping(feedback),
         )
+        if self.autostart:
+            self.start()
+        self._enqueue(record)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _enqueue(self, record: VisitRecord) -> None:
+        if self.drop_policy == "block":
+            try:
+                self._queue.put(record, timeout=self.block_timeout)
+            except queue.Full:
+                self._record_drop()
+            return
+
+        while True:
+            try:
+                self._queue.put_nowait(record)
+                return
+            except queue.Full:
+                if self.drop_policy == "drop_newest":
+                    self._record_drop()
+                    return
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self._record_drop()
+
+    def _record_drop(self) -> None:
+        with self._lock:
+            self.dropped += 1
+
+    def start(self) -> None:
+        """Start the background worker if it is not already running."""
+
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._stop.clear()
+            self._worker = threading.Thread(
+                target=self._run, name="visitor-logger", daemon=True
+            )
+            self._worker.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        """Stop the worker and persist everything still queued."""
+
+        self._stop.set()
+        worker = self._worker
+        if worker is not None and worker is not threading.current_thread():
+            worker.join(timeout)
+        self._worker = None
+        self.flush()
+
+    def flush(self) -> int:
+        """Drain the queue on the calling thread; return the number written."""
+
+        written = 0
+        while True:
+            batch = self._take(self.batch_size)
+            if not batch:
+                return written
+            self._write_safely(batch)
+            written += len(batch)
+
+    def _take(self, limit: int, timeout: Optional[float] = None) -> List[VisitRecord]:
+        batch: List[VisitRecord] = []
+        try:
+            if timeout is None:
+                batch.append(self._queue.get_nowait())
+            else:
+                batch.append(self._queue.get(timeout=timeout))
+        except queue.Empty:
+            return batch
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._take(self.batch_size, timeout=self.flush_interval)
+            if batch:
+                close_old_connections()
+                self._write_safely(batch)
+        close_old_connections()
+
+    def _write_safely(self, batch: List[VisitRecord]) -> None:
+        try:
+            self.write_batch(batch)
+        except Exception:
+            log.exception("Failed to persist %d queued visits", len(batch))
+
+    def write_batch(self, records: Iterable[VisitRecord]) -> None:
+        """Persist ``records`` with one upsert of ``People`` per address and one bulk insert of details."""
+
+        records = sorted(records, key=lambda record: record.visit_time)
+        if not records:
+            return
+
+        visits: Dict[str, List[datetime]] = {}
+        for record in records:
+            visits.setdefault(record.ip_address, []).append(record.visit_time)
+        ips = set(visits)
+        deferred = geo.is_deferred()
+        if deferred:
+            locations = {}
+        else:
+            locations = {ip: Utility.get_location_via_ip(ip) for ip in ips}
+
+        with transaction.atomic():
+            people: Dict[str, People] = {}
+            # A fixed order, so concurrent writers lock rows in the same sequence.
+            for ip, times in sorted(visits.items()):
+                # The first visit goes through the same atomic upsert as add();
+                # the address's later visits in the batch are counted against it.
+                person = upsert_visitor(ip, times[0], self.cooldown)
+                if len(times) > 1:
+                    counted = sum(
+                        1 for previous, visited in zip(times, times[1:])
+                        if visited - previous >= self.cooldown
+                    )
+                    People.objects.filter(pk=person.pk).update(
+                        no_of_visits=F("no_of_visits") + counted,
+                        last_visited=Greatest(F("last_visited"), times[-1]),
+                    )
+                    person.no_of_visits += counted
+                    person.last_visited = max(person.last_visited, times[-1])
+                people[ip] = person
+
+            details = []
+            for record in records:
+                location = locations.get(record.ip_address) or {}
+                details.append(
+                    Visit_detail(
+                        people=people[record.ip_address],
+                        user_agent=record.user_agent,
+                        name=record.feedback.name,
+                        email_id=record.feedback.email,
+                        message=record.feedback.message,
+                        visit_time=record.visit_time,
+                        city=location.get("city"),
+                        region=location.get("region"),
+                        country=location.get("country"),
+                    )
+                )
+            Visit_detail.objects.bulk_create(details)
+
+        if deferred:
+            worker = geo.get_enrichment_worker()
+            for ip in ips:
+                worker.enqueue(ip)
+
+
+def get_visitor_logger() -> VisitorLogger:
+    """Build the logger configured by ``VISITOR_LOGGER`` / ``VISITOR_LOGGER_OPTIONS``."""
+
+    logger_class = import_string(
+        getattr(settings, "VISITOR_LOGGER", "mainPage.log.VisitorLogger")
+    )
+    return logger_class(**getattr(settings, "VISITOR_LOGGER_OPTIONS", {}))
 
 
 # Backwards compatibility with the historic class name.
 logger = VisitorLogger
-
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mainPage.retention import get_policies, purge
+
+
+class Command(BaseCommand):
+    help = "Archive and delete log rows that RETENTION_POLICIES expire."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "labels", nargs="*", metavar="app_label.Model",
+            help="Only apply these policies (default: all of them).",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Only report how many rows would be deleted.",
+        )
+        parser.add_argument(
+            "--no-archive", action="store_true",
+            help="Delete expired rows without writing them to an archive file.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=None,
+            help="Rows deleted per transaction (default: RETENTION_BATCH_SIZE).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            policies = get_policies(options["labels"] or None)
+        except KeyError as exc:
+            raise CommandError(exc.args[0])
+
+        for policy in policies:
+            report = purge(
+                policy,
+                dry_run=options["dry_run"],
+                archive=not options["no_archive"],
+                batch_size=options["batch_size"],
+            )
+            if options["dry_run"]:
+                self.stdout.write(f"{report.label}: {report.expired} rows would be deleted.")
+                continue
+            message = (
+                f"{report.label}: deleted {report.deleted} rows in {report.batches} batches, "
+                f"{report.elapsed:.2f}s ({report.rate:.0f} rows/s)"
+            )
+            if report.archive:
+                message += f", archived to {report.archive}"
+            self.stdout.write(self.style.SUCCESS(message + "."))
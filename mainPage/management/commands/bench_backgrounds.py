@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mainPage.models import Background_img, Portfolio
+from mainPage.sampler import BackgroundSampler
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ORDER BY RANDOM() with the in-memory background sampler. "
+        "Rows are inserted inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--iterations", type=int, default=1000)
+
+    def _time(self, label, iterations, pick):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            pick()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{label:<18} {elapsed / iterations * 1e6:10.1f} us/pick")
+
+    def handle(self, *args, **options):
+        rows, iterations = options["rows"], options["iterations"]
+        with transaction.atomic():
+            portfolio = Portfolio.objects.create(title_text="bench", name_content="bench")
+            Background_img.objects.bulk_create(
+                [
+                    Background_img(portfolio=portfolio, image=f"mainPage/background_img/bench_{n}.jpg")
+                    for n in range(rows)
+                ],
+                batch_size=500,
+            )
+            self.stdout.write(f"{Background_img.objects.count()} backgrounds, {iterations} picks each")
+
+            self._time("order_by('?')", iterations, lambda: Background_img.objects.order_by("?").first())
+
+            sampler = BackgroundSampler(ttl=float("inf"))
+            started = time.perf_counter()
+            sampler.entries()
+            self.stdout.write(f"{'sampler load':<18} {(time.perf_counter() - started) * 1e3:10.1f} ms (once)")
+            self._time("sampler", iterations, sampler.choice)
+
+            transaction.set_rollback(True)
@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageOps
+
+from mainPage.compression import JPEG_QUALITY, MAX_DIMENSION, compress_file
+
+
+def _compress_in_memory(path, destination):
+    """The previous path: full-size decode, output collected in a buffer."""
+
+    with open(path, "rb") as handle:
+        data = handle.read()
+    with Image.open(BytesIO(data)) as source:
+        processed = ImageOps.exif_transpose(source).convert("RGB")
+        buffer = BytesIO()
+        processed.save(buffer, format="JPEG", optimize=True, quality=JPEG_QUALITY)
+    with open(destination, "wb") as handle:
+        handle.write(buffer.getvalue())
+
+
+def _memory_status(field):
+    # VmHWM is this address space's own peak; ru_maxrss also inherits the
+    # peak of the (large) parent that spawned the worker.
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure(path, destination, streaming, max_dimension):
+    """Run one compression in this (fresh) process; return seconds and peak RSS growth in KiB."""
+
+    baseline = _memory_status("VmRSS")
+    started = time.perf_counter()
+    if streaming:
+        compress_file(path, destination, max_dimension)
+    else:
+        _compress_in_memory(path, destination)
+    elapsed = time.perf_counter() - started
+    return elapsed, _memory_status("VmHWM") - baseline
+
+
+def _write_sample(path, megapixels):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    # Noise over a gradient compresses roughly like a photo.
+    noise = Image.effect_noise((width, height), 48)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    Image.merge("RGB", (noise, gradient, Image.blend(noise, gradient, 0.5))).save(
+        path, format="JPEG", quality=90
+    )
+    return width, height
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare peak memory and latency of the in-memory and the streaming, "
+        "draft-mode image compression across upload sizes. Each run uses a "
+        "fresh process so its peak RSS is measured in isolation."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--megapixels", type=float, nargs="+", default=[2, 12, 24, 48],
+            help="Sizes of the synthetic JPEG uploads.",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument(
+            "--max-dimension", type=int,
+            default=getattr(settings, "IMAGE_MAX_DIMENSION", MAX_DIMENSION),
+        )
+
+    def _run(self, context, *args):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            return pool.submit(_measure, *args).result()
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context("spawn")
+        max_dimension = options["max_dimension"]
+        self.stdout.write(
+            f"{'upload':<20} {'path':<10} {'median ms':>10} {'peak RSS MiB':>13} {'output KiB':>11}"
+        )
+        with TemporaryDirectory() as tmpdir:
+            for megapixels in options["megapixels"]:
+                source = os.path.join(tmpdir, f"{megapixels}mp.jpg")
+                width, height = _write_sample(source, megapixels)
+                label = f"{width}x{height}"
+                for name, streaming in (("in-memory", False), ("streaming", True)):
+                    destination = os.path.join(tmpdir, f"{megapixels}mp-{name}.jpg")
+                    runs = [
+                        self._run(context, source, destination, streaming, max_dimension)
+                        for _ in range(options["repeat"])
+                    ]
+                    latency = sorted(elapsed for elapsed, _ in runs)[len(runs) // 2]
+                    peak = max(rss for _, rss in runs)
+                    self.stdout.write(
+                        f"{label:<20} {name:<10} {latency * 1000:10.1f} {peak / 1024:13.1f} "
+                        f"{os.path.getsize(destination) / 1024:11.1f}"
+                    )
@@ -0,0 +1,87 @@
+import ipaddress
+import os
+import random
+import time
+from tempfile import TemporaryDirectory
+
+from django.core.management.base import BaseCommand
+
+from mainPage.geo import DbIpCityBackend
+from mainPage.geoindex import GeoIndex
+
+
+def _synthetic_rows(count, seed):
+    """Non-overlapping IPv4 ranges plus a few IPv6 ones, with repeated locations."""
+
+    rng = random.Random(seed)
+    starts = sorted(rng.sample(range(1 << 24, 0xDFFFFFFF, 256), count))
+    places = [(f"City {n}", f"Region {n % 50}", f"C{n % 200}") for n in range(2000)]
+    rows = [(4, start, start + 255, rng.choice(places)) for start in starts]
+    base = int(ipaddress.ip_address("2001:db8::"))
+    rows += [
+        (6, base + (n << 80), base + ((n + 1) << 80) - 1, rng.choice(places))
+        for n in range(count // 10)
+    ]
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Compare the offline geo index against the remote per-call lookup."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index", help="Binary index to benchmark (default: synthetic).")
+        parser.add_argument("--ranges", type=int, default=200000, help="Synthetic range count.")
+        parser.add_argument("--lookups", type=int, default=100000)
+        parser.add_argument(
+            "--remote", type=int, default=0,
+            help="Also time this many calls to the remote db-ip.com API.",
+        )
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"] + 1)
+        with TemporaryDirectory() as tmpdir:
+            path = options["index"]
+            if not path:
+                path = os.path.join(tmpdir, "bench.idx")
+                started = time.perf_counter()
+                GeoIndex.build(_synthetic_rows(options["ranges"], options["seed"])).save(path)
+                self.stdout.write(f"built synthetic index in {time.perf_counter() - started:.2f}s")
+
+            started = time.perf_counter()
+            index = GeoIndex.open(path)
+            self.stdout.write(
+                f"opened {len(index)} ranges ({os.path.getsize(path)} bytes) "
+                f"in {(time.perf_counter() - started) * 1000:.2f}ms"
+            )
+
+            addresses = [
+                str(ipaddress.IPv4Address(rng.randrange(1 << 24, 0xDFFFFFFF)))
+                for _ in range(options["lookups"])
+            ]
+            hits = 0
+            started = time.perf_counter()
+            for address in addresses:
+                if index.lookup(address):
+                    hits += 1
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"index:  {elapsed / len(addresses) * 1e6:8.2f} us/lookup "
+                f"({len(addresses) / elapsed:,.0f} lookups/s, {hits} hits)"
+            )
+            del index
+
+        if options["remote"]:
+            backend = DbIpCityBackend()
+            failures = 0
+            started = time.perf_counter()
+            for address in addresses[: options["remote"]]:
+                try:
+                    backend.lookup(address)
+                except Exception:
+                    failures += 1
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"remote: {elapsed / options['remote'] * 1e6:8.2f} us/lookup "
+                f"({failures} failures)"
+            )
@@ -0,0 +1,127 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from admin_honeypot.models import LoginAttempt
+from mainPage.models import People, Visit_detail
+
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed visits and login attempts, then report the query plans and timings "
+        "of the admin and logger queries without and with the model indexes. "
+        "Everything runs inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--visits", type=int, default=1_000_000)
+        parser.add_argument("--people", type=int, default=50_000)
+        parser.add_argument("--attempts", type=int, default=100_000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def _seed(self, options):
+        rng = random.Random(options["seed"])
+        now = timezone.now()
+        span = 365 * 24 * 60 * 60
+
+        People.objects.bulk_create(
+            (
+                People(
+                    ip_address=f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}",
+                    no_of_visits=rng.randint(1, 50),
+                    last_visited=now - timedelta(seconds=rng.randrange(span)),
+                )
+                for n in range(options["people"])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        people = list(People.objects.values_list("pk", flat=True))
+        countries = ["IN", "US", "DE", "GB", None]
+
+        remaining = options["visits"]
+        while remaining:
+            count = min(remaining, BATCH_SIZE)
+            Visit_detail.objects.bulk_create(
+                Visit_detail(
+                    people_id=rng.choice(people),
+                    user_agent="Mozilla/5.0",
+                    name="Visitor",
+                    email_id="anonymous@example.com",
+                    visit_time=now - timedelta(seconds=rng.randrange(span)),
+                    country=rng.choice(countries),
+                )
+                for _ in range(count)
+            )
+            remaining -= count
+
+        LoginAttempt.objects.bulk_create(
+            (
+                LoginAttempt(username="admin", ip_address=f"192.0.2.{rng.randrange(256)}")
+                for _ in range(options["attempts"])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        return rng.choice(people), now
+
+    def _queries(self, person, now):
+        day = now - timedelta(days=7)
+        return [
+            ("visits, newest first", lambda: Visit_detail.objects.select_related("people").order_by("-visit_time")[:100]),
+            ("visits of one visitor", lambda: Visit_detail.objects.filter(people_id=person).order_by("-visit_time")),
+            ("visits of one day", lambda: Visit_detail.objects.filter(visit_time__gte=day, visit_time__lt=day + timedelta(days=1))),
+            ("unresolved visits of one visitor", lambda: Visit_detail.objects.filter(people_id=person, country__isnull=True)),
+            ("people by last visit", lambda: People.objects.order_by("-last_visited")[:100]),
+            ("people with 10 visits", lambda: People.objects.filter(no_of_visits=10)),
+            ("login attempts by time", lambda: LoginAttempt.objects.order_by("timestamp")[:100]),
+            ("login attempts from one IP", lambda: LoginAttempt.objects.filter(ip_address="192.0.2.7")),
+        ]
+
+    def _indexes(self):
+        for model in (People, Visit_detail, LoginAttempt):
+            for index in model._meta.indexes:
+                yield model, index
+
+    def _run(self, label, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        for name, build in queries:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(build())
+                timings.append(time.perf_counter() - started)
+            plan = build().explain().replace("\n", " | ")
+            self.stdout.write(f"  {name:<34} {statistics.median(timings) * 1000:9.2f} ms  {plan}")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started = time.perf_counter()
+            person, now = self._seed(options)
+            self.stdout.write(
+                f"seeded {Visit_detail.objects.count()} visits, {People.objects.count()} people and "
+                f"{LoginAttempt.objects.count()} login attempts in {time.perf_counter() - started:.1f}s"
+            )
+            queries = self._queries(person, now)
+
+            # Statements rather than the schema editor, which SQLite does not
+            # allow inside a transaction; the rollback restores the indexes.
+            editor = connection.schema_editor()
+            with connection.cursor() as cursor:
+                for model, index in self._indexes():
+                    cursor.execute(str(index.remove_sql(model, editor)))
+                self._run("without indexes", queries, options["repeat"])
+                for model, index in self._indexes():
+                    cursor.execute(str(index.create_sql(model, editor)))
+                if connection.vendor in ("sqlite", "postgresql"):
+                    cursor.execute("ANALYZE")
+            self._run("with indexes", queries, options["repeat"])
+
+            transaction.set_rollback(True)
@@ -0,0 +1,99 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+
+AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0"
+
+# Environment of each database mode; the SQLite ones get a fresh file.
+MODES = {
+    "sqlite": {"SQLITE_TUNED": "0"},
+    "sqlite-tuned": {"SQLITE_TUNED": "1"},
+    "postgres": {},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure page views per second with concurrent worker processes, "
+        "like gunicorn workers, for each database mode. Every view records a "
+        "visit from a private address, so no geo lookups are made. The "
+        "postgres mode uses the POSTGRES_* environment and writes to it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "modes", nargs="*",
+            help=f"Database modes to compare: {', '.join(MODES)} (default: sqlite sqlite-tuned).",
+        )
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--requests", type=int, default=500, help="Page views per worker.")
+        parser.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["worker"] is not None:
+            return self._work(options["worker"], options["requests"])
+
+        modes = options["modes"] or ["sqlite", "sqlite-tuned"]
+        unknown = [mode for mode in modes if mode not in MODES]
+        if unknown:
+            raise CommandError(f"Unknown mode: {', '.join(unknown)}")
+        for mode in modes:
+            with TemporaryDirectory() as tmpdir:
+                env = {**os.environ, **MODES[mode]}
+                if mode == "postgres":
+                    if not env.get("POSTGRES_DB"):
+                        self.stderr.write("postgres: skipped, POSTGRES_DB is not set")
+                        continue
+                else:
+                    env.pop("POSTGRES_DB", None)
+                    env["SQLITE_PATH"] = os.path.join(tmpdir, "bench.sqlite3")
+                self._measure(mode, env, options["workers"], options["requests"])
+
+    def _manage(self, *args):
+        return [sys.executable, os.path.join(settings.BASE_DIR, "manage.py"), *args]
+
+    def _measure(self, mode, env, workers, requests):
+        subprocess.run(self._manage("migrate", "-v0"), env=env, check=True)
+        started = time.perf_counter()
+        processes = [
+            subprocess.Popen(
+                self._manage("bench_load", "--worker", str(n), "--requests", str(requests)),
+                env=env,
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            for n in range(workers)
+        ]
+        failures = 0
+        for process in processes:
+            output, _ = process.communicate()
+            failures += int(output.strip() or requests)
+        elapsed = time.perf_counter() - started
+        total = workers * requests
+        self.stdout.write(
+            f"{mode:<14} {total / elapsed:8.1f} views/s  {total} views by {workers} workers "
+            f"in {elapsed:.2f}s, {failures} failed"
+        )
+
+    def _work(self, worker, requests):
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0], HTTP_USER_AGENT=AGENT)
+        failures = 0
+        for n in range(requests):
+            # A new address every fifth view, so both inserts and updates happen.
+            address = f"10.{worker}.{n // 5 >> 8 & 255}.{n // 5 & 255}"
+            try:
+                response = client.get("/", REMOTE_ADDR=address)
+            except Exception:
+                failures += 1
+                continue
+            if response.status_code != 200:
+                failures += 1
+        self.stdout.write(str(failures))
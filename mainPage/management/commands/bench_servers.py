@@ -0,0 +1,171 @@
+import asyncio
+import importlib.util
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0"
+SERVERS = ("uvicorn", "gunicorn")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    keep_alive = headers.get("connection", "").lower() != "close"
+    return status, keep_alive
+
+
+async def _client(port, path, deadline, worker, latencies, errors):
+    reader = writer = None
+    n = 0
+    while time.monotonic() < deadline:
+        # Private addresses, so visits are recorded without geo lookups.
+        address = f"10.{worker >> 8 & 255}.{worker & 255}.{n % 250 + 1}"
+        request = (
+            f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nUser-Agent: {AGENT}\r\n"
+            f"X-Forwarded-For: {address}\r\n\r\n"
+        ).encode()
+        n += 1
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await _read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            errors.append(None)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            continue
+        latencies.append(time.perf_counter() - started)
+        if status != 200:
+            errors.append(status)
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _load(port, path, concurrency, duration):
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    await asyncio.gather(
+        *(_client(port, path, deadline, worker, latencies, errors) for worker in range(concurrency))
+    )
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests per second of the site under uvicorn (ASGI, async "
+        "views) and gunicorn (WSGI, sync views) at high concurrency. Each "
+        "server gets a fresh SQLite database; uvicorn and gunicorn must be "
+        "installed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("servers", nargs="*", help="uvicorn and/or gunicorn (default: both).")
+        parser.add_argument("--path", default="/", help="URL to request, e.g. / or /getImg/ab.")
+        parser.add_argument("--concurrency", type=int, default=200)
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per server.")
+        parser.add_argument("--workers", type=int, default=4, help="Server worker processes.")
+        parser.add_argument("--threads", type=int, default=1, help="Threads per gunicorn worker.")
+
+    def handle(self, *args, **options):
+        servers = options["servers"] or list(SERVERS)
+        for server in servers:
+            if server not in SERVERS:
+                raise CommandError(f"Unknown server: {server}")
+            if importlib.util.find_spec(server) is None:
+                raise CommandError(f"{server} is not installed")
+
+        for server in servers:
+            with TemporaryDirectory() as tmpdir:
+                env = {**os.environ, "SQLITE_PATH": os.path.join(tmpdir, "bench.sqlite3")}
+                env.pop("POSTGRES_DB", None)
+                manage = os.path.join(settings.BASE_DIR, "manage.py")
+                subprocess.run([sys.executable, manage, "migrate", "-v0"], env=env, check=True)
+                self._measure(server, env, options)
+
+    def _command(self, server, port, options):
+        if server == "uvicorn":
+            return [
+                sys.executable, "-m", "uvicorn", "portfolio.asgi:application",
+                "--port", str(port), "--workers", str(options["workers"]),
+                "--log-level", "warning", "--no-access-log",
+            ]
+        return [
+            sys.executable, "-m", "gunicorn", "portfolio.wsgi:application",
+            "--bind", f"127.0.0.1:{port}", "--workers", str(options["workers"]),
+            "--threads", str(options["threads"]), "--log-level", "warning",
+        ]
+
+    def _wait_until_ready(self, port, process, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"server exited with status {process.returncode}")
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError("server did not start")
+
+    def _measure(self, server, env, options):
+        port = _free_port()
+        process = subprocess.Popen(
+            self._command(server, port, options), cwd=settings.BASE_DIR, env=env
+        )
+        try:
+            self._wait_until_ready(port, process)
+            # Warm the page cache and the workers before measuring.
+            asyncio.run(_load(port, options["path"], options["workers"], 1.0))
+            latencies, errors = asyncio.run(
+                _load(port, options["path"], options["concurrency"], options["duration"])
+            )
+        finally:
+            process.terminate()
+            process.wait(10)
+
+        if not latencies:
+            self.stdout.write(f"{server:<9} no successful requests, {len(errors)} errors")
+            return
+        latencies.sort()
+        self.stdout.write(
+            f"{server:<9} {len(latencies) / options['duration']:8.1f} req/s  "
+            f"p50 {statistics.median(latencies) * 1000:7.1f} ms  "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:7.1f} ms  "
+            f"{len(errors)} errors at concurrency {options['concurrency']}"
+        )
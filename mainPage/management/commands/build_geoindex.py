@@ -0,0 +1,34 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from mainPage.geoindex import GeoIndex, read_csv
+
+
+class Command(BaseCommand):
+    help = (
+        "Build a memory-mappable geo index from a CSV of "
+        "network,city,region,country (or start,end,city,region,country) rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="CSV file with IPv4/IPv6 ranges.")
+        parser.add_argument("output", help="Where to write the binary index.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = read_csv(options["source"])
+        index = GeoIndex.build(rows)
+
+        temporary = options["output"] + ".tmp"
+        index.save(temporary)
+        os.replace(temporary, options["output"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {len(index)} ranges into {options['output']} "
+                f"({os.path.getsize(options['output'])} bytes) "
+                f"in {time.perf_counter() - started:.2f}s."
+            )
+        )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from mainPage.geo import enrich_visits
+from mainPage.models import Visit_detail
+
+
+class Command(BaseCommand):
+    help = "Resolve the location of visits that were saved without one."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit", type=int, default=None,
+            help="Only resolve this many distinct IP addresses.",
+        )
+
+    def handle(self, *args, **options):
+        ips = (
+            Visit_detail.objects.filter(country__isnull=True)
+            .values_list("people__ip_address", flat=True)
+            .distinct()
+        )
+        if options["limit"]:
+            ips = ips[: options["limit"]]
+
+        resolved = 0
+        updated = 0
+        for ip_addr in ips:
+            rows = enrich_visits(ip_addr)
+            if rows:
+                resolved += 1
+                updated += rows
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Resolved {resolved} addresses, updated {updated} visits.")
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from admin_honeypot import aggregates
+from admin_honeypot.models import AttackerPath, AttackerStat, LoginAttempt
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the honeypot attacker totals from the stored login attempts, "
+        "e.g. after enabling ADMIN_HONEYPOT_AGGREGATES. Totals of attempts "
+        "already removed by retention are lost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rows = aggregates.rebuild(LoginAttempt.objects.all(), chunk_size=options["chunk_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {AttackerStat.objects.count()} attacker totals and "
+                f"{AttackerPath.objects.count()} path totals from {rows} login attempts."
+            )
+        )
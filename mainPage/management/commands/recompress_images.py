@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from mainPage.imagejobs import SKIPPED, run_job
+from mainPage.models import About, Background_img, ProcessedImage
+
+
+class Command(BaseCommand):
+    help = "Compress stored images that are pending, failed or changed since their last job."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Recompress every image, even those whose hash is unchanged.",
+        )
+
+    def handle(self, *args, **options):
+        counts = {ProcessedImage.DONE: 0, ProcessedImage.FAILED: 0, SKIPPED: 0}
+        for model in (Background_img, About):
+            pks = list(model.objects.values_list("pk", flat=True))
+            for index, pk in enumerate(pks, start=1):
+                status = run_job(model, pk, force=options["force"])
+                counts[status] += 1
+                self.stdout.write(f"{model.__name__} {index}/{len(pks)}: {status}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Compressed {done}, skipped {skipped}, failed {failed}.".format(
+                    done=counts[ProcessedImage.DONE],
+                    skipped=counts[SKIPPED],
+                    failed=counts[ProcessedImage.FAILED],
+                )
+            )
+        )
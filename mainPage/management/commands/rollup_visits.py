@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from mainPage.analytics import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = "Update the hourly and daily visit rollups read by the analytics dashboard."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true",
+            help="Recompute every day from the oldest stored visit.",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=None,
+            help="Keep running, refreshing every this many seconds.",
+        )
+
+    def handle(self, *args, **options):
+        full = options["full"]
+        while True:
+            result = refresh_rollups(full=full)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Rolled up {result.visits} visits over {result.days} days "
+                    f"(up to visit {result.last_visit_id})."
+                )
+            )
+            if not options["interval"]:
+                return
+            full = False
+            close_old_connections()
+            time.sleep(options["interval"])
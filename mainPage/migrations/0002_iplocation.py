@@ -0,0 +1,25 @@
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainPage', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IpLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip_address', models.GenericIPAddressField(unique=True)),
+                ('city', models.CharField(max_length=25, null=True)),
+                ('region', models.CharField(max_length=25, null=True)),
+                ('country', models.CharField(max_length=5, null=True)),
+                ('found', models.BooleanField(default=True)),
+                ('resolved_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainPage', '0003_image_processing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilteredVisit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('reason', models.CharField(max_length=10)),
+                ('hits', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('day', 'reason')},
+            },
+        ),
+    ]
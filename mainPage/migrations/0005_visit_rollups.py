@@ -0,0 +1,51 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainPage', '0004_filteredvisit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_visit_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VisitRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('visits', models.PositiveIntegerField(default=0)),
+                ('unique_ips', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'visit analytics',
+                'verbose_name_plural': 'visit analytics',
+                'ordering': ['-start'],
+                'unique_together': {('period', 'start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='VisitBreakdown',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('dimension', models.CharField(choices=[('country', 'Country'), ('agent', 'User agent family')], max_length=10)),
+                ('value', models.CharField(blank=True, max_length=50)),
+                ('visits', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('period', 'start', 'dimension', 'value')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainPage', '0005_visit_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='visit_detail',
+            name='people',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='mainPage.people'),
+        ),
+        migrations.AddIndex(
+            model_name='people',
+            index=models.Index(fields=['last_visited'], name='people_last_visited_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='people',
+            index=models.Index(fields=['no_of_visits'], name='people_no_of_visits_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit_detail',
+            index=models.Index(fields=['people', 'visit_time'], name='visit_people_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit_detail',
+            index=models.Index(fields=['visit_time'], name='visit_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit_detail',
+            index=models.Index(condition=models.Q(('country__isnull', True)), fields=['people'], name='visit_unresolved_idx'),
+        ),
+    ]
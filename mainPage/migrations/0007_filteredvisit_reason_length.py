@@ -0,0 +1,17 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainPage', '0006_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='filteredvisit',
+            name='reason',
+            field=models.CharField(max_length=32),
+        ),
+    ]
@@ -1,25 +1,65 @@
 from __future__ import annotations
 
 import datetime
-from io import BytesIO
 from typing import Optional
 
 from django.core.exceptions import ValidationError
-from django.core.files import File
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
-from PIL import Image, ImageOps
 
+from mainPage import geo
+from mainPage.singletons import SingletonManager
 from mainPage.utils import Utility
 
 
-def compress(image):
-    with Image.open(image) as source:
-        processed = ImageOps.exif_transpose(source).convert("RGB")
-        buffer = BytesIO()
-        processed.save(buffer, format="JPEG", optimize=True, quality=70)
-    buffer.seek(0)
-    return File(buffer, name=image.name)
+def _reuse_singleton_row(instance, save_kwargs) -> None:
+    """Point a new singleton instance at the existing row so saving updates it."""
+
+    if not instance._state.adding:
+        return
+    current_pk = type(instance).objects.current_pk()
+    if current_pk is not None:
+        instance.pk = current_pk
+        instance._state.adding = False
+        save_kwargs.pop("force_insert", None)
+
+
+class ProcessedImage(models.Model):
+    """Tracks the background compression of a model's ``image`` field.
+
+    Saving a new upload stores it as-is and marks it pending; the job queue in
+    ``mainPage.imagejobs`` compresses it after the transaction commits.
+    """
+
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = [
+        (PENDING, "Pending"),
+        (PROCESSING, "Processing"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    image_hash = models.CharField(max_length=64, blank=True, editable=False)
+    processing_status = models.CharField(
+        "Processing", max_length=10, choices=STATUSES, default=PENDING, editable=False
+    )
+    processing_error = models.TextField(blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        self._image_changed = bool(self.image) and not self.image._committed
+        if self._image_changed:
+            self.processing_status = self.PENDING
+        super().save(*args, **kwargs)
+
+    @property
+    def needs_processing(self) -> bool:
+        return getattr(self, "_image_changed", False) or not self.image_hash
 
 
 class Portfolio(models.Model):
@@ -27,29 +67,32 @@ class Portfolio(models.Model):
     name_content = models.CharField(max_length=50)
     last_updated = models.DateTimeField(default=timezone.now)
 
+    objects = SingletonManager()
 
     def save(self, *args, **kwargs):
         self.last_updated = timezone.now()
-        if self.__class__.objects.count():
-            self.pk = self.__class__.objects.first().pk
+        _reuse_singleton_row(self, kwargs)
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name_content
 
 
-class Background_img(models.Model):
+class Background_img(ProcessedImage):
     portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE)
     image = models.ImageField(upload_to="mainPage/background_img")
 
     @classmethod
     def random(cls) -> Optional["Background_img"]:
-        return cls.objects.order_by("?").first()
+        from mainPage.sampler import background_sampler
 
-    def save(self, *args, **kwargs):
-        new_image = compress(self.image)
-        self.image = new_image
-        super().save(*args, **kwargs)
+        return background_sampler.choice()
+
+    @classmethod
+    async def arandom(cls) -> Optional["Background_img"]:
+        from mainPage.sampler import background_sampler
+
+        return await background_sampler.achoice()
 
     def __str__(self):
         return str(self.image).split('/')[-1]
@@ -68,19 +111,17 @@ class Specialisation(models.Model):
         super().save(*args, **kwargs)
 
 
-class About(models.Model):
+class About(ProcessedImage):
     name = models.CharField(default='about', editable= False, primary_key=True, max_length=5)
     image = models.ImageField(upload_to='mainPage/about_image')
     content = models.TextField(max_length=10000)
     last_updated = models.DateTimeField(default=timezone.now)
 
+    objects = SingletonManager()
 
     def save(self, *args, **kwargs):
         self.last_updated = timezone.now()
-        if self.__class__.objects.count():
-            self.pk = self.__class__.objects.first().pk
-        new_image = compress(self.image)
-        self.image = new_image
+        _reuse_singleton_row(self, kwargs)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -135,6 +176,13 @@ class People(models.Model):
     no_of_visits = models.IntegerField(default=1)
     last_visited = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        # The admin changelist filters and sorts on both.
+        indexes = [
+            models.Index(fields=["last_visited"], name="people_last_visited_idx"),
+            models.Index(fields=["no_of_visits"], name="people_no_of_visits_idx"),
+        ]
+
     def save(self, *args, **kwargs):
         if self.__class__.objects.count():
             self.last_visited = timezone.now()
@@ -145,7 +193,8 @@ class People(models.Model):
 
 
 class Visit_detail(models.Model):
-    people = models.ForeignKey(People, on_delete=models.CASCADE)
+    # Indexed through the leading column of visit_people_time_idx instead.
+    people = models.ForeignKey(People, on_delete=models.CASCADE, db_index=False)
     user_agent = models.CharField(max_length=150)
     name = models.CharField(max_length=25)
     email_id = models.EmailField()
@@ -155,7 +204,29 @@ class Visit_detail(models.Model):
     region = models.CharField(max_length=25, null=True)
     country = models.CharField(max_length=5, null=True)
 
+    class Meta:
+        indexes = [
+            # A visitor's visits, newest first (the People admin inline).
+            models.Index(fields=["people", "visit_time"], name="visit_people_time_idx"),
+            # Admin ordering, analytics day ranges and retention cutoffs.
+            models.Index(fields=["visit_time"], name="visit_time_idx"),
+            # Visits still waiting for deferred geo enrichment.
+            models.Index(
+                fields=["people"],
+                condition=models.Q(country__isnull=True),
+                name="visit_unresolved_idx",
+            ),
+        ]
+
     def save(self, *args, **kwargs):
+        if geo.is_deferred():
+            super().save(*args, **kwargs)
+            if self.country is None:
+                # The worker must find the row, so not before it is committed.
+                ip_addr = self.people.ip_address
+                transaction.on_commit(lambda: geo.get_enrichment_worker().enqueue(ip_addr))
+            return
+
         location = Utility.get_location_via_ip(self.people.ip_address)
         if location:
             self.city = location.get("city")
@@ -171,6 +242,89 @@ class Visit_detail(models.Model):
     
     get_people_ip.admin_order_field = "people__ip_address"
     get_people_ip.short_description = "IP Address"
-    
 
-            
\ No newline at end of file
+
+class FilteredVisit(models.Model):
+    """Daily count of visits that were not recorded (see ``mainPage.traffic``)."""
+
+    day = models.DateField()
+    reason = models.CharField(max_length=32)
+    hits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [("day", "reason")]
+
+    def __str__(self):
+        return f"{self.day} {self.reason}: {self.hits}"
+
+
+class IpLocation(models.Model):
+    """Persistent geo-IP cache; ``found=False`` rows are negative entries."""
+
+    ip_address = models.GenericIPAddressField(unique=True)
+    city = models.CharField(max_length=25, null=True)
+    region = models.CharField(max_length=25, null=True)
+    country = models.CharField(max_length=5, null=True)
+    found = models.BooleanField(default=True)
+    resolved_at = models.DateTimeField(default=timezone.now)
+
+    def as_location(self) -> Optional[dict]:
+        if not self.found:
+            return None
+        return {"city": self.city, "region": self.region, "country": self.country}
+
+    def __str__(self):
+        return self.ip_address
+
+
+class VisitRollup(models.Model):
+    """Visits and distinct addresses per hour or day (see ``mainPage.analytics``)."""
+
+    HOUR = "hour"
+    DAY = "day"
+    PERIODS = [(HOUR, "Hour"), (DAY, "Day")]
+
+    period = models.CharField(max_length=4, choices=PERIODS)
+    start = models.DateTimeField()
+    visits = models.PositiveIntegerField(default=0)
+    unique_ips = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [("period", "start")]
+        ordering = ["-start"]
+        verbose_name = "visit analytics"
+        verbose_name_plural = "visit analytics"
+
+    def __str__(self):
+        return f"{self.period} {self.start:%Y-%m-%d %H:%M}: {self.visits}"
+
+
+class VisitBreakdown(models.Model):
+    """Visits per country or user-agent family within a rollup bucket."""
+
+    COUNTRY = "country"
+    AGENT = "agent"
+    DIMENSIONS = [(COUNTRY, "Country"), (AGENT, "User agent family")]
+
+    period = models.CharField(max_length=4, choices=VisitRollup.PERIODS)
+    start = models.DateTimeField()
+    dimension = models.CharField(max_length=10, choices=DIMENSIONS)
+    value = models.CharField(max_length=50, blank=True)
+    visits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [("period", "start", "dimension", "value")]
+
+    def __str__(self):
+        return f"{self.period} {self.start:%Y-%m-%d %H:%M} {self.dimension}={self.value}: {self.visits}"
+
+
+class RollupState(models.Model):
+    """How far the rollups have read ``Visit_detail``."""
+
+    name = models.CharField(max_length=50, unique=True)
+    last_visit_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,145 @@
+"""Cache of the rendered portfolio page.
+
+The page only changes when an admin edits the content models, so the HTML is
+rendered once and reused until a ``post_save``/``post_delete`` signal bumps
+the content generation (see ``mainPage.signals``). The CSRF token is the only
+per-visitor part of the page: it is rendered as a placeholder and substituted
+on every request. The hash of the cached HTML is the page's version, which the
+index view uses for its ``ETag``.
+
+The generation lives in the cache itself, so with a shared backend
+(memcached) an edit invalidates the page for every worker at once. It expires
+``PAGE_CACHE_GENERATION_TIMEOUT`` seconds after it is started, so with the
+default per-process locmem backend, where the signal only reaches the worker
+that made the edit, other workers catch up within that time.
+
+The ``a``-prefixed functions are the same for async views. Django's async
+cache methods run the sync ones on a thread; the in-process locmem backend
+never blocks, so it is called directly instead (see ``acache_call``).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import time
+from typing import Awaitable, Callable, Dict, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+
+
+CSRF_PLACEHOLDER = "__csrf_token_placeholder__"
+GENERATION_KEY = "mainPage:content-generation"
+PAGE_KEY = "mainPage:page:{name}:{generation}"
+
+
+def get_cache():
+    return caches[getattr(settings, "PAGE_CACHE_ALIAS", "default")]
+
+
+def cache_timeout() -> int:
+    return getattr(settings, "PAGE_CACHE_TIMEOUT", 24 * 60 * 60)
+
+
+def generation_timeout() -> int:
+    return getattr(settings, "PAGE_CACHE_GENERATION_TIMEOUT", 60)
+
+
+def content_generation() -> int:
+    """Return the current content generation, starting one if none exists."""
+
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = _initial_generation()
+        cache.add(GENERATION_KEY, generation, generation_timeout())
+        generation = cache.get(GENERATION_KEY, generation)
+    return generation
+
+
+async def acache_call(cache, method: str, *args, **kwargs):
+    """Call ``method`` of ``cache`` from async code, awaiting ``a<method>`` if it may block."""
+
+    if isinstance(cache, LocMemCache):
+        return getattr(cache, method)(*args, **kwargs)
+    return await getattr(cache, f"a{method}")(*args, **kwargs)
+
+
+async def acontent_generation() -> int:
+    cache = get_cache()
+    generation = await acache_call(cache, "get", GENERATION_KEY)
+    if generation is None:
+        generation = _initial_generation()
+        await acache_call(cache, "add", GENERATION_KEY, generation, generation_timeout())
+        generation = await acache_call(cache, "get", GENERATION_KEY, generation)
+    return generation
+
+
+def _initial_generation() -> int:
+    # Processes keep objects tagged with a generation (mainPage.singletons),
+    # so a restarted or cleared cache must not count from a number it has
+    # already handed out.
+    return time.time_ns() // 1000
+
+
+def bump_generation() -> None:
+    """Invalidate every cached page rendered from the current content."""
+
+    cache = get_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, _initial_generation(), generation_timeout())
+
+
+def _render_page(template_name: str, context: Dict[str, object]) -> Tuple[str, str]:
+    context["csrf_token"] = CSRF_PLACEHOLDER
+    html = render_to_string(template_name, context)
+    return html, hashlib.sha1(html.encode()).hexdigest()
+
+
+def cached_page(
+    name: str,
+    template_name: str,
+    build_context: Callable[[], Dict[str, object]],
+) -> Tuple[str, str]:
+    """Return ``(html, version)`` of ``template_name``, rendered once per content generation.
+
+    ``html`` still holds the CSRF placeholder (see ``add_csrf_token``) and
+    ``version`` is a hash of it, so it changes with anything the page shows.
+    """
+
+    if not getattr(settings, "PAGE_CACHE_ENABLED", True):
+        return _render_page(template_name, build_context())
+
+    cache = get_cache()
+    key = PAGE_KEY.format(name=name, generation=content_generation())
+    page = cache.get(key)
+    if page is None:
+        page = _render_page(template_name, build_context())
+        cache.set(key, page, cache_timeout())
+    return page
+
+
+async def acached_page(
+    name: str,
+    template_name: str,
+    build_context: Callable[[], Awaitable[Dict[str, object]]],
+) -> Tuple[str, str]:
+    if not getattr(settings, "PAGE_CACHE_ENABLED", True):
+        return _render_page(template_name, await build_context())
+
+    cache = get_cache()
+    key = PAGE_KEY.format(name=name, generation=await acontent_generation())
+    page = await acache_call(cache, "get", key)
+    if page is None:
+        page = _render_page(template_name, await build_context())
+        await acache_call(cache, "set", key, page, cache_timeout())
+    return page
+
+
+def add_csrf_token(request, html: str) -> str:
+    return html.replace(CSRF_PLACEHOLDER, get_token(request))
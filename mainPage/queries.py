@@ -0,0 +1,133 @@
+"""SQL query instrumentation and per-endpoint query budgets.
+
+``QueryRecorder`` records every query run on any database connection of the
+current thread, with its duration, through ``execute_wrapper`` (so it works
+with ``DEBUG = False``). ``QUERY_BUDGETS`` maps URL names (``"mainPage:index"``,
+``"admin:mainPage_visit_detail_changelist"``, ...) to the most queries a
+request to them may run; the tests assert the budgets and
+``QueryBudgetMiddleware`` logs production requests that exceed them.
+
+Connections belong to threads, so under ASGI the recorder is installed on the
+thread that runs the request's thread-sensitive code, which is where the
+async ORM methods run their queries.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RecordedQuery:
+    alias: str
+    sql: str
+    duration: float
+
+
+class QueryRecorder:
+    """Context manager collecting the queries run inside it."""
+
+    def __init__(self) -> None:
+        self.queries: List[RecordedQuery] = []
+        self._stack: Optional[ExitStack] = None
+
+    def __enter__(self) -> "QueryRecorder":
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self._wrapper(connection.alias)))
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stack.close()
+        self._stack = None
+
+    def _wrapper(self, alias: str):
+        def record(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.queries.append(RecordedQuery(alias, sql, time.perf_counter() - started))
+
+        return record
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def duration(self) -> float:
+        return sum(query.duration for query in self.queries)
+
+    def repeated(self, threshold: int = 2) -> Dict[str, int]:
+        """Return statements run at least ``threshold`` times; the usual N+1 signature.
+
+        SQL is compared before parameters are bound, so the same lookup for
+        different rows counts as a repeat.
+        """
+
+        counts = Counter(query.sql for query in self.queries)
+        return {sql: count for sql, count in counts.items() if count >= threshold}
+
+
+def query_budget(view_name: Optional[str]) -> Optional[int]:
+    budgets = getattr(settings, "QUERY_BUDGETS", {})
+    if view_name in budgets:
+        return budgets[view_name]
+    return getattr(settings, "QUERY_BUDGET_DEFAULT", None)
+
+
+class QueryBudgetMiddleware:
+    """Log requests whose query count exceeds their endpoint's budget."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        self._check(request, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        await sync_to_async(recorder.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recorder.__exit__)(None, None, None)
+        self._check(request, recorder)
+        return response
+
+    def _check(self, request, recorder: QueryRecorder) -> None:
+        match = getattr(request, "resolver_match", None)
+        view_name = match.view_name if match else None
+        budget = query_budget(view_name)
+        if budget is not None and recorder.count > budget:
+            log.warning(
+                "%s ran %d queries (budget %d) taking %.1f ms",
+                view_name or request.path,
+                recorder.count,
+                budget,
+                recorder.duration * 1000,
+                extra={"repeated_queries": recorder.repeated()},
+            )
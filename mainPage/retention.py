@@ -0,0 +1,185 @@
+"""Age- and size-based retention of the append-only log tables.
+
+``RETENTION_POLICIES`` maps model labels to a policy: rows whose ``field`` is
+older than ``max_age_days``, and rows beyond the newest ``max_rows``, expire.
+``purge`` removes them in batches of ``RETENTION_BATCH_SIZE`` primary keys,
+each deleted in its own short transaction (optionally followed by a pause of
+``RETENTION_BATCH_PAUSE`` seconds) so the visitor logger is never blocked for
+long. Unless archiving is disabled, every batch is appended to a gzipped JSON
+Lines file under ``RETENTION_ARCHIVE_DIR`` before it is deleted. A policy's
+``archive_fields`` copies values of related rows into each archived record
+(a visit's ``ip_address``), so the archive stays readable once those rows
+are gone too.
+
+Visits are only expired once ``manage.py rollup_visits`` has counted them
+(``after_rollup``), so the analytics dashboard keeps their history.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, Q, QuerySet
+from django.utils import timezone
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    label: str
+    field: str
+    max_age: Optional[timedelta] = None
+    max_rows: Optional[int] = None
+    after_rollup: bool = False
+    # (key, lookup) pairs added to each archived record.
+    archive_fields: Tuple[Tuple[str, str], ...] = ()
+
+    @classmethod
+    def from_setting(cls, label: str, options: dict) -> "RetentionPolicy":
+        max_age_days = options.get("max_age_days")
+        return cls(
+            label=label,
+            field=options["field"],
+            max_age=timedelta(days=max_age_days) if max_age_days is not None else None,
+            max_rows=options.get("max_rows"),
+            after_rollup=options.get("after_rollup", False),
+            archive_fields=tuple(options.get("archive_fields", {}).items()),
+        )
+
+    @property
+    def model(self):
+        return apps.get_model(self.label)
+
+    def expired(self, now: Optional[datetime] = None) -> QuerySet:
+        """Return the rows this policy expires, or none if it sets no limit."""
+
+        queryset = self.model._default_manager.order_by()
+        condition = Q()
+        if self.max_age is not None:
+            cutoff = (now or timezone.now()) - self.max_age
+            condition |= Q(**{f"{self.field}__lt": cutoff})
+        if self.max_rows is not None:
+            # Primary keys follow insertion order in these tables, which keeps
+            # the newest max_rows rows without sorting on the time column.
+            boundary = list(
+                queryset.order_by("-pk").values_list("pk", flat=True)[self.max_rows : self.max_rows + 1]
+            )
+            if boundary:
+                condition |= Q(pk__lte=boundary[0])
+        if not condition:
+            return queryset.none()
+        queryset = queryset.filter(condition)
+        if self.after_rollup:
+            from mainPage.analytics import STATE_NAME
+            from mainPage.models import RollupState
+
+            state = RollupState.objects.filter(name=STATE_NAME).first()
+            queryset = queryset.filter(pk__lte=state.last_visit_id if state else 0)
+        return queryset
+
+
+def get_policies(labels: Optional[List[str]] = None) -> List[RetentionPolicy]:
+    configured = getattr(settings, "RETENTION_POLICIES", {})
+    if labels is None:
+        labels = list(configured)
+    unknown = [label for label in labels if label not in configured]
+    if unknown:
+        raise KeyError(f"No retention policy for {', '.join(unknown)}")
+    return [RetentionPolicy.from_setting(label, configured[label]) for label in labels]
+
+
+@dataclass
+class PurgeReport:
+    label: str
+    expired: int = 0
+    deleted: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+    archive: Optional[Path] = None
+
+    @property
+    def rate(self) -> float:
+        return self.deleted / self.elapsed if self.elapsed else 0.0
+
+
+def _batches(queryset: QuerySet, batch_size: int, extra: Tuple[Tuple[str, str], ...] = ()) -> Iterator[List[dict]]:
+    meta = queryset.model._meta
+    pk_name = meta.pk.attname
+    columns = [column.attname for column in meta.concrete_fields]
+    expressions = {name: F(lookup) for name, lookup in extra}
+    last_pk = None
+    while True:
+        batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(batch.order_by("pk").values(*columns, **expressions)[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1][pk_name]
+
+
+def archive_path(policy: RetentionPolicy, now: datetime) -> Path:
+    directory = Path(getattr(settings, "RETENTION_ARCHIVE_DIR", Path(settings.BASE_DIR) / "archive"))
+    return directory / f"{policy.label}-{now:%Y%m%dT%H%M%S}.jsonl.gz"
+
+
+def purge(
+    policy: RetentionPolicy,
+    dry_run: bool = False,
+    archive: bool = True,
+    batch_size: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> PurgeReport:
+    """Archive and delete the rows ``policy`` expires; with ``dry_run`` only count them."""
+
+    now = now or timezone.now()
+    batch_size = batch_size or getattr(settings, "RETENTION_BATCH_SIZE", 1000)
+    pause = getattr(settings, "RETENTION_BATCH_PAUSE", 0.0)
+    expired = policy.expired(now)
+    report = PurgeReport(label=policy.label)
+    if dry_run:
+        report.expired = expired.count()
+        return report
+
+    pk_name = policy.model._meta.pk.attname
+    started = time.perf_counter()
+    handle = None
+    try:
+        for rows in _batches(expired, batch_size, policy.archive_fields if archive else ()):
+            if archive:
+                if handle is None:
+                    report.archive = archive_path(policy, now)
+                    report.archive.parent.mkdir(parents=True, exist_ok=True)
+                    handle = gzip.open(report.archive, "at", encoding="utf-8")
+                for row in rows:
+                    handle.write(json.dumps(row, cls=DjangoJSONEncoder) + "\n")
+                # A batch is on disk before its rows are gone.
+                handle.flush()
+            with transaction.atomic():
+                deleted, _ = policy.model._default_manager.filter(
+                    pk__in=[row[pk_name] for row in rows]
+                ).delete()
+            report.deleted += deleted
+            report.batches += 1
+            if pause:
+                time.sleep(pause)
+    finally:
+        if handle is not None:
+            handle.close()
+        report.elapsed = time.perf_counter() - started
+    report.expired = report.deleted
+    return report
+
+
+def read_archive(path: Path) -> Iterator[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        for line in handle:
+            yield json.loads(line)
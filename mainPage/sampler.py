@@ -0,0 +1,95 @@
+"""In-memory random sampling of background images.
+
+``ORDER BY RANDOM()`` sorts the whole table on every request. Instead the
+sampler loads ``(pk, portfolio_id, image name)`` for every background once,
+picks from that list in memory and rebuilds model instances from it, so
+serving a background needs no query at all. ``mainPage.signals`` invalidates
+the list when backgrounds change; ``ttl`` bounds how long other processes
+keep serving a stale list, and ``serve_image`` invalidates it as soon as a
+picked file turns out to be missing. Each invalidation starts a new
+generation, and a load that began in an older one is returned but not kept.
+"""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import router
+
+
+Entry = Tuple[int, int, str]
+
+
+class BackgroundSampler:
+    def __init__(self, ttl: float = 300.0) -> None:
+        self.ttl = ttl
+        self._entries: Optional[List[Entry]] = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries = None
+            self._generation += 1
+
+    def _fresh(self) -> Optional[List[Entry]]:
+        entries = self._entries
+        if entries is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return entries
+        return None
+
+    def _store(self, generation: int, entries: List[Entry]) -> None:
+        with self._lock:
+            # Invalidated while loading: the rows read may predate the change.
+            if generation == self._generation:
+                self._entries = entries
+                self._loaded_at = time.monotonic()
+
+    def entries(self) -> List[Entry]:
+        entries = self._fresh()
+        if entries is not None:
+            return entries
+
+        from mainPage.models import Background_img
+
+        generation = self._generation
+        entries = list(Background_img.objects.values_list("pk", "portfolio_id", "image"))
+        self._store(generation, entries)
+        return entries
+
+    async def aentries(self) -> List[Entry]:
+        entries = self._fresh()
+        if entries is not None:
+            return entries
+
+        from mainPage.models import Background_img
+
+        generation = self._generation
+        entries = [entry async for entry in Background_img.objects.values_list("pk", "portfolio_id", "image")]
+        self._store(generation, entries)
+        return entries
+
+    def choice(self):
+        return self._instance(self.entries())
+
+    async def achoice(self):
+        return self._instance(await self.aentries())
+
+    def _instance(self, entries: List[Entry]):
+        from mainPage.models import Background_img
+
+        if not entries:
+            return None
+        return Background_img.from_db(
+            router.db_for_read(Background_img),
+            ["id", "portfolio_id", "image"],
+            random.choice(entries),
+        )
+
+
+background_sampler = BackgroundSampler(ttl=getattr(settings, "BACKGROUND_SAMPLER_TTL", 300.0))
@@ -0,0 +1,80 @@
+"""Signal handlers keeping derived caches in step with the content models."""
+
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django_cleanup.signals import cleanup_pre_delete
+
+from mainPage import imagejobs
+from mainPage.dbtuning import apply_sqlite_pragmas
+from mainPage.imagejobs import image_processed
+from mainPage.imageserve import image_cache
+from mainPage.models import About, Background_img, Blog, Contact, Portfolio, Specialisation
+from mainPage.pagecache import bump_generation
+from mainPage.sampler import background_sampler
+from mainPage.singletons import singleton_cache
+from mainPage.variants import delete_variants, variant_cache
+
+
+PAGE_CONTENT_MODELS = (Portfolio, Specialisation, About, Blog, Contact)
+
+
+def invalidate_page_cache(sender, **kwargs):
+    bump_generation()
+
+
+for model in PAGE_CONTENT_MODELS:
+    post_save.connect(invalidate_page_cache, sender=model)
+    post_delete.connect(invalidate_page_cache, sender=model)
+
+
+def invalidate_singleton(sender, **kwargs):
+    singleton_cache.invalidate(sender)
+
+
+for model in (Portfolio, About):
+    post_save.connect(invalidate_singleton, sender=model)
+    post_delete.connect(invalidate_singleton, sender=model)
+
+
+def invalidate_backgrounds(sender, **kwargs):
+    background_sampler.invalidate()
+
+
+post_save.connect(invalidate_backgrounds, sender=Background_img)
+post_delete.connect(invalidate_backgrounds, sender=Background_img)
+
+
+def invalidate_images(sender, **kwargs):
+    image_cache.clear()
+
+
+for model in (Background_img, About):
+    post_save.connect(invalidate_images, sender=model)
+    post_delete.connect(invalidate_images, sender=model)
+
+
+def process_image(sender, instance, **kwargs):
+    if instance.needs_processing:
+        imagejobs.enqueue(instance)
+
+
+def refresh_processed_image(sender, instance, **kwargs):
+    image_cache.clear()
+    variant_cache.invalidate(instance.image.name)
+    bump_generation()
+    singleton_cache.invalidate(sender)
+    if sender is Background_img:
+        background_sampler.invalidate()
+
+
+def remove_image_variants(sender, file, **kwargs):
+    delete_variants(file.storage, file.name)
+
+
+for model in (Background_img, About):
+    post_save.connect(process_image, sender=model)
+    image_processed.connect(refresh_processed_image, sender=model)
+cleanup_pre_delete.connect(remove_image_variants)
+
+
+connection_created.connect(apply_sqlite_pragmas)
@@ -0,0 +1,118 @@
+"""Process-wide cache of the single-row models (``Portfolio`` and ``About``).
+
+The index page and ``serve_image`` need the current row of each singleton on
+every request. ``SingletonManager.current()`` keeps it in process memory,
+tagged with the content generation from ``mainPage.pagecache``: any content
+edit bumps the generation, so a stale row is reloaded at most once per edit
+(and across workers too when the page cache is shared). Entries are also
+dropped after ``SINGLETON_CACHE_TIMEOUT`` seconds, so a worker that misses an
+edit, e.g. one made by another worker, serves the old row for no longer. With
+``SINGLETON_CACHE_ALIAS`` set, a freshly started worker takes the row from
+that cache backend instead of the database.
+
+The cached instance is shared between requests and must be treated as
+read-only.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models
+
+from mainPage.pagecache import acache_call, acontent_generation, cache_timeout, content_generation
+
+
+MISSING = object()
+SHARED_KEY = "mainPage:singleton:{label}:{generation}"
+
+
+def _max_age() -> float:
+    return getattr(settings, "SINGLETON_CACHE_TIMEOUT", 60)
+
+
+def _shared_cache():
+    alias = getattr(settings, "SINGLETON_CACHE_ALIAS", None)
+    return caches[alias] if alias else None
+
+
+class SingletonCache:
+    def __init__(self) -> None:
+        self._entries: Dict[type, Tuple[int, float, Optional[models.Model]]] = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, model: Optional[type] = None) -> None:
+        with self._lock:
+            if model is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(model, None)
+
+    def _fresh_entry(self, model: type, generation: int):
+        entry = self._entries.get(model)
+        if entry is None or entry[0] != generation or time.monotonic() - entry[1] >= _max_age():
+            return None
+        return entry
+
+    def get(self, model: type) -> Optional[models.Model]:
+        generation = content_generation()
+        entry = self._fresh_entry(model, generation)
+        if entry is not None:
+            return entry[2]
+
+        shared = _shared_cache()
+        key = SHARED_KEY.format(label=model._meta.label_lower, generation=generation)
+        instance = shared.get(key, MISSING) if shared is not None else MISSING
+        if instance is MISSING:
+            instance = model._default_manager.order_by("pk").first()
+            if shared is not None:
+                shared.set(key, instance, cache_timeout())
+
+        with self._lock:
+            self._entries[model] = (generation, time.monotonic(), instance)
+        return instance
+
+    async def aget(self, model: type) -> Optional[models.Model]:
+        generation = await acontent_generation()
+        entry = self._fresh_entry(model, generation)
+        if entry is not None:
+            return entry[2]
+
+        shared = _shared_cache()
+        key = SHARED_KEY.format(label=model._meta.label_lower, generation=generation)
+        instance = await acache_call(shared, "get", key, MISSING) if shared is not None else MISSING
+        if instance is MISSING:
+            instance = await model._default_manager.order_by("pk").afirst()
+            if shared is not None:
+                await acache_call(shared, "set", key, instance, cache_timeout())
+
+        with self._lock:
+            self._entries[model] = (generation, time.monotonic(), instance)
+        return instance
+
+
+singleton_cache = SingletonCache()
+
+
+class SingletonManager(models.Manager):
+    def current(self) -> Optional[models.Model]:
+        """Return the model's single row (or ``None``), usually without a query."""
+
+        return singleton_cache.get(self.model)
+
+    async def acurrent(self) -> Optional[models.Model]:
+        return await singleton_cache.aget(self.model)
+
+    def current_pk(self):
+        """Return the primary key new saves must reuse, or ``None`` if there is no row."""
+
+        instance = self.current()
+        if instance is None:
+            # A cached "no row" may predate a save in another worker, and
+            # trusting it would insert a second row; re-check the table.
+            return self.order_by("pk").values_list("pk", flat=True).first()
+        return instance.pk
@@ -0,0 +1,51 @@
+"""Fire-and-forget work started from async views.
+
+``spawn`` schedules a coroutine on the running event loop and keeps a
+reference to its task until it finishes (the loop itself only keeps weak
+ones). ``run_in_thread`` wraps blocking work such as visitor logging, so it
+runs on the default executor with its own database connection and failures
+are logged instead of lost with the task.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Set
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+log = logging.getLogger(__name__)
+
+_tasks: Set[asyncio.Task] = set()
+
+
+def spawn(awaitable: Awaitable) -> asyncio.Task:
+    task = asyncio.ensure_future(awaitable)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+def _call_logged(func: Callable, *args, **kwargs) -> None:
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        log.exception("Background task %s failed", getattr(func, "__qualname__", func))
+    finally:
+        close_old_connections()
+
+
+def run_in_thread(func: Callable, *args, **kwargs) -> asyncio.Task:
+    """Run blocking ``func`` in a worker thread without waiting for it."""
+
+    return spawn(sync_to_async(_call_logged, thread_sensitive=False)(func, *args, **kwargs))
+
+
+async def drain() -> None:
+    """Wait for every spawned task, including ones spawned meanwhile."""
+
+    while _tasks:
+        await asyncio.gather(*list(_tasks), return_exceptions=True)
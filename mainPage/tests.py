@@ -1,30 +1,84 @@
 from __future__ import annotations
 
-from datetime import timedelta
+import asyncio
+import hashlib
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import replace
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
 from tempfile import TemporaryDirectory
 from unittest.mock import patch
 
 from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import RequestFactory, TestCase, override_settings
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import QuerySet
+from django.http import Http404, HttpResponse
+from django.test import AsyncClient, AsyncRequestFactory, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from admin_honeypot.models import LoginAttempt
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+from PIL.JpegImagePlugin import JpegImageFile
 
-from mainPage.log import VisitorLogger
+from mainPage.geo import EnrichmentWorker, GeoBackend, GeoResolver, RangeFileBackend, TTLCache, enrich_visits
+from mainPage.analytics import agent_family, refresh_rollups
+from mainPage.compression import compress_file
+from mainPage.dbtuning import pragma_statements
+from mainPage.geoindex import GeoIndex
+from mainPage.imagejobs import SKIPPED, run_job
+from mainPage.imageserve import ImageCache, image_cache
+from mainPage import tasks, views
+from mainPage.log import BufferedVisitorLogger, Feedback, VisitorLogger, VisitRecord, upsert_visitor
+from mainPage.pagecache import CSRF_PLACEHOLDER
+from mainPage.queries import QueryBudgetMiddleware, QueryRecorder
+from mainPage.retention import RetentionPolicy, get_policies, purge, read_archive
+from mainPage.sampler import BackgroundSampler, background_sampler
+from mainPage.throttle import LocalBuckets, Throttle, get_throttle, subnet_of
+from mainPage.singletons import singleton_cache
 from mainPage.models import (
     Background_img,
     About,
     Blog,
     Contact,
+    FilteredVisit,
+    IpLocation,
     People,
     Portfolio,
+    RollupState,
     Specialisation,
     Visit_detail,
+    VisitBreakdown,
+    VisitRollup,
 )
+from mainPage.traffic import BOT, DENIED, FilteredVisitCounter, TrafficFilter, get_traffic_filter
 from mainPage.utils import Utility
+from mainPage.variants import generate_variants, variant_cache, variant_name
 
 
-def _build_image_file(name: str = "test.jpg") -> SimpleUploadedFile:
+BROWSER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0"
+
+
+class BrowserClient(Client):
+    """Test client sending a browser user agent, so visits pass the bot filter."""
+
+    def __init__(self, **defaults) -> None:
+        defaults.setdefault("HTTP_USER_AGENT", BROWSER_AGENT)
+        super().__init__(**defaults)
+
+
+def _build_image_file(name: str = "test.jpg", size=(10, 10)) -> SimpleUploadedFile:
     try:
         from PIL import Image
     except ImportError:  # pragma: no cover - Pillow is required by the app.
@@ -32,7 +86,7 @@ def _build_image_file(name: str = "test.jpg") -> SimpleUploadedFile:
 
     with TemporaryDirectory() as tmpdir:
         path = f"{tmpdir}/{name}"
-        image = Image.new("RGB", (10, 10), color="blue")
+        image = Image.new("RGB", size, color="blue")
         image.save(path, format="JPEG")
         with open(path, "rb") as handle:
             data = handle.read()
@@ -45,11 +99,11 @@ class UtilityTests(TestCase):
         self.utility = Utility()
         self.factory = RequestFactory()
 
-    def test_get_client_ip_address_prefers_forwarded_header(self) -> None:
+    def test_get_client_ip_address_takes_the_address_the_proxy_saw(self) -> None:
         request = self.factory.get("/")
         request.META["HTTP_X_FORWARDED_FOR"] = "203.0.113.5, 198.51.100.1"
 
-        self.assertEqual(self.utility.get_client_ip_address(request), "203.0.113.5")
+        self.assertEqual(self.utility.get_client_ip_address(request), "198.51.100.1")
 
     def test_get_client_ip_address_falls_back_to_remote_addr(self) -> None:
         request = self.factory.get("/")
@@ -64,6 +118,182 @@ class UtilityTests(TestCase):
         self.assertEqual(self.utility.get_user_agent(request), "TestAgent/1.0")
 
 
+class _FakeBackend(GeoBackend):
+    def __init__(self, result=None, error: bool = False) -> None:
+        self.result = result
+        self.error = error
+        self.calls = 0
+
+    def lookup(self, ip_addr):
+        self.calls += 1
+        if self.error:
+            raise RuntimeError("backend down")
+        return self.result
+
+
+class TTLCacheTests(TestCase):
+    def test_evicts_least_recently_used(self) -> None:
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b", None))
+
+    def test_entries_expire(self) -> None:
+        cache = TTLCache()
+        cache.set("a", 1, ttl=-1)
+
+        self.assertIsNone(cache.get("a", None))
+
+
+class GeoResolverTests(TestCase):
+    location = {"city": "Chennai", "region": "Tamil Nadu", "country": "IN"}
+
+    def test_repeat_lookups_are_served_from_cache(self) -> None:
+        backend = _FakeBackend(self.location)
+        resolver = GeoResolver([backend])
+
+        self.assertEqual(resolver.resolve("8.8.8.8"), self.location)
+        self.assertEqual(resolver.resolve("8.8.8.8"), self.location)
+        self.assertEqual(backend.calls, 1)
+
+    def test_failures_are_negatively_cached(self) -> None:
+        backend = _FakeBackend(error=True)
+        resolver = GeoResolver([backend])
+
+        self.assertIsNone(resolver.resolve("8.8.8.8"))
+        self.assertIsNone(resolver.resolve("8.8.8.8"))
+        self.assertEqual(backend.calls, 1)
+
+    def test_falls_through_to_next_backend(self) -> None:
+        resolver = GeoResolver([_FakeBackend(error=True), _FakeBackend(self.location)])
+
+        self.assertEqual(resolver.resolve("8.8.8.8"), self.location)
+
+    def test_private_addresses_are_not_looked_up(self) -> None:
+        backend = _FakeBackend(self.location)
+        resolver = GeoResolver([backend])
+
+        self.assertIsNone(resolver.resolve("127.0.0.1"))
+        self.assertIsNone(resolver.resolve("not-an-ip"))
+        self.assertEqual(backend.calls, 0)
+
+    def test_persistent_cache_survives_new_resolver(self) -> None:
+        GeoResolver([_FakeBackend(self.location)], persistent=True).resolve("8.8.8.8")
+        backend = _FakeBackend(error=True)
+
+        location = GeoResolver([backend], persistent=True).resolve("8.8.8.8")
+
+        self.assertEqual(location, self.location)
+        self.assertEqual(backend.calls, 0)
+        self.assertTrue(IpLocation.objects.get(ip_address="8.8.8.8").found)
+
+    def test_range_file_backend(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = f"{tmpdir}/ranges.csv"
+            with open(path, "w", encoding="utf-8") as handle:
+                handle.write("# network,city,region,country\n")
+                handle.write("8.8.8.0/24,Mountain View,California,US\n")
+                handle.write("2001:db8::/32,Docs,Example,ZZ\n")
+            backend = RangeFileBackend(path)
+
+        self.assertEqual(backend.lookup("8.8.8.8")["city"], "Mountain View")
+        self.assertEqual(backend.lookup("2001:db8::1")["country"], "ZZ")
+        self.assertIsNone(backend.lookup("8.8.9.1"))
+        self.assertIsNone(backend.lookup("1.1.1.1"))
+
+
+class GeoIndexTests(TestCase):
+    rows = [
+        (4, 0x08080800, 0x080808FF, ("Mountain View", "California", "US")),
+        (4, 0x01010100, 0x010101FF, ("Sydney", "", "AU")),
+        (4, 0x08080900, 0x080809FF, ("Mountain View", "California", "US")),
+        (6, 0x20010DB8 << 96, ((0x20010DB8 + 1) << 96) - 1, ("Docs", "Example", "ZZ")),
+    ]
+
+    def _assert_lookups(self, index: GeoIndex) -> None:
+        self.assertEqual(index.lookup("8.8.8.8")["city"], "Mountain View")
+        self.assertEqual(index.lookup("8.8.9.255")["country"], "US")
+        self.assertEqual(index.lookup("1.1.1.1"), {"city": "Sydney", "region": None, "country": "AU"})
+        self.assertEqual(index.lookup("2001:db8::1")["city"], "Docs")
+        self.assertIsNone(index.lookup("8.8.10.0"))
+        self.assertIsNone(index.lookup("0.0.0.1"))
+        self.assertIsNone(index.lookup("2001:db9::"))
+
+    def test_in_memory_lookups(self) -> None:
+        index = GeoIndex.build(self.rows)
+
+        self.assertEqual(len(index), 4)
+        self._assert_lookups(index)
+
+    def test_saved_index_is_memory_mapped(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            GeoIndex.build(self.rows).save(f"{tmpdir}/geo.idx")
+            index = GeoIndex.open(f"{tmpdir}/geo.idx")
+
+            self._assert_lookups(index)
+
+    def test_locations_are_interned(self) -> None:
+        index = GeoIndex.build(self.rows)
+
+        self.assertEqual(len(index._locations), 3 * 3)
+
+    def test_build_geoindex_command(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            with open(f"{tmpdir}/ranges.csv", "w", encoding="utf-8") as handle:
+                handle.write("8.8.8.0,8.8.8.255,Mountain View,California,US\n")
+                handle.write("2001:db8::/32,Docs,Example,ZZ\n")
+            call_command("build_geoindex", f"{tmpdir}/ranges.csv", f"{tmpdir}/geo.idx", stdout=StringIO())
+            index = GeoIndex.open(f"{tmpdir}/geo.idx")
+
+            self.assertEqual(index.lookup("8.8.8.8")["region"], "California")
+            self.assertEqual(index.lookup("2001:db8::1")["country"], "ZZ")
+
+
+class DeferredEnrichmentTests(TestCase):
+    location = {"city": "Chennai", "region": "Tamil Nadu", "country": "IN"}
+
+    def test_visit_is_saved_first_and_enriched_later(self) -> None:
+        worker = EnrichmentWorker(autostart=False)
+        person = People.objects.create(ip_address="8.8.8.8")
+
+        with override_settings(GEOIP_DEFERRED=True), patch(
+            "mainPage.geo.get_enrichment_worker", return_value=worker
+        ), patch(
+            "mainPage.models.Utility.get_location_via_ip", side_effect=AssertionError
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                for _ in range(2):
+                    Visit_detail.objects.create(
+                        people=person, user_agent="Agent", name="n", email_id="e@example.com"
+                    )
+                self.assertEqual(worker.pending, 0)
+
+        self.assertEqual(worker.pending, 1)
+        self.assertFalse(Visit_detail.objects.filter(country__isnull=False).exists())
+
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=self.location):
+            worker.drain()
+
+        self.assertEqual(Visit_detail.objects.filter(country="IN").count(), 2)
+
+    def test_unresolvable_addresses_are_marked_done(self) -> None:
+        person = People.objects.create(ip_address="10.0.0.1")
+        Visit_detail.objects.bulk_create(
+            [Visit_detail(people=person, user_agent="Agent", name="n", email_id="e@example.com")]
+        )
+
+        with patch("mainPage.models.Utility.get_location_via_ip") as lookup:
+            self.assertEqual(enrich_visits("10.0.0.1"), 0)
+            call_command("enrich_visits", stdout=StringIO())
+
+        lookup.assert_not_called()
+        self.assertEqual(Visit_detail.objects.get().country, "")
+
+
 class VisitorLoggerTests(TestCase):
     def setUp(self) -> None:
         self.logger = VisitorLogger()
@@ -113,9 +343,305 @@ class VisitorLoggerTests(TestCase):
         self.assertEqual(person.no_of_visits, 3)
         self.assertGreaterEqual(person.last_visited, recent_time)
 
+    def test_an_older_visit_written_late_keeps_the_newer_time(self) -> None:
+        older = timezone.now() - (VisitorLogger.cooldown + timedelta(minutes=1))
+        late = [VisitRecord("192.0.2.47", "TestAgent/3.0", Feedback.from_mapping(None), older)] * 2
+        for upsert in (True, False):
+            with self.subTest(upsert=upsert), self._patch_location(), patch(
+                "mainPage.log._supports_upsert", return_value=upsert
+            ):
+                People.objects.all().delete()
+                self.logger.add("192.0.2.47", "TestAgent/3.0")
+                newer = People.objects.get().last_visited
+                BufferedVisitorLogger(autostart=False).write_batch(late)
+                upsert_visitor("192.0.2.47", older, VisitorLogger.cooldown)
+                self.assertEqual(People.objects.get().last_visited, newer)
+
+                # Still within the cooldown of the newer visit.
+                self.logger.add("192.0.2.47", "TestAgent/3.0")
+                self.assertEqual(People.objects.get().no_of_visits, 1)
+
+    def test_add_is_one_upsert_and_one_insert(self) -> None:
+        People.objects.create(ip_address="192.0.2.45")
+
+        with self._patch_location(), QueryRecorder() as recorder:
+            self.logger.add("192.0.2.45", "TestAgent/4.0")
+            self.logger.add("192.0.2.46", "TestAgent/4.0")
+
+        # The test case's own transaction turns each atomic block into a savepoint.
+        statements = [
+            query.sql.split()[0]
+            for query in recorder.queries
+            if not query.sql.startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))
+        ]
+        self.assertEqual(statements, ["INSERT", "INSERT"] * 2)
+        self.assertEqual(People.objects.get(ip_address="192.0.2.46").no_of_visits, 1)
+
+    def test_deferred_add_enqueues_enrichment(self) -> None:
+        worker = EnrichmentWorker(autostart=False)
+        with override_settings(GEOIP_DEFERRED=True), patch(
+            "mainPage.geo.get_enrichment_worker", return_value=worker
+        ), patch("mainPage.models.Utility.get_location_via_ip", side_effect=AssertionError):
+            self.logger.add("192.0.2.47", "TestAgent/5.0")
+
+        self.assertEqual(worker.pending, 1)
+        self.assertIsNone(Visit_detail.objects.get().country)
+
+
+class TrafficFilterTests(TestCase):
+    def _filter(self, **kwargs) -> TrafficFilter:
+        kwargs.setdefault("counter", FilteredVisitCounter(autostart=False))
+        return TrafficFilter(**kwargs)
+
+    def test_known_bots_and_missing_agents_are_filtered(self) -> None:
+        traffic = self._filter()
+
+        for agent in (
+            "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+            "UptimeRobot/2.0",
+            "curl/8.4.0",
+            "python-requests/2.31.0",
+            "ELB-HealthChecker/2.0",
+            "",
+        ):
+            self.assertEqual(traffic.classify("203.0.113.1", agent), BOT, agent)
+        self.assertIsNone(traffic.classify("203.0.113.1", BROWSER_AGENT))
+
+    def test_agent_results_are_cached(self) -> None:
+        traffic = self._filter()
+
+        for _ in range(3):
+            traffic.classify("203.0.113.1", BROWSER_AGENT)
+
+        self.assertEqual(traffic.is_bot_agent.cache_info().hits, 2)
+
+    def test_allow_and_deny_networks(self) -> None:
+        traffic = self._filter(
+            allow_networks=["198.51.100.0/24"], deny_networks=["10.0.0.0/8", "2001:db8::/32"]
+        )
+
+        self.assertIsNone(traffic.classify("198.51.100.7", "curl/8.4.0"))
+        self.assertEqual(traffic.classify("10.1.2.3", BROWSER_AGENT), DENIED)
+        self.assertEqual(traffic.classify("2001:db8::1", BROWSER_AGENT), DENIED)
+        self.assertIsNone(traffic.classify("203.0.113.1", BROWSER_AGENT))
+
+    def test_filtered_visits_are_only_counted(self) -> None:
+        traffic = self._filter(deny_networks=["198.51.100.0/24"])
+        logger = VisitorLogger()
+        with patch("mainPage.log.get_traffic_filter", return_value=traffic), patch(
+            "mainPage.models.Utility.get_location_via_ip", side_effect=AssertionError
+        ):
+            for _ in range(3):
+                logger.add("203.0.113.9", "Googlebot/2.1")
+            logger.add("198.51.100.9", BROWSER_AGENT)
+        traffic.counter.flush()
+
+        self.assertFalse(People.objects.exists())
+        self.assertFalse(Visit_detail.objects.exists())
+        self.assertEqual(FilteredVisit.objects.get(reason=BOT).hits, 3)
+        self.assertEqual(FilteredVisit.objects.get(reason=DENIED).hits, 1)
+
+    @override_settings(VISITOR_DENY_NETWORKS=["10.0.0.0/8"], VISITOR_FILTER_FLUSH_INTERVAL=30)
+    def test_filter_is_built_from_settings(self) -> None:
+        traffic = get_traffic_filter()
+
+        self.assertEqual(traffic.classify("10.0.0.1", BROWSER_AGENT), DENIED)
+        self.assertEqual(traffic.counter.flush_interval, 30)
+
+    def test_counter_flushes_into_daily_rows(self) -> None:
+        counter = FilteredVisitCounter(autostart=False)
+        for reason in (BOT, BOT, DENIED):
+            counter.record(reason)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(counter.pending, 3)
+        self.assertEqual(counter.flush(), 3)
+        counter.record(BOT)
+        counter.flush()
+
+        today = timezone.localdate()
+        self.assertEqual(FilteredVisit.objects.get(day=today, reason=BOT).hits, 3)
+        self.assertEqual(FilteredVisit.objects.get(day=today, reason=DENIED).hits, 1)
+        self.assertEqual(counter.pending, 0)
+
+    def test_feedback_is_recorded_whatever_the_agent(self) -> None:
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            VisitorLogger().add("203.0.113.10", "curl/8.4.0", feedback={"message": "Hi"})
+
+        self.assertEqual(Visit_detail.objects.get().message, "Hi")
+
+
+class VisitorLoggerConcurrencyTests(TransactionTestCase):
+    THREADS = 16
+    VISITS_PER_THREAD = 10
+
+    def test_concurrent_visits_from_one_address(self) -> None:
+        barrier = threading.Barrier(self.THREADS)
+        recorders = []
+        errors = []
+
+        def visit() -> None:
+            recorder = QueryRecorder()
+            recorders.append(recorder)
+            try:
+                barrier.wait()
+                with recorder:
+                    for _ in range(self.VISITS_PER_THREAD):
+                        VisitorLogger().add("203.0.113.77", "StressAgent/1.0")
+            except Exception as error:  # pragma: no cover - reported below.
+                errors.append(error)
+            finally:
+                connection.close()
+
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            threads = [threading.Thread(target=visit) for _ in range(self.THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        total = self.THREADS * self.VISITS_PER_THREAD
+        person = People.objects.get()
+        # Every visit landed within the cooldown of the first one.
+        self.assertEqual(person.no_of_visits, 1)
+        self.assertEqual(Visit_detail.objects.filter(people=person).count(), total)
+        # BEGIN, the upsert and the detail insert; COMMIT is not a cursor call.
+        statements = Counter(
+            query.sql.split()[0] for recorder in recorders for query in recorder.queries
+        )
+        self.assertEqual(statements, {"BEGIN": total, "INSERT": 2 * total})
+
+
+class BufferedVisitorLoggerTests(TestCase):
+    client_class = BrowserClient
+
+    def _logger(self, **kwargs) -> BufferedVisitorLogger:
+        kwargs.setdefault("autostart", False)
+        return BufferedVisitorLogger(**kwargs)
+
+    def test_add_only_enqueues(self) -> None:
+        logger = self._logger()
+
+        with patch(
+            "mainPage.models.Utility.get_location_via_ip", side_effect=AssertionError
+        ), self.assertNumQueries(0):
+            logger.add("203.0.113.5", "TestAgent/1.0")
+
+        self.assertEqual(logger.pending, 1)
+        self.assertFalse(People.objects.exists())
+
+    def test_flush_writes_batch(self) -> None:
+        logger = self._logger()
+        logger.add("203.0.113.5", "TestAgent/1.0")
+        logger.add("203.0.113.5", "TestAgent/1.0", feedback={"message": "Hi"})
+        logger.add("198.51.100.4", "TestAgent/2.0")
+
+        location = {"city": "Chennai", "region": "Tamil Nadu", "country": "IN"}
+        with patch(
+            "mainPage.models.Utility.get_location_via_ip", return_value=location
+        ) as lookup:
+            self.assertEqual(logger.flush(), 3)
+
+        self.assertEqual(lookup.call_count, 2)
+        self.assertEqual(People.objects.count(), 2)
+        self.assertEqual(People.objects.get(ip_address="203.0.113.5").no_of_visits, 1)
+        self.assertEqual(Visit_detail.objects.count(), 3)
+        self.assertEqual(Visit_detail.objects.filter(city="Chennai").count(), 3)
+        self.assertTrue(Visit_detail.objects.filter(message="Hi").exists())
+
+    def test_flush_increments_visits_after_cooldown(self) -> None:
+        stale_time = timezone.now() - (VisitorLogger.cooldown + timedelta(minutes=1))
+        person = People.objects.create(
+            ip_address="198.51.100.4", no_of_visits=1, last_visited=stale_time
+        )
+        logger = self._logger()
+        logger.add("198.51.100.4", "TestAgent/2.0")
+        logger.add("198.51.100.4", "TestAgent/2.0")
+
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            logger.flush()
+
+        person.refresh_from_db()
+        self.assertEqual(person.no_of_visits, 2)
+        self.assertGreater(person.last_visited, stale_time)
+
+    def test_repeat_visits_in_a_batch_count_after_each_cooldown(self) -> None:
+        start = timezone.now()
+        records = [
+            VisitRecord("203.0.113.5", "TestAgent/1.0", Feedback.from_mapping(None), start + offset)
+            for offset in (timedelta(0), timedelta(minutes=1), timedelta(minutes=7), timedelta(minutes=13))
+        ]
+
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            self._logger().write_batch(records)
+
+        person = People.objects.get()
+        self.assertEqual(person.no_of_visits, 3)
+        self.assertEqual(person.last_visited, start + timedelta(minutes=13))
+        self.assertEqual(Visit_detail.objects.filter(people=person).count(), 4)
+
+    def test_drop_newest_discards_incoming_visit(self) -> None:
+        logger = self._logger(max_queue_size=2, drop_policy="drop_newest")
+        for agent in ("one", "two", "three"):
+            logger.add("203.0.113.5", agent)
+
+        self.assertEqual(logger.dropped, 1)
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            logger.flush()
+        self.assertEqual(
+            sorted(Visit_detail.objects.values_list("user_agent", flat=True)), ["one", "two"]
+        )
+
+    def test_drop_oldest_evicts_queued_visit(self) -> None:
+        logger = self._logger(max_queue_size=2, drop_policy="drop_oldest")
+        for agent in ("one", "two", "three"):
+            logger.add("203.0.113.5", agent)
+
+        self.assertEqual(logger.dropped, 1)
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            logger.flush()
+        self.assertEqual(
+            sorted(Visit_detail.objects.values_list("user_agent", flat=True)), ["three", "two"]
+        )
+
+    def test_unknown_drop_policy_is_rejected(self) -> None:
+        with self.assertRaises(ValueError):
+            BufferedVisitorLogger(drop_policy="shrug")
+
+    def test_worker_drains_queue_and_stop_flushes(self) -> None:
+        logger = self._logger(autostart=True, flush_interval=0.01)
+        batches = []
+        logger.write_batch = lambda records: batches.append(list(records))
+
+        logger.add("203.0.113.5", "TestAgent/1.0")
+        logger.add("198.51.100.4", "TestAgent/2.0")
+        logger.stop()
+
+        self.assertEqual(logger.pending, 0)
+        self.assertEqual(sum(len(batch) for batch in batches), 2)
+
+    def test_index_response_does_not_wait_for_persistence(self) -> None:
+        Portfolio.objects.create(title_text="Title", name_content="Name")
+        logger = self._logger()
+
+        with patch("mainPage.views.visitor_logger", logger), patch(
+            "mainPage.models.Utility.get_location_via_ip", side_effect=AssertionError
+        ):
+            response = self.client.get(reverse("mainPage:index"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(People.objects.exists())
+        self.assertEqual(logger.pending, 1)
+
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            logger.flush()
+        self.assertTrue(People.objects.filter(ip_address="127.0.0.1").exists())
+
 
 class SpecialisationTests(TestCase):
     def setUp(self) -> None:
+        singleton_cache.invalidate()
         self.portfolio = Portfolio.objects.create(title_text="Title", name_content="Name")
 
     def test_saving_more_than_three_specialisations_is_prevented(self) -> None:
@@ -137,8 +663,432 @@ class SpecialisationTests(TestCase):
         self.assertEqual(Specialisation.objects.get(pk=spec.pk).specialisation_name, "Updated")
 
 
+class SingletonTests(TestCase):
+    client_class = BrowserClient
+
+    def setUp(self) -> None:
+        singleton_cache.invalidate()
+        cache.clear()
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.portfolio = Portfolio.objects.create(title_text="Title", name_content="Name")
+        self.about = About.objects.create(image=_build_image_file(), content="About me")
+
+    def _queried_tables(self, queries) -> set:
+        return {
+            table
+            for table in ("mainPage_portfolio", "mainPage_about")
+            for query in queries
+            if f'"{table}"' in query["sql"]
+        }
+
+    def test_current_is_served_from_memory_once_loaded(self) -> None:
+        Portfolio.objects.current()
+        About.objects.current()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Portfolio.objects.current().pk, self.portfolio.pk)
+            self.assertEqual(About.objects.current().content, "About me")
+
+    def test_saving_a_new_instance_updates_the_existing_row(self) -> None:
+        Portfolio.objects.current()
+
+        with self.assertNumQueries(1):
+            Portfolio(title_text="New", name_content="Other").save()
+        About.objects.create(image=_build_image_file(), content="Rewritten")
+
+        self.assertEqual(Portfolio.objects.get().name_content, "Other")
+        self.assertEqual(About.objects.get().content, "Rewritten")
+
+    def test_saves_and_deletes_invalidate_the_cached_row(self) -> None:
+        Portfolio.objects.current()
+        self.portfolio.name_content = "Renamed"
+        self.portfolio.save()
+        self.assertEqual(Portfolio.objects.current().name_content, "Renamed")
+
+        self.portfolio.delete()
+        self.assertIsNone(Portfolio.objects.current())
+
+    @override_settings(SINGLETON_CACHE_TIMEOUT=60)
+    def test_entries_expire_for_edits_made_by_other_workers(self) -> None:
+        Portfolio.objects.current()
+        Portfolio.objects.update(name_content="Renamed")
+        self.assertEqual(Portfolio.objects.current().name_content, "Name")
+
+        with patch("mainPage.singletons.time.monotonic", return_value=time.monotonic() + 60):
+            self.assertEqual(Portfolio.objects.current().name_content, "Renamed")
+
+    def test_cached_absence_does_not_allow_a_second_row(self) -> None:
+        Portfolio.objects.all().delete()
+        self.assertIsNone(Portfolio.objects.current())
+        # A row written by another worker without invalidating this process.
+        Portfolio.objects.bulk_create([Portfolio(title_text="Other", name_content="Worker")])
+
+        Portfolio.objects.create(title_text="Mine", name_content="Here")
+
+        self.assertEqual(Portfolio.objects.count(), 1)
+
+    @override_settings(PAGE_CACHE_ENABLED=False)
+    def test_warm_page_render_does_not_query_singletons(self) -> None:
+        logger = BufferedVisitorLogger(autostart=False)
+        with patch("mainPage.views.visitor_logger", logger):
+            self.client.get(reverse("mainPage:index"))
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse("mainPage:index"))
+
+        self.assertContains(response, "About me")
+        self.assertEqual(self._queried_tables(queries.captured_queries), set())
+
+    def test_warm_about_image_needs_no_query(self) -> None:
+        url = reverse("mainPage:serve_image", args=["ab"])
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(SINGLETON_CACHE_ALIAS="default")
+    def test_shared_cache_serves_a_cold_process(self) -> None:
+        About.objects.current()
+        singleton_cache.invalidate()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(About.objects.current().content, "About me")
+
+
+@override_settings(PAGE_CACHE_ENABLED=False)
+class QueryBudgetTests(TestCase):
+    """Cold-cache query counts of each endpoint against ``QUERY_BUDGETS``."""
+
+    client_class = BrowserClient
+
+    def setUp(self) -> None:
+        singleton_cache.invalidate()
+        background_sampler.invalidate()
+        image_cache.clear()
+        cache.clear()
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        portfolio = Portfolio.objects.create(title_text="Title", name_content="Name")
+        for n in range(3):
+            Specialisation.objects.create(portfolio=portfolio, specialisation_name=f"Skill {n}")
+            Background_img.objects.create(portfolio=portfolio, image=_build_image_file(f"bg{n}.jpg"))
+        About.objects.create(image=_build_image_file(), content="About me")
+        for n in range(5):
+            Blog.objects.create(title=f"Post {n}", pub_date=timezone.now(), link="https://example.com")
+        for types, _ in Contact.TYPES:
+            Contact.objects.create(types=types, link="https://example.com")
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            for n in range(10):
+                person = People.objects.create(ip_address=f"203.0.113.{n}")
+                for _ in range(3):
+                    Visit_detail.objects.create(people=person, user_agent="agent")
+
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+
+    def _assert_within_budget(self, view_name: str, fetch) -> None:
+        with QueryRecorder() as recorder:
+            response = fetch()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.resolver_match.view_name, view_name)
+        sql = "\n".join(query.sql for query in recorder.queries)
+        self.assertLessEqual(recorder.count, settings.QUERY_BUDGETS[view_name], sql)
+        # The changelist counts its rows twice (filtered and full); an N+1 repeats once per row.
+        self.assertEqual(recorder.repeated(threshold=3), {}, "repeated queries suggest an N+1")
+
+    def test_index_page(self) -> None:
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            self._assert_within_budget(
+                "mainPage:index", lambda: self.client.get(reverse("mainPage:index"))
+            )
+
+    def test_images(self) -> None:
+        for types in ("ab", "bg"):
+            self._assert_within_budget(
+                "mainPage:serve_image",
+                lambda: self.client.get(reverse("mainPage:serve_image", args=[types])),
+            )
+
+    def test_admin_changelists(self) -> None:
+        self.client.force_login(self.admin)
+        for model in (
+            "visit_detail", "people", "background_img", "about", "blog", "contact", "portfolio", "visitrollup",
+        ):
+            view_name = f"admin:mainPage_{model}_changelist"
+            with self.subTest(view_name):
+                self._assert_within_budget(view_name, lambda: self.client.get(reverse(view_name)))
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+    client_class = BrowserClient
+
+    def setUp(self) -> None:
+        singleton_cache.invalidate()
+        cache.clear()
+
+    @override_settings(QUERY_BUDGETS={"mainPage:index": 0}, PAGE_CACHE_ENABLED=False)
+    def test_requests_over_budget_are_logged(self) -> None:
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            with self.assertLogs("mainPage.queries", "WARNING") as logs:
+                self.client.get(reverse("mainPage:index"))
+
+        self.assertIn("mainPage:index ran", logs.output[0])
+        self.assertIn("(budget 0)", logs.output[0])
+
+    @override_settings(QUERY_BUDGETS={}, QUERY_BUDGET_DEFAULT=None)
+    def test_endpoints_without_budget_are_not_logged(self) -> None:
+        with patch("mainPage.queries.log") as log:
+            self.client.get(reverse("mainPage:index"))
+
+        log.warning.assert_not_called()
+
+    def test_recorder_flags_repeated_statements(self) -> None:
+        people = [People.objects.create(ip_address=f"198.51.100.{n}") for n in range(3)]
+
+        with QueryRecorder() as recorder:
+            for person in people:
+                People.objects.get(pk=person.pk)
+
+        self.assertEqual(recorder.count, 3)
+        self.assertEqual(list(recorder.repeated().values()), [3])
+        self.assertGreater(recorder.duration, 0)
+
+
+class AnalyticsTests(TestCase):
+    CHROME = "Mozilla/5.0 (Windows NT 10.0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36"
+
+    def setUp(self) -> None:
+        self.now = timezone.make_aware(datetime(2024, 5, 10, 12, 30))
+        self.alice = People.objects.create(ip_address="203.0.113.1")
+        self.bob = People.objects.create(ip_address="203.0.113.2")
+
+    def _visit(self, person, hour: int, day: int = 10, agent: str = BROWSER_AGENT, country="IN"):
+        visit_time = timezone.make_aware(datetime(2024, 5, day, hour, 15))
+        Visit_detail.objects.bulk_create(
+            [Visit_detail(people=person, user_agent=agent, visit_time=visit_time, country=country)]
+        )
+
+    def _rollup(self, period: str, day: int = 10, hour: int = 0) -> VisitRollup:
+        return VisitRollup.objects.get(
+            period=period, start=timezone.make_aware(datetime(2024, 5, day, hour))
+        )
+
+    def test_agent_families(self) -> None:
+        self.assertEqual(agent_family(BROWSER_AGENT), "Firefox")
+        self.assertEqual(agent_family(self.CHROME), "Chrome")
+        self.assertEqual(agent_family(self.CHROME + " Edg/126.0"), "Edge")
+        self.assertEqual(agent_family("Mozilla/5.0 (iPhone) Version/17.0 Mobile/15E148 Safari/604.1"), "Safari")
+        self.assertEqual(agent_family("something else"), "Other")
+
+    def test_rollups_count_visits_addresses_and_dimensions(self) -> None:
+        self._visit(self.alice, 9)
+        self._visit(self.alice, 9)
+        self._visit(self.bob, 9, agent=self.CHROME, country=None)
+        self._visit(self.alice, 11)
+
+        result = refresh_rollups(now=self.now)
+
+        self.assertEqual(result.visits, 4)
+        hour = self._rollup(VisitRollup.HOUR, hour=9)
+        self.assertEqual((hour.visits, hour.unique_ips), (3, 2))
+        day = self._rollup(VisitRollup.DAY)
+        self.assertEqual((day.visits, day.unique_ips), (4, 2))
+        daily = {
+            (row.dimension, row.value): row.visits
+            for row in VisitBreakdown.objects.filter(period=VisitRollup.DAY)
+        }
+        self.assertEqual(
+            daily,
+            {
+                (VisitBreakdown.COUNTRY, "IN"): 3,
+                (VisitBreakdown.COUNTRY, ""): 1,
+                (VisitBreakdown.AGENT, "Firefox"): 3,
+                (VisitBreakdown.AGENT, "Chrome"): 1,
+            },
+        )
+
+    def test_refresh_only_recomputes_days_with_new_visits(self) -> None:
+        self._visit(self.alice, 20, day=8)
+        self._visit(self.bob, 9)
+        refresh_rollups(now=self.now)
+        # Raw rows of rolled-up days may be purged without losing their rollups.
+        Visit_detail.objects.filter(visit_time__day=8).delete()
+        self._visit(self.bob, 10)
+        latest = Visit_detail.objects.latest("pk")
+
+        result = refresh_rollups(now=self.now + timedelta(minutes=5))
+
+        self.assertEqual(result.days, 1)
+        self.assertEqual(result.last_visit_id, latest.pk)
+        self.assertEqual(RollupState.objects.get().last_visit_id, latest.pk)
+        self.assertEqual(self._rollup(VisitRollup.DAY, day=8).visits, 1)
+        day = self._rollup(VisitRollup.DAY)
+        self.assertEqual((day.visits, day.unique_ips), (2, 1))
+
+    def test_full_refresh_recomputes_every_day(self) -> None:
+        self._visit(self.alice, 20, day=8)
+        refresh_rollups(now=self.now)
+        Visit_detail.objects.update(country="US")
+
+        result = refresh_rollups(now=self.now, full=True)
+
+        self.assertEqual(result.days, 3)
+        self.assertTrue(
+            VisitBreakdown.objects.filter(period=VisitRollup.DAY, dimension=VisitBreakdown.COUNTRY, value="US").exists()
+        )
+
+    def test_command(self) -> None:
+        Visit_detail.objects.bulk_create([Visit_detail(people=self.alice, user_agent=BROWSER_AGENT)])
+        stdout = StringIO()
+
+        call_command("rollup_visits", "--full", stdout=stdout)
+
+        self.assertIn("Rolled up 1 visits", stdout.getvalue())
+
+    def test_dashboard_reads_only_rollups(self) -> None:
+        self._visit(self.alice, 9)
+        refresh_rollups(now=self.now)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+
+        with patch("mainPage.admin.timezone.now", return_value=self.now + timedelta(hours=1)):
+            with QueryRecorder() as recorder:
+                response = self.client.get(reverse("admin:mainPage_visitrollup_changelist"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Firefox")
+        self.assertContains(response, "IN")
+        tables = " ".join(query.sql for query in recorder.queries)
+        self.assertNotIn(Visit_detail._meta.db_table, tables)
+
+    def test_dashboard_needs_the_view_permission(self) -> None:
+        self.client.force_login(User.objects.create_user("staff", password="password", is_staff=True))
+
+        response = self.client.get(reverse("admin:mainPage_visitrollup_changelist"))
+
+        self.assertEqual(response.status_code, 403)
+
+
+class RetentionTests(TestCase):
+    def setUp(self) -> None:
+        archive_dir = TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        self.archive_dir = archive_dir.name
+        archive_settings = override_settings(RETENTION_ARCHIVE_DIR=archive_dir.name, RETENTION_BATCH_PAUSE=0)
+        archive_settings.enable()
+        self.addCleanup(archive_settings.disable)
+
+        self.now = timezone.now()
+        person = People.objects.create(ip_address="203.0.113.1")
+        Visit_detail.objects.bulk_create(
+            Visit_detail(people=person, user_agent=BROWSER_AGENT, visit_time=self.now - timedelta(days=days))
+            for days in (40, 35, 31, 5, 1)
+        )
+        self.visits = RetentionPolicy("mainPage.Visit_detail", "visit_time", max_age=timedelta(days=30))
+
+    def test_dry_run_only_counts(self) -> None:
+        report = purge(self.visits, dry_run=True, now=self.now)
+
+        self.assertEqual(report.expired, 3)
+        self.assertEqual(Visit_detail.objects.count(), 5)
+
+    def test_expired_rows_are_archived_then_deleted_in_batches(self) -> None:
+        report = purge(self.visits, batch_size=2, now=self.now)
+
+        self.assertEqual((report.deleted, report.batches), (3, 2))
+        self.assertEqual(Visit_detail.objects.count(), 2)
+        archived = list(read_archive(report.archive))
+        self.assertEqual(len(archived), 3)
+        self.assertEqual(archived[0]["user_agent"], BROWSER_AGENT)
+        self.assertTrue(str(report.archive).startswith(self.archive_dir))
+
+    def test_archived_visits_carry_the_visitor_address(self) -> None:
+        (policy,) = get_policies(["mainPage.Visit_detail"])
+        policy = replace(policy, max_age=timedelta(days=30), max_rows=None, after_rollup=False)
+
+        report = purge(policy, now=self.now)
+
+        archived = list(read_archive(report.archive))
+        self.assertEqual({row["ip_address"] for row in archived}, {"203.0.113.1"})
+        self.assertEqual(archived[0]["people_id"], People.objects.get().pk)
+
+    def test_size_limit_keeps_newest_rows(self) -> None:
+        policy = RetentionPolicy("mainPage.Visit_detail", "visit_time", max_rows=2)
+
+        report = purge(policy, archive=False, now=self.now)
+
+        self.assertEqual(report.deleted, 3)
+        self.assertIsNone(report.archive)
+        self.assertEqual(Visit_detail.objects.filter(visit_time__gte=self.now - timedelta(days=6)).count(), 2)
+
+    def test_visits_wait_for_rollups(self) -> None:
+        policy = RetentionPolicy("mainPage.Visit_detail", "visit_time", max_age=timedelta(days=30), after_rollup=True)
+        self.assertEqual(purge(policy, dry_run=True, now=self.now).expired, 0)
+
+        RollupState.objects.create(name="visits", last_visit_id=Visit_detail.objects.order_by("pk")[1].pk)
+
+        self.assertEqual(purge(policy, dry_run=True, now=self.now).expired, 2)
+
+    def test_command_applies_configured_policies(self) -> None:
+        LoginAttempt.objects.create(username="admin")
+        LoginAttempt.objects.update(timestamp=self.now - timedelta(days=400))
+        stdout = StringIO()
+
+        call_command("apply_retention", "admin_honeypot.LoginAttempt", stdout=stdout)
+
+        self.assertFalse(LoginAttempt.objects.exists())
+        self.assertIn("admin_honeypot.LoginAttempt: deleted 1 rows in 1 batches", stdout.getvalue())
+        self.assertEqual([policy.label for policy in get_policies()], list(settings.RETENTION_POLICIES))
+
+
+class IndexTests(TestCase):
+    def test_migrations_match_models(self) -> None:
+        call_command("makemigrations", "--check", "--dry-run", stdout=StringIO())
+
+    def test_admin_searches_addresses_exactly(self) -> None:
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            for ip_addr in ("203.0.113.1", "203.0.113.10"):
+                Visit_detail.objects.create(people=People.objects.create(ip_address=ip_addr), user_agent="agent")
+        LoginAttempt.objects.create(username="admin", ip_address="203.0.113.1")
+
+        for view_name in ("admin:mainPage_visit_detail_changelist", "admin:admin_honeypot_loginattempt_changelist"):
+            with self.subTest(view_name), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(view_name), {"q": "203.0.113.1"})
+                self.assertEqual(response.context["cl"].result_count, 1)
+                self.assertNotIn("LIKE", " ".join(query["sql"] for query in queries))
+
+
+class DatabaseTuningTests(TestCase):
+    def test_new_sqlite_connections_are_tuned(self) -> None:
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite only")
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS["busy_timeout"])
+
+    def test_pragmas_are_validated(self) -> None:
+        self.assertEqual(list(pragma_statements({"synchronous": "normal"})), ["PRAGMA synchronous = normal"])
+        with self.assertRaises(ValueError):
+            list(pragma_statements({"synchronous": "off; DROP TABLE x"}))
+
+
 class BackgroundImageTests(TestCase):
     def setUp(self) -> None:
+        singleton_cache.invalidate()
+        # Rolled-back test rows never send post_delete, so start from a cold sampler.
+        background_sampler.invalidate()
         self.portfolio = Portfolio.objects.create(title_text="Title", name_content="Name")
 
     def test_random_returns_none_when_no_backgrounds(self) -> None:
@@ -153,9 +1103,72 @@ class BackgroundImageTests(TestCase):
 
         self.assertIsNotNone(random_background)
 
+    def test_random_needs_no_query_once_warm(self) -> None:
+        Background_img.objects.bulk_create(
+            [Background_img(portfolio=self.portfolio, image=f"bg/{n}.jpg") for n in range(50)]
+        )
+        Background_img.random()
+
+        with self.assertNumQueries(0):
+            picks = {Background_img.random().image.name for _ in range(200)}
+
+        self.assertGreater(len(picks), 1)
+        self.assertTrue(picks <= {f"bg/{n}.jpg" for n in range(50)})
+
+    def test_saving_or_deleting_a_background_refreshes_the_sampler(self) -> None:
+        Background_img.objects.bulk_create(
+            [Background_img(portfolio=self.portfolio, image="bg/old.jpg")]
+        )
+        self.assertEqual(Background_img.random().image.name, "bg/old.jpg")
+
+        with TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            Background_img.objects.create(portfolio=self.portfolio, image=_build_image_file())
+            Background_img.objects.filter(image="bg/old.jpg").delete()
+
+            self.assertNotEqual(Background_img.random().image.name, "bg/old.jpg")
+            self.assertEqual(Background_img.random().pk, Background_img.objects.get().pk)
+
+    def test_load_racing_an_invalidation_is_not_kept(self) -> None:
+        sampler = BackgroundSampler(ttl=float("inf"))
+        Background_img.objects.bulk_create(
+            [Background_img(portfolio=self.portfolio, image="bg/old.jpg")]
+        )
+        values_list = QuerySet.values_list
+
+        def changed_while_loading(queryset, *fields):
+            rows = values_list(queryset, *fields)
+            sampler.invalidate()
+            return rows
+
+        with patch.object(QuerySet, "values_list", changed_while_loading):
+            self.assertEqual(sampler.choice().image.name, "bg/old.jpg")
+
+        with self.assertNumQueries(1):
+            sampler.choice()
+
+    def test_sampler_reloads_after_ttl(self) -> None:
+        sampler = BackgroundSampler(ttl=0)
+        self.assertIsNone(sampler.choice())
+
+        Background_img.objects.bulk_create(
+            [Background_img(portfolio=self.portfolio, image="bg/new.jpg")]
+        )
+
+        self.assertEqual(sampler.choice().image.name, "bg/new.jpg")
+
 
 class IndexViewTests(TestCase):
+    client_class = BrowserClient
+
     def setUp(self) -> None:
+        singleton_cache.invalidate()
+        cache.clear()
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
         self.portfolio = Portfolio.objects.create(title_text="Title", name_content="Name")
         self.about = About.objects.create(image=_build_image_file(), content="Line one\nLine two")
         Blog.objects.create(title="Post", pub_date=timezone.now(), link="https://example.com")
@@ -169,9 +1182,840 @@ class IndexViewTests(TestCase):
         self.assertTrue(People.objects.filter(ip_address="127.0.0.1").exists())
         self.assertEqual(Visit_detail.objects.count(), 1)
 
+    @override_settings(VISITOR_DENY_NETWORKS=["10.0.0.0/8"])
+    def test_forged_forwarded_address_is_neither_logged_nor_let_past_the_filter(self) -> None:
+        traffic = get_traffic_filter()
+        traffic.counter.stop()
+        traffic.counter.autostart = False
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            self.client.get(reverse("mainPage:index"), HTTP_X_FORWARDED_FOR="8.8.8.8, 10.1.2.3")
+            self.client.get(reverse("mainPage:index"), HTTP_X_FORWARDED_FOR="8.8.8.8, 203.0.113.4")
+        traffic.counter.flush()
+
+        self.assertEqual(list(People.objects.values_list("ip_address", flat=True)), ["203.0.113.4"])
+        self.assertEqual(FilteredVisit.objects.get(reason=DENIED).hits, 1)
+
+    def test_repeat_get_is_served_from_page_cache(self) -> None:
+        logger = BufferedVisitorLogger(autostart=False)
+        with patch("mainPage.views.visitor_logger", logger):
+            first = self.client.get(reverse("mainPage:index"))
+            with self.assertNumQueries(0):
+                second = self.client.get(reverse("mainPage:index"))
+
+        self.assertContains(second, "Post")
+        self.assertEqual(logger.pending, 2)
+        self.assertNotContains(first, CSRF_PLACEHOLDER)
+        self.assertNotContains(second, CSRF_PLACEHOLDER)
+
+    def test_cached_page_carries_a_valid_csrf_token(self) -> None:
+        client = BrowserClient(enforce_csrf_checks=True)
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            self.client.get(reverse("mainPage:index"))
+            response = client.get(reverse("mainPage:index"))
+            token = re.search(
+                r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()
+            ).group(1)
+            posted = client.post(
+                reverse("mainPage:index"),
+                {
+                    "csrfmiddlewaretoken": token,
+                    "name": "Ann",
+                    "email": "ann@example.com",
+                    "message": "Hello",
+                },
+            )
+
+        self.assertEqual(posted.status_code, 200)
+        self.assertContains(posted, "Thanks! I&#x27;ll be in touch shortly.")
+        self.assertTrue(Visit_detail.objects.filter(message="Hello").exists())
+
+    def test_unsignalled_edits_show_once_the_generation_expires(self) -> None:
+        # As an edit made by another worker looks with a per-process cache.
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            self.client.get(reverse("mainPage:index"))
+            Blog.objects.update(title="Renamed post")
+            cached = self.client.get(reverse("mainPage:index"))
+            with patch("time.time", return_value=time.time() + 61):
+                expired = self.client.get(reverse("mainPage:index"))
+
+        self.assertNotContains(cached, "Renamed post")
+        self.assertContains(expired, "Renamed post")
+
+    def test_content_changes_invalidate_cached_page(self) -> None:
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            self.client.get(reverse("mainPage:index"))
+            Blog.objects.create(
+                title="Fresh post", pub_date=timezone.now(), link="https://example.com/2"
+            )
+            added = self.client.get(reverse("mainPage:index"))
+            Contact.objects.get(types="fa-linkedin").delete()
+            removed = self.client.get(reverse("mainPage:index"))
+
+        self.assertContains(added, "Fresh post")
+        self.assertContains(added, "https://linkedin.example")
+        self.assertNotContains(removed, "https://linkedin.example")
+
+
+class ConditionalGetTests(TestCase):
+    client_class = BrowserClient
+
+    def setUp(self) -> None:
+        singleton_cache.invalidate()
+        cache.clear()
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        location = patch("mainPage.models.Utility.get_location_via_ip", return_value=None)
+        location.start()
+        self.addCleanup(location.stop)
+
+        self.portfolio = Portfolio.objects.create(title_text="Title", name_content="Name")
+        About.objects.create(image=_build_image_file(), content="About me")
+        self.blog = Blog.objects.create(
+            title="Post", pub_date=timezone.now(), link="https://example.com"
+        )
+
+    def test_index_answers_if_none_match_with_304_and_still_logs(self) -> None:
+        first = self.client.get(reverse("mainPage:index"))
+        second = self.client.get(reverse("mainPage:index"), HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b"")
+        self.assertEqual(Visit_detail.objects.count(), 2)
+        self.assertNotIn("no-store", first["Cache-Control"])
+
+    def test_index_has_no_last_modified_to_miss_deletions(self) -> None:
+        first = self.client.get(reverse("mainPage:index"))
+        self.blog.delete()
+        second = self.client.get(
+            reverse("mainPage:index"), HTTP_IF_MODIFIED_SINCE=http_date(time.time())
+        )
+
+        self.assertNotIn("Last-Modified", first)
+        self.assertEqual(second.status_code, 200)
+        self.assertNotContains(second, "Post")
+
+    def test_renamed_specialisation_produces_a_new_etag(self) -> None:
+        specialisation = Specialisation.objects.create(
+            portfolio=self.portfolio, specialisation_name="Django"
+        )
+        first = self.client.get(reverse("mainPage:index"))
+        specialisation.specialisation_name = "Flask"
+        specialisation.save()
+        second = self.client.get(reverse("mainPage:index"), HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(second.status_code, 200)
+        self.assertContains(second, "Flask")
+
+    def test_content_changes_produce_a_new_etag(self) -> None:
+        first = self.client.get(reverse("mainPage:index"))
+        self.blog.delete()
+        second = self.client.get(reverse("mainPage:index"), HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(first["ETag"], second["ETag"])
+
+    def test_etag_follows_the_csrf_cookie(self) -> None:
+        first = self.client.get(reverse("mainPage:index"))
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = "x" * 64
+        second = self.client.get(reverse("mainPage:index"), HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(second.status_code, 200)
+
+    def test_serve_image_answers_conditional_requests(self) -> None:
+        first = self.client.get(reverse("mainPage:serve_image", args=["ab"]))
+        by_etag = self.client.get(
+            reverse("mainPage:serve_image", args=["ab"]), HTTP_IF_NONE_MATCH=first["ETag"]
+        )
+        by_date = self.client.get(
+            reverse("mainPage:serve_image", args=["ab"]),
+            HTTP_IF_MODIFIED_SINCE=first["Last-Modified"],
+        )
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(by_etag.status_code, 304)
+        self.assertEqual(by_etag["ETag"], first["ETag"])
+        self.assertEqual(by_date.status_code, 304)
+
+
+class ThrottleTests(TestCase):
+    RATES = {"contact": {"ip": (2, 60), "subnet": (3, 60)}}
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.throttle = Throttle(self.RATES, counter=FilteredVisitCounter(autostart=False))
+        self.addCleanup(self.throttle.counter.flush)
+
+    def test_subnets(self) -> None:
+        self.assertEqual(subnet_of("203.0.113.9"), "203.0.113.0/24")
+        self.assertEqual(subnet_of("2001:db8::1"), "2001:db8::/64")
+        self.assertIsNone(subnet_of("unknown"))
+
+    def test_burst_then_refill(self) -> None:
+        with patch("mainPage.throttle.time.time", return_value=1000.0):
+            allowed = [self.throttle.check("contact", "203.0.113.9").allowed for _ in range(2)]
+            blocked = self.throttle.check("contact", "203.0.113.9")
+        with patch("mainPage.throttle.time.time", return_value=1030.0):
+            refilled = self.throttle.check("contact", "203.0.113.9")
+
+        self.assertEqual(allowed, [True, True])
+        self.assertFalse(blocked.allowed)
+        self.assertEqual(blocked.limited_by, "ip")
+        self.assertEqual(blocked.retry_after, 31)
+        self.assertTrue(refilled.allowed)
+
+    def test_subnet_bucket_is_shared(self) -> None:
+        decisions = [self.throttle.check("contact", f"203.0.113.{n}") for n in range(1, 5)]
+
+        self.assertEqual([decision.allowed for decision in decisions], [True, True, True, False])
+        self.assertEqual(decisions[-1].limited_by, "subnet")
+        self.assertTrue(self.throttle.check("contact", "198.51.100.1").allowed)
+        self.assertTrue(self.throttle.check("other", "203.0.113.1").allowed)
+
+    def test_blocked_requests_are_counted(self) -> None:
+        for _ in range(4):
+            self.throttle.check("contact", "203.0.113.9")
+        self.throttle.counter.flush()
+
+        self.assertEqual(self.throttle.blocked, Counter({("contact", "ip"): 2}))
+        self.assertEqual(FilteredVisit.objects.get(reason="throttled:contact:ip").hits, 2)
+
+    def test_falls_back_to_local_buckets_when_the_cache_fails(self) -> None:
+        with patch.object(cache, "get_many", side_effect=ConnectionError("down")), self.assertLogs(
+            "mainPage.throttle", "WARNING"
+        ):
+            decisions = [self.throttle.check("contact", "203.0.113.9").allowed for _ in range(3)]
+
+        self.assertEqual(decisions, [True, True, False])
+
+    def test_local_buckets_are_bounded(self) -> None:
+        buckets = LocalBuckets(max_entries=2)
+        buckets.set_many({"a": (1.0, 0.0), "b": (1.0, 0.0), "c": (1.0, 0.0)}, 60)
+
+        self.assertEqual(buckets.get_many(["a", "b", "c"]), {"b": (1.0, 0.0), "c": (1.0, 0.0)})
+
+    async def test_async_check_shares_the_buckets(self) -> None:
+        self.throttle.check("contact", "203.0.113.9")
+        second = await self.throttle.acheck("contact", "203.0.113.9")
+        third = await self.throttle.acheck("contact", "203.0.113.9")
+
+        self.assertTrue(second.allowed)
+        self.assertFalse(third.allowed)
+
+
+@override_settings(THROTTLE_RATES={"honeypot": {"ip": (1, 60)}, "contact": {"ip": (1, 60)}})
+class ThrottleMiddlewareTests(TestCase):
+    client_class = BrowserClient
+
+    def setUp(self) -> None:
+        cache.clear()
+        get_throttle().blocked.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(lambda: get_throttle().counter.flush())
+
+    def test_honeypot_posts_are_rejected_before_any_query(self) -> None:
+        url = reverse("admin_honeypot:login")
+        self.client.post(url, {"username": "admin", "password": "x"})
+        with self.assertNumQueries(0):
+            response = self.client.post(url, {"username": "admin", "password": "x"})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "60")
+        self.assertEqual(LoginAttempt.objects.count(), 1)
+        self.assertEqual(get_throttle().blocked[("honeypot", "ip")], 1)
+
+    def test_contact_form_is_throttled_but_pages_are_not(self) -> None:
+        data = {"name": "Ann", "email": "ann@example.com", "message": "Hello"}
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            first = self.client.post(reverse("mainPage:index"), data)
+            second = self.client.post(reverse("mainPage:index"), data)
+            page = self.client.get(reverse("mainPage:index"))
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(page.status_code, 200)
+        self.assertEqual(Visit_detail.objects.filter(message="Hello").count(), 1)
+
+    async def test_async_requests_are_throttled(self) -> None:
+        client = AsyncClient(headers={"user-agent": BROWSER_AGENT})
+        url = reverse("admin_honeypot:login")
+        first = await client.post(url, {"username": "admin", "password": "x"})
+        second = await client.post(url, {"username": "admin", "password": "x"})
+
+        self.assertNotEqual(first.status_code, 429)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(await LoginAttempt.objects.acount(), 1)
+
+    def test_forged_forwarded_addresses_share_the_proxy_reported_bucket(self) -> None:
+        url = reverse("admin_honeypot:login")
+        statuses = [
+            self.client.post(
+                url, {"username": "admin"}, HTTP_X_FORWARDED_FOR=f"10.0.0.{n}, 203.0.113.7"
+            ).status_code
+            for n in range(2)
+        ]
+
+        self.assertEqual(statuses[1], 429)
+        self.assertEqual(LoginAttempt.objects.get().ip_address, "203.0.113.7")
+
+    def test_forwarded_for_is_ignored_without_trusted_proxies(self) -> None:
+        url = reverse("admin_honeypot:login")
+        with self.settings(TRUSTED_PROXY_COUNT=0):
+            self.client.post(url, {"username": "admin"}, HTTP_X_FORWARDED_FOR="203.0.113.7")
+
+        self.assertEqual(LoginAttempt.objects.get().ip_address, "127.0.0.1")
+
+    def test_can_be_disabled(self) -> None:
+        url = reverse("admin_honeypot:login")
+        with self.settings(THROTTLE_ENABLED=False):
+            statuses = [self.client.post(url, {"username": "admin"}).status_code for _ in range(3)]
+
+        self.assertNotIn(429, statuses)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self) -> None:
+        singleton_cache.invalidate()
+        image_cache.clear()
+        cache.clear()
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.factory = AsyncRequestFactory()
+        self.portfolio = Portfolio.objects.create(title_text="Title", name_content="Name")
+        Specialisation.objects.create(portfolio=self.portfolio, specialisation_name="Django")
+        self.about = About.objects.create(image=_build_image_file(size=(300, 300)), content="About me")
+        with self.about.image.open("rb") as handle:
+            self.data = handle.read()
+
+    def _get(self, **headers):
+        request = self.factory.get("/", headers={"user-agent": BROWSER_AGENT, **headers})
+        # What CsrfViewMiddleware reads from the cookie; the index ETag follows it.
+        request.META["CSRF_COOKIE"] = "a" * 32
+        return request
+
+    async def test_index_matches_the_sync_page(self) -> None:
+        with patch.object(views.visitor_logger, "aadd") as aadd:
+            response = await views.aindex(self._get(x_forwarded_for="203.0.113.9"))
+            again = await views.aindex(self._get(if_none_match=response["ETag"]))
+
+        aadd.assert_any_await("203.0.113.9", BROWSER_AGENT)
+        self.assertEqual(aadd.await_count, 2)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Django")
+        self.assertIn("private", response["Cache-Control"])
+        self.assertEqual(again.status_code, 304)
+
+    async def test_cached_images_are_served_from_memory(self) -> None:
+        await views.aserve_image(self._get(), "ab")
+        response = await views.aserve_image(self._get(), "ab")
+
+        self.assertEqual(response.content, self.data)
+        self.assertEqual(image_cache.hits, 1)
+
+    async def test_uncached_images_are_streamed(self) -> None:
+        with patch.object(image_cache, "max_item_bytes", 0), patch("mainPage.imageserve.STREAM_CHUNK_SIZE", 100):
+            full = await views.aserve_image(self._get(), "ab")
+            partial = await views.aserve_image(self._get(range="bytes=10-209"), "ab")
+            chunks = [chunk async for chunk in full.streaming_content]
+            partial_body = b"".join([chunk async for chunk in partial.streaming_content])
+
+        self.assertTrue(full.streaming)
+        self.assertEqual(b"".join(chunks), self.data)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(full["Content-Length"], str(len(self.data)))
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial_body, self.data[10:210])
+
+    async def test_missing_image_is_404(self) -> None:
+        with self.assertRaises(Http404):
+            await views.aserve_image(self._get(), "bg")
+
+    async def test_query_budget_middleware_records_async_views(self) -> None:
+        async def view(request):
+            return HttpResponse(str(await People.objects.acount()))
+
+        request = self._get()
+        request.resolver_match = None
+        with override_settings(QUERY_BUDGET_DEFAULT=0), self.assertLogs("mainPage.queries", "WARNING") as logs:
+            await QueryBudgetMiddleware(view)(request)
+
+        self.assertIn("ran 1 queries (budget 0)", logs.output[0])
+
+
+class FilteredVisitCounterWorkerTests(TransactionTestCase):
+    def test_counts_are_written_by_the_worker(self) -> None:
+        counter = FilteredVisitCounter(flush_interval=0.01)
+        self.addCleanup(counter.stop)
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                counter.record(BOT)
+
+        for _ in range(500):
+            if not counter.pending and FilteredVisit.objects.filter(reason=BOT).exists():
+                break
+            time.sleep(0.01)
+        self.assertEqual(FilteredVisit.objects.get(reason=BOT).hits, 3)
+
+
+class AsyncVisitLoggingTests(TransactionTestCase):
+    async def test_visits_are_written_in_the_background(self) -> None:
+        logger = VisitorLogger()
+        with patch("mainPage.models.Utility.get_location_via_ip", return_value=None):
+            await logger.aadd("203.0.113.7", BROWSER_AGENT)
+            await tasks.drain()
+
+        self.assertEqual(await Visit_detail.objects.acount(), 1)
+        person = await People.objects.aget()
+        self.assertEqual(person.ip_address, "203.0.113.7")
+
+    async def _filtered_visit_hits(self, reason: str, expected: int) -> int:
+        # Waits for the counter's worker to write them.
+        hits = 0
+        for _ in range(500):
+            row = await FilteredVisit.objects.filter(reason=reason).afirst()
+            hits = row.hits if row is not None else 0
+            if hits >= expected:
+                break
+            await asyncio.sleep(0.01)
+        return hits
+
+    async def test_filtered_visits_are_counted_off_the_event_loop(self) -> None:
+        traffic = TrafficFilter(counter=FilteredVisitCounter(flush_interval=0.01))
+        self.addCleanup(traffic.counter.stop)
+        with patch("mainPage.log.get_traffic_filter", return_value=traffic):
+            for _ in range(2):
+                await asyncio.sleep(0.02)
+                await VisitorLogger().aadd("203.0.113.7", "Googlebot/2.1")
+
+        self.assertEqual(await self._filtered_visit_hits(BOT, 2), 2)
+        self.assertFalse(await Visit_detail.objects.aexists())
+
+    async def test_throttled_requests_are_counted_off_the_event_loop(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        throttle = Throttle(
+            {"honeypot": {"ip": (1, 60)}}, counter=FilteredVisitCounter(flush_interval=0.01)
+        )
+        self.addCleanup(throttle.counter.stop)
+        client = AsyncClient(headers={"user-agent": BROWSER_AGENT})
+        with patch("mainPage.throttle.get_throttle", return_value=throttle):
+            for _ in range(3):
+                await asyncio.sleep(0.02)
+                await client.post(reverse("admin_honeypot:login"), {"username": "admin"})
+
+        self.assertEqual(await self._filtered_visit_hits("throttled:honeypot:ip", 2), 2)
+
+    async def test_failures_are_logged(self) -> None:
+        logger = VisitorLogger()
+        with patch.object(logger, "record", side_effect=RuntimeError("boom")):
+            with self.assertLogs("mainPage.tasks", "ERROR"):
+                await logger.aadd("203.0.113.7", BROWSER_AGENT)
+                await tasks.drain()
+
+
+class ImageServingTests(TestCase):
+    def setUp(self) -> None:
+        singleton_cache.invalidate()
+        image_cache.clear()
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.about = About.objects.create(image=_build_image_file(), content="About me")
+        self.url = reverse("mainPage:serve_image", args=["ab"])
+        with self.about.image.open("rb") as handle:
+            self.data = handle.read()
+
+    def test_repeat_requests_are_served_from_memory(self) -> None:
+        first = self.client.get(self.url)
+        hits = image_cache.hits
+        with patch.object(FileSystemStorage, "open", side_effect=AssertionError):
+            second = self.client.get(self.url)
+
+        self.assertEqual(second.content, self.data)
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertEqual(second["ETag"], f'"{hashlib.sha256(self.data).hexdigest()}"')
+        self.assertEqual(image_cache.hits, hits + 1)
+
+    def test_about_save_invalidates_cached_bytes(self) -> None:
+        self.client.get(self.url)
+        self.about.image = _build_image_file("other.jpg")
+        self.about.save()
+
+        self.assertEqual(image_cache.size, 0)
+
+    def test_cache_is_bounded_by_total_size(self) -> None:
+        cache = ImageCache(max_bytes=len(self.data), max_item_bytes=len(self.data), ttl=60)
+        other = About(image=_build_image_file("second.jpg"))
+        other.image.save("second.jpg", other.image.file, save=False)
+
+        cache.fetch(self.about.image)
+        cache.fetch(other.image)
+
+        self.assertEqual(cache.size, len(self.data))
+
+    def test_byte_ranges(self) -> None:
+        partial = self.client.get(self.url, HTTP_RANGE="bytes=0-9")
+        suffix = self.client.get(self.url, HTTP_RANGE="bytes=-5")
+        unsatisfiable = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.data)}-")
+
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial.content, self.data[:10])
+        self.assertEqual(partial["Content-Range"], f"bytes 0-9/{len(self.data)}")
+        self.assertEqual(suffix.content, self.data[-5:])
+        self.assertEqual(unsatisfiable.status_code, 416)
+
+    def test_stale_if_range_returns_full_body(self) -> None:
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.data)
+
+    def test_large_files_stream_from_storage(self) -> None:
+        with patch.object(image_cache, "max_item_bytes", 1):
+            response = self.client.get(self.url)
+            partial = self.client.get(self.url, HTTP_RANGE="bytes=2-5")
+
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+        self.assertEqual(partial.content, self.data[2:6])
+        self.assertEqual(image_cache.size, 0)
+
+    def test_versioned_about_url_is_immutable_once_variant_exists(self) -> None:
+        version = str(int(self.about.last_updated.timestamp()))
+        pending = self.client.get(self.url, {"v": version, "w": "480"})
+        variant = ContentFile(b"variant")
+        self.about.image.storage.save(variant_name(self.about.image.name, 480, "jpg"), variant)
+        # The image job invalidates the cache when it writes variants.
+        variant_cache.invalidate(self.about.image.name)
+        versioned = self.client.get(self.url, {"v": version, "w": "480"})
+        other = self.client.get(self.url, {"v": str(int(version) - 1), "w": "480"})
+        plain = self.client.get(self.url)
+
+        self.assertIn("no-cache", pending["Cache-Control"])
+        self.assertIn("immutable", versioned["Cache-Control"])
+        self.assertIn("no-cache", other["Cache-Control"])
+        self.assertIn("no-cache", plain["Cache-Control"])
+
+    @override_settings(
+        IMAGE_SENDFILE="x-accel-redirect", IMAGE_ACCEL_REDIRECT_PREFIX="/media-internal/"
+    )
+    def test_accel_redirect_hands_off_to_front_end(self) -> None:
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["X-Accel-Redirect"], f"/media-internal/{self.about.image.name}")
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+
+    @override_settings(IMAGE_SENDFILE="x-sendfile")
+    def test_x_sendfile_hands_off_to_front_end(self) -> None:
+        response = self.client.get(self.url)
+
+        self.assertEqual(response["X-Sendfile"], self.about.image.path)
+
+
+@override_settings(
+    IMAGE_VARIANT_WIDTHS=(480, 960), IMAGE_VARIANT_FORMATS=("webp", "jpg"), IMAGE_JOBS_MODE="sync"
+)
+class ImageVariantTests(TestCase):
+    def setUp(self) -> None:
+        singleton_cache.invalidate()
+        image_cache.clear()
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.about = About.objects.create(
+                image=_build_image_file(size=(1200, 600)), content="About me"
+            )
+        self.about.refresh_from_db()
+        self.url = reverse("mainPage:serve_image", args=["ab"])
+
+    def _exists(self, width: int, ext: str) -> bool:
+        storage = self.about.image.storage
+        return storage.exists(variant_name(self.about.image.name, width, ext))
+
+    def test_saving_generates_width_and_format_variants(self) -> None:
+        for width in (480, 960):
+            for ext in ("webp", "jpg"):
+                self.assertTrue(self._exists(width, ext), (width, ext))
+
+        with self.about.image.storage.open(
+            variant_name(self.about.image.name, 480, "webp")
+        ) as handle, Image.open(handle) as variant:
+            self.assertEqual(variant.format, "WEBP")
+            self.assertEqual(variant.size, (480, 240))
+
+    def test_variants_wider_than_original_are_skipped(self) -> None:
+        self.about.image = _build_image_file("small.jpg", size=(600, 300))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.about.save()
+        self.about.refresh_from_db()
+
+        self.assertTrue(self._exists(480, "jpg"))
+        self.assertFalse(self._exists(960, "jpg"))
+        self.assertEqual(
+            generate_variants(self.about.image.storage, self.about.image.name),
+            [variant_name(self.about.image.name, 480, ext) for ext in ("webp", "jpg")],
+        )
+
+    def test_serve_negotiates_format_and_width(self) -> None:
+        webp = self.client.get(self.url, {"w": "400"}, HTTP_ACCEPT="image/webp,*/*")
+        jpeg = self.client.get(self.url, {"w": "600"}, HTTP_ACCEPT="*/*")
+        default = self.client.get(self.url, HTTP_ACCEPT="image/webp")
+        original = self.client.get(self.url, {"w": "2000"}, HTTP_ACCEPT="image/webp")
+
+        self.assertEqual(webp["Content-Type"], "image/webp")
+        self.assertEqual(Image.open(BytesIO(webp.content)).size, (480, 240))
+        self.assertEqual(jpeg["Content-Type"], "image/jpeg")
+        self.assertEqual(Image.open(BytesIO(jpeg.content)).size, (960, 480))
+        self.assertEqual(Image.open(BytesIO(default.content)).size, (960, 480))
+        self.assertEqual(Image.open(BytesIO(original.content)).size, (1200, 600))
+        self.assertIn("Accept", webp["Vary"])
+
+    def test_formats_refused_with_q_zero_are_not_served(self) -> None:
+        refused = self.client.get(self.url, {"w": "400"}, HTTP_ACCEPT="image/webp;q=0, image/*")
+        weighted = self.client.get(self.url, {"w": "400"}, HTTP_ACCEPT="image/jpeg, image/webp;q=0.5")
+
+        self.assertEqual(refused["Content-Type"], "image/jpeg")
+        self.assertEqual(weighted["Content-Type"], "image/webp")
+
+    def test_known_variants_are_picked_without_storage_lookups(self) -> None:
+        self.client.get(self.url, {"w": "400"}, HTTP_ACCEPT="image/webp")
+        image_cache.clear()
+        with patch.object(FileSystemStorage, "exists", side_effect=AssertionError):
+            response = self.client.get(self.url, {"w": "400"}, HTTP_ACCEPT="image/webp")
+
+        self.assertEqual(response["Content-Type"], "image/webp")
+
+    def test_deleting_the_image_removes_its_variants(self) -> None:
+        storage, name = self.about.image.storage, self.about.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.about.delete()
+
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(storage.exists(variant_name(name, 480, "webp")))
+        self.assertFalse(storage.exists(variant_name(name, 960, "jpg")))
+
+
+class CompressionTests(TestCase):
+    def _jpeg(self, size, **save_options) -> BytesIO:
+        buffer = BytesIO()
+        Image.new("RGB", size, color="green").save(buffer, format="JPEG", **save_options)
+        buffer.seek(0)
+        return buffer
+
+    def test_large_uploads_are_bounded_to_the_maximum_dimension(self) -> None:
+        output = BytesIO()
+
+        size = compress_file(self._jpeg((4000, 3000)), output, max_dimension=1000)
+
+        self.assertEqual(size, (1000, 750))
+        output.seek(0)
+        with Image.open(output) as result:
+            self.assertEqual((result.format, result.size), ("JPEG", (1000, 750)))
+
+    def test_jpeg_sources_are_decoded_at_reduced_scale(self) -> None:
+        drafts = []
+        original_draft = JpegImageFile.draft
+
+        def draft(image, mode, size):
+            result = original_draft(image, mode, size)
+            drafts.append(result)
+            return result
+
+        with patch.object(JpegImageFile, "draft", draft):
+            compress_file(self._jpeg((4000, 3000)), BytesIO(), max_dimension=1000)
+
+        self.assertTrue(any(drafts), "the JPEG decoder was not asked to scale down")
+
+    def test_rotated_photos_are_transposed_within_the_bound(self) -> None:
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotated 90 degrees clockwise.
+        output = BytesIO()
+
+        size = compress_file(
+            self._jpeg((3000, 1000), exif=exif.tobytes()), output, max_dimension=1500
+        )
+
+        self.assertEqual(size, (500, 1500))
+
+    def test_zero_keeps_the_original_resolution(self) -> None:
+        self.assertEqual(compress_file(self._jpeg((1200, 900)), BytesIO(), max_dimension=0), (1200, 900))
+
+    def test_png_with_alpha_becomes_rgb_jpeg(self) -> None:
+        source = BytesIO()
+        Image.new("RGBA", (30, 20), color=(255, 0, 0, 128)).save(source, format="PNG")
+        source.seek(0)
+        output = BytesIO()
+
+        compress_file(source, output)
+
+        output.seek(0)
+        with Image.open(output) as result:
+            self.assertEqual((result.format, result.mode), ("JPEG", "RGB"))
+
+
+@override_settings(IMAGE_VARIANT_WIDTHS=(), IMAGE_JOBS_MODE="sync")
+class ImageJobTests(TestCase):
+    def setUp(self) -> None:
+        singleton_cache.invalidate()
+        image_cache.clear()
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.portfolio = Portfolio.objects.create(title_text="Title", name_content="Name")
+
+    def _build_png(self, name: str = "upload.png") -> SimpleUploadedFile:
+        buffer = BytesIO()
+        Image.new("RGBA", (40, 20), color="red").save(buffer, format="PNG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+    def test_upload_is_stored_as_is_and_compressed_after_commit(self) -> None:
+        with self.captureOnCommitCallbacks() as callbacks:
+            background = Background_img.objects.create(
+                portfolio=self.portfolio, image=self._build_png()
+            )
+        self.assertTrue(background.image.name.endswith(".png"))
+        self.assertEqual(background.processing_status, Background_img.PENDING)
+        original = background.image.name
+
+        for callback in callbacks:
+            callback()
+        background.refresh_from_db()
+
+        storage = background.image.storage
+        self.assertEqual(background.processing_status, Background_img.DONE)
+        self.assertTrue(background.image.name.endswith(".jpg"))
+        self.assertFalse(storage.exists(original))
+        with storage.open(background.image.name) as handle:
+            data = handle.read()
+        self.assertEqual(background.image_hash, hashlib.sha256(data).hexdigest())
+        self.assertEqual(Image.open(BytesIO(data)).format, "JPEG")
+
+    def test_content_only_save_does_not_recompress(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            about = About.objects.create(image=_build_image_file(), content="About me")
+        about.refresh_from_db()
+
+        about.content = "Updated"
+        with patch("mainPage.imagejobs.compress_file") as compress:
+            with self.captureOnCommitCallbacks(execute=True):
+                about.save()
+
+        compress.assert_not_called()
+
+    def test_unchanged_image_is_skipped_unless_forced(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            about = About.objects.create(image=_build_image_file(), content="About me")
+        about.refresh_from_db()
+
+        with patch("mainPage.imagejobs.compress_file", wraps=compress_file) as compress:
+            self.assertEqual(run_job(About, about.pk), SKIPPED)
+            compress.assert_not_called()
+            self.assertEqual(run_job(About, about.pk, force=True), About.DONE)
+            compress.assert_called_once()
+
+    def test_job_leaves_an_image_replaced_meanwhile_alone(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            about = About.objects.create(image=_build_image_file(), content="About me")
+        about.refresh_from_db()
+        storage, folder = about.image.storage, about.image.name.rsplit("/", 1)[0]
+        replacement = storage.save(f"{folder}/replacement.jpg", ContentFile(b"new"))
+        before = set(storage.listdir(folder)[1])
+
+        def replace_then_compress(*args, **kwargs):
+            About.objects.filter(pk=about.pk).update(image=replacement)
+            return compress_file(*args, **kwargs)
+
+        with patch("mainPage.imagejobs.compress_file", side_effect=replace_then_compress):
+            self.assertEqual(run_job(About, about.pk, force=True), SKIPPED)
+
+        about.refresh_from_db()
+        self.assertEqual(about.image.name, replacement)
+        self.assertEqual(set(storage.listdir(folder)[1]), before)
+
+    def test_failed_job_keeps_the_upload_and_records_the_error(self) -> None:
+        with patch("mainPage.imagejobs.compress_file", side_effect=OSError("broken image")):
+            with self.assertLogs("mainPage.imagejobs", "ERROR"), self.captureOnCommitCallbacks(
+                execute=True
+            ):
+                background = Background_img.objects.create(
+                    portfolio=self.portfolio, image=_build_image_file()
+                )
+        name = background.image.name
+        background.refresh_from_db()
+
+        self.assertEqual(background.processing_status, Background_img.FAILED)
+        self.assertEqual(background.processing_error, "broken image")
+        self.assertEqual(background.image.name, name)
+        self.assertTrue(background.image.storage.exists(name))
+
+    @override_settings(IMAGE_MAX_DIMENSION=16)
+    def test_stored_jpeg_respects_the_maximum_dimension(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            background = Background_img.objects.create(
+                portfolio=self.portfolio, image=_build_image_file(size=(64, 32))
+            )
+        background.refresh_from_db()
+
+        self.assertEqual((background.image.width, background.image.height), (16, 8))
+
+    def test_processing_refreshes_the_image_caches(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            Background_img.objects.create(portfolio=self.portfolio, image=self._build_png())
+
+        self.assertTrue(Background_img.random().image.name.endswith(".jpg"))
+
+    def test_admin_action_queues_recompression(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            background = Background_img.objects.create(
+                portfolio=self.portfolio, image=_build_image_file()
+            )
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(admin_user)
+
+        with patch("mainPage.imagejobs.compress_file", wraps=compress_file) as compress:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse("admin:mainPage_background_img_changelist"),
+                    {"action": "recompress_images", "_selected_action": [background.pk]},
+                )
+
+        self.assertEqual(response.status_code, 302)
+        compress.assert_called_once()
+
+    def test_recompress_command_reports_progress(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            Background_img.objects.create(portfolio=self.portfolio, image=_build_image_file())
+        Background_img.objects.update(processing_status=Background_img.FAILED)
+
+        out = StringIO()
+        call_command("recompress_images", stdout=out)
+
+        self.assertIn("Background_img 1/1: skipped", out.getvalue())
+        self.assertEqual(Background_img.objects.get().processing_status, Background_img.DONE)
+
 
 class ServeImageViewTests(TestCase):
     def setUp(self) -> None:
+        singleton_cache.invalidate()
+        # Rolled-back test rows never send post_delete, so start from a cold sampler.
+        background_sampler.invalidate()
         self.portfolio = Portfolio.objects.create(title_text="Title", name_content="Name")
 
     def test_serve_image_returns_404_for_missing_background(self) -> None:
@@ -187,3 +2031,26 @@ class ServeImageViewTests(TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response["Content-Type"], "image/jpeg")
+
+    def test_background_replaced_by_another_worker_is_picked_again(self) -> None:
+        with TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            background = Background_img.objects.create(portfolio=self.portfolio, image=_build_image_file())
+            Background_img.random()
+            storage = background.image.storage
+            new_name = storage.save("mainPage/background_img/new.jpg", _build_image_file("new.jpg"))
+            # Another worker's change: no signal reaches this process.
+            Background_img.objects.filter(pk=background.pk).update(image=new_name)
+            storage.delete(background.image.name)
+
+            response = self.client.get(reverse("mainPage:serve_image", args=["bg"]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Background_img.random().image.name, new_name)
+
+    def test_serve_image_returns_404_when_the_file_is_gone(self) -> None:
+        Background_img.objects.bulk_create([Background_img(portfolio=self.portfolio, image="bg/gone.jpg")])
+
+        with TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            response = self.client.get(reverse("mainPage:serve_image", args=["bg"]))
+
+        self.assertEqual(response.status_code, 404)
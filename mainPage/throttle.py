@@ -0,0 +1,293 @@
+"""Token-bucket throttling of the endpoints that write on every POST.
+
+Each contact form submission writes a visit (and may look its address up),
+and each honeypot login writes a ``LoginAttempt`` and mails the admins.
+``ThrottleMiddleware`` rejects POSTs to the URL names in ``THROTTLE_VIEWS``
+with ``429 Too Many Requests`` before the view runs, once the client's bucket
+for that scope is empty. The client is ``REMOTE_ADDR`` as set by
+``RemoteAddrMiddleware``, which only trusts the ``X-Forwarded-For`` entries
+added by the ``TRUSTED_PROXY_COUNT`` proxies.
+
+Every scope in ``THROTTLE_RATES`` has a bucket per address and one per subnet
+(``THROTTLE_SUBNET_PREFIXES``, /24 and /64 by default), each given as
+``(burst, seconds)``: up to ``burst`` requests at once, refilled at
+``burst / seconds`` per second. A request needs a token from all of its
+buckets. Buckets live in the ``THROTTLE_CACHE_ALIAS`` cache so workers share
+them; if that cache fails, a per-process copy is used until it recovers.
+
+Rejections are counted per scope and bucket kind in ``Throttle.blocked`` and,
+per day, in ``FilteredVisit`` (reasons like ``throttled:contact:ip``).
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.http import HttpResponse
+
+from mainPage.pagecache import acache_call
+from mainPage.traffic import FilteredVisitCounter
+
+
+log = logging.getLogger(__name__)
+
+IP = "ip"
+SUBNET = "subnet"
+KEY = "mainPage:throttle:{scope}:{kind}:{value}"
+
+# Bucket state: (tokens, time.time() of the last update).
+State = Tuple[float, float]
+
+
+@dataclass(frozen=True)
+class Rate:
+    burst: int
+    seconds: float
+
+    @property
+    def per_second(self) -> float:
+        return self.burst / self.seconds
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    limited_by: Optional[str] = None
+    retry_after: int = 0
+
+
+def subnet_of(ip_addr: str, prefixes: Tuple[int, int] = (24, 64)) -> Optional[str]:
+    try:
+        address = ipaddress.ip_address(ip_addr)
+    except ValueError:
+        return None
+    prefix = prefixes[0] if address.version == 4 else prefixes[1]
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+
+def _refill(state: Optional[State], rate: Rate, now: float) -> float:
+    if state is None:
+        return float(rate.burst)
+    tokens, updated = state
+    return min(float(rate.burst), tokens + max(now - updated, 0.0) * rate.per_second)
+
+
+class LocalBuckets:
+    """Per-process bucket store used when the shared cache is unavailable."""
+
+    def __init__(self, max_entries: int = 10000) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, State]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> Dict[str, State]:
+        with self._lock:
+            return {key: self._entries[key] for key in keys if key in self._entries}
+
+    def set_many(self, states: Mapping[str, State], timeout: float) -> None:
+        with self._lock:
+            for key, state in states.items():
+                self._entries[key] = state
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class Throttle:
+    def __init__(
+        self,
+        rates: Mapping[str, Mapping[str, Tuple[int, float]]],
+        cache_alias: Optional[str] = "default",
+        subnet_prefixes: Tuple[int, int] = (24, 64),
+        counter: Optional[FilteredVisitCounter] = None,
+    ) -> None:
+        self.rates = {
+            scope: {kind: Rate(*rate) for kind, rate in kinds.items()} for scope, kinds in rates.items()
+        }
+        self.cache_alias = cache_alias
+        self.subnet_prefixes = subnet_prefixes
+        self.counter = counter if counter is not None else FilteredVisitCounter()
+        self.local = LocalBuckets()
+        self.blocked: "Counter[Tuple[str, str]]" = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "Throttle":
+        return cls(
+            rates=getattr(settings, "THROTTLE_RATES", {}),
+            cache_alias=getattr(settings, "THROTTLE_CACHE_ALIAS", "default"),
+            subnet_prefixes=tuple(getattr(settings, "THROTTLE_SUBNET_PREFIXES", (24, 64))),
+            counter=FilteredVisitCounter(
+                flush_interval=getattr(settings, "VISITOR_FILTER_FLUSH_INTERVAL", 60.0)
+            ),
+        )
+
+    def _buckets(self, scope: str, ip_addr: str) -> Dict[str, Tuple[str, Rate]]:
+        rates = self.rates.get(scope, {})
+        values = {IP: ip_addr, SUBNET: subnet_of(ip_addr, self.subnet_prefixes)}
+        return {
+            KEY.format(scope=scope, kind=kind, value=values[kind]): (kind, rate)
+            for kind, rate in rates.items()
+            if values.get(kind)
+        }
+
+    def _decide(
+        self, scope: str, buckets: Dict[str, Tuple[str, Rate]], states: Mapping[str, State], now: float
+    ) -> Tuple[Decision, Dict[str, State]]:
+        tokens = {key: _refill(states.get(key), rate, now) for key, (_, rate) in buckets.items()}
+        empty = [key for key, value in tokens.items() if value < 1.0]
+        if empty:
+            # Rejected requests do not consume, so a blocked client regains
+            # access at the refill rate rather than never.
+            key = max(empty, key=lambda key: (1.0 - tokens[key]) / buckets[key][1].per_second)
+            kind, rate = buckets[key]
+            retry_after = int((1.0 - tokens[key]) / rate.per_second) + 1
+            self._record_block(scope, kind)
+            return Decision(False, kind, retry_after), {}
+        return Decision(True), {key: (value - 1.0, now) for key, value in tokens.items()}
+
+    def _timeout(self, buckets: Dict[str, Tuple[str, Rate]]) -> int:
+        # A bucket left alone for this long is full again, the same as a missing key.
+        return int(max(rate.seconds for _, rate in buckets.values())) + 1
+
+    def _record_block(self, scope: str, kind: str) -> None:
+        with self._lock:
+            self.blocked[(scope, kind)] += 1
+        self.counter.record(f"throttled:{scope}:{kind}")
+        log.info("Throttled a %s request by %s", scope, kind)
+
+    def check(self, scope: str, ip_addr: str) -> Decision:
+        """Take a token from each of the client's buckets for ``scope``, if all have one."""
+
+        buckets = self._buckets(scope, ip_addr)
+        if not buckets:
+            return Decision(True)
+        keys = list(buckets)
+        cache = self._cache()
+        try:
+            states = cache.get_many(keys) if cache is not None else self.local.get_many(keys)
+        except Exception:
+            log.warning("Throttle cache unavailable, using process-local buckets", exc_info=True)
+            cache, states = None, self.local.get_many(keys)
+        decision, updates = self._decide(scope, buckets, states, time.time())
+        if updates:
+            self._store(cache, updates, self._timeout(buckets))
+        return decision
+
+    async def acheck(self, scope: str, ip_addr: str) -> Decision:
+        buckets = self._buckets(scope, ip_addr)
+        if not buckets:
+            return Decision(True)
+        keys = list(buckets)
+        cache = self._cache()
+        try:
+            states = await acache_call(cache, "get_many", keys) if cache is not None else self.local.get_many(keys)
+        except Exception:
+            log.warning("Throttle cache unavailable, using process-local buckets", exc_info=True)
+            cache, states = None, self.local.get_many(keys)
+        decision, updates = self._decide(scope, buckets, states, time.time())
+        if updates:
+            timeout = self._timeout(buckets)
+            if cache is None:
+                self.local.set_many(updates, timeout)
+            else:
+                try:
+                    await acache_call(cache, "set_many", updates, timeout)
+                except Exception:
+                    log.warning("Throttle cache unavailable, using process-local buckets", exc_info=True)
+                    self.local.set_many(updates, timeout)
+        return decision
+
+    def _cache(self):
+        return caches[self.cache_alias] if self.cache_alias else None
+
+    def _store(self, cache, updates: Dict[str, State], timeout: int) -> None:
+        if cache is not None:
+            try:
+                cache.set_many(updates, timeout)
+                return
+            except Exception:
+                log.warning("Throttle cache unavailable, using process-local buckets", exc_info=True)
+        self.local.set_many(updates, timeout)
+
+
+_throttle: Optional[Throttle] = None
+_throttle_lock = threading.Lock()
+
+
+def get_throttle() -> Throttle:
+    global _throttle
+    if _throttle is None:
+        with _throttle_lock:
+            if _throttle is None:
+                _throttle = Throttle.from_settings()
+    return _throttle
+
+
+def _reset_throttle(*, setting: str, **kwargs) -> None:
+    global _throttle
+    if setting.startswith("THROTTLE_") and _throttle is not None:
+        _throttle.counter.stop()
+        _throttle = None
+
+
+setting_changed.connect(_reset_throttle)
+
+
+def throttled_response(decision: Decision) -> HttpResponse:
+    response = HttpResponse("Too many requests, please try again later.\n", status=429, content_type="text/plain")
+    response["Retry-After"] = str(decision.retry_after)
+    return response
+
+
+class ThrottleMiddleware:
+    """Apply the throttle to POSTs to the views named in ``THROTTLE_VIEWS``."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Django awaits an async process_view under the async handler
+            # instead of running a sync one on a thread.
+            self.process_view = self._aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def _scope(self, request) -> Optional[str]:
+        if request.method != "POST" or not getattr(settings, "THROTTLE_ENABLED", True):
+            return None
+        match = request.resolver_match
+        return getattr(settings, "THROTTLE_VIEWS", {}).get(match.view_name if match else None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        scope = self._scope(request)
+        if scope is None:
+            return None
+        decision = get_throttle().check(scope, request.META.get("REMOTE_ADDR", ""))
+        return None if decision.allowed else throttled_response(decision)
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        scope = self._scope(request)
+        if scope is None:
+            return None
+        decision = await get_throttle().acheck(scope, request.META.get("REMOTE_ADDR", ""))
+        return None if decision.allowed else throttled_response(decision)
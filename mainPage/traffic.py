@@ -0,0 +1,238 @@
+"""Classification of visits before they are persisted.
+
+Health checks, uptime monitors and crawlers make up most requests to ``/``.
+``TrafficFilter`` decides per request whether a visit is worth a ``People`` /
+``Visit_detail`` row and a geo lookup:
+
+* addresses in ``VISITOR_ALLOW_NETWORKS`` are always recorded,
+* addresses in ``VISITOR_DENY_NETWORKS`` never are,
+* user agents matching ``VISITOR_BOT_PATTERNS`` (compiled into one
+  case-insensitive regex, with an LRU cache of results) or missing entirely
+  are treated as bots.
+
+Filtered visits only increment an in-memory counter per day and reason,
+which a background thread adds to the ``FilteredVisit`` table every
+``flush_interval`` seconds.
+"""
+
+from __future__ import annotations
+
+import atexit
+import ipaddress
+import logging
+import re
+import threading
+from collections import Counter
+from datetime import date
+from functools import lru_cache
+from typing import Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+log = logging.getLogger(__name__)
+
+BOT = "bot"
+DENIED = "denied"
+
+DEFAULT_BOT_PATTERNS = (
+    r"bot\b",
+    r"crawl",
+    r"spider",
+    r"slurp",
+    r"monitor",
+    r"uptime",
+    r"pingdom",
+    r"health[-_ ]?check",
+    r"headless",
+    r"lighthouse",
+    r"facebookexternalhit",
+    r"embedly",
+    r"preview",
+    r"^curl/",
+    r"^wget/",
+    r"^python-",
+    r"^go-http-client/",
+    r"^okhttp/",
+    r"^java/",
+    r"^axios/",
+    r"^libwww-perl/",
+    r"^scrapy/",
+)
+
+
+def _networks(specs: Iterable[str]) -> Tuple:
+    return tuple(ipaddress.ip_network(spec, strict=False) for spec in specs)
+
+
+class FilteredVisitCounter:
+    """Per-day, per-reason counts of filtered visits, flushed in batches.
+
+    ``record`` only counts in memory, so it is safe on the event loop of the
+    async views. A daemon worker adds the counts to ``FilteredVisit`` every
+    ``flush_interval`` seconds.
+    """
+
+    def __init__(self, flush_interval: float = 60.0, autostart: bool = True) -> None:
+        self.flush_interval = flush_interval
+        self.autostart = autostart
+        self._counts: "Counter[Tuple[date, str]]" = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._atexit_registered = False
+
+    @property
+    def pending(self) -> int:
+        return sum(self._counts.values())
+
+    def record(self, reason: str) -> None:
+        if self.autostart:
+            self.start()
+        with self._lock:
+            self._counts[(timezone.localdate(), reason)] += 1
+
+    def start(self) -> None:
+        """Start the background worker if it is not already running."""
+
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._stop.clear()
+            self._worker = threading.Thread(target=self._run, name="filtered-visits", daemon=True)
+            self._worker.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the worker and write the pending counts."""
+
+        self._stop.set()
+        worker = self._worker
+        if worker is not None and worker is not threading.current_thread():
+            worker.join(timeout)
+        self._worker = None
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(min(self.flush_interval, threading.TIMEOUT_MAX)):
+            close_old_connections()
+            self.flush()
+        close_old_connections()
+
+    def flush(self) -> int:
+        """Add the pending counts to ``FilteredVisit``; return how many were written."""
+
+        from mainPage.models import FilteredVisit
+
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+
+        try:
+            with transaction.atomic():
+                for (day, reason), hits in sorted(counts.items()):
+                    FilteredVisit.objects.get_or_create(
+                        day=day, reason=reason, defaults={"hits": 0}
+                    )
+                    FilteredVisit.objects.filter(day=day, reason=reason).update(
+                        hits=F("hits") + hits
+                    )
+        except Exception:
+            log.exception("Failed to store %d filtered visit counts", len(counts))
+            with self._lock:
+                self._counts.update(counts)
+            return 0
+        return sum(counts.values())
+
+
+class TrafficFilter:
+    def __init__(
+        self,
+        bot_patterns: Iterable[str] = DEFAULT_BOT_PATTERNS,
+        allow_networks: Iterable[str] = (),
+        deny_networks: Iterable[str] = (),
+        cache_size: int = 1024,
+        counter: Optional[FilteredVisitCounter] = None,
+    ) -> None:
+        patterns = [f"(?:{pattern})" for pattern in bot_patterns]
+        self._bot_re = re.compile("|".join(patterns), re.IGNORECASE) if patterns else None
+        self.allow_networks = _networks(allow_networks)
+        self.deny_networks = _networks(deny_networks)
+        self.counter = counter if counter is not None else FilteredVisitCounter()
+        self.is_bot_agent = lru_cache(maxsize=cache_size)(self._match_agent)
+
+    @classmethod
+    def from_settings(cls) -> "TrafficFilter":
+        return cls(
+            bot_patterns=getattr(settings, "VISITOR_BOT_PATTERNS", DEFAULT_BOT_PATTERNS),
+            allow_networks=getattr(settings, "VISITOR_ALLOW_NETWORKS", ()),
+            deny_networks=getattr(settings, "VISITOR_DENY_NETWORKS", ()),
+            cache_size=getattr(settings, "VISITOR_AGENT_CACHE_SIZE", 1024),
+            counter=FilteredVisitCounter(
+                flush_interval=getattr(settings, "VISITOR_FILTER_FLUSH_INTERVAL", 60.0)
+            ),
+        )
+
+    def _match_agent(self, user_agent: str) -> bool:
+        user_agent = user_agent.strip()
+        if not user_agent:
+            return True
+        return self._bot_re is not None and self._bot_re.search(user_agent) is not None
+
+    def classify(self, ip_addr: str, user_agent: str) -> Optional[str]:
+        """Return why the visit should not be recorded, or ``None`` to record it."""
+
+        if self.allow_networks or self.deny_networks:
+            try:
+                address = ipaddress.ip_address(ip_addr)
+            except ValueError:
+                address = None
+            if address is not None:
+                if any(address in network for network in self.allow_networks):
+                    return None
+                if any(address in network for network in self.deny_networks):
+                    return DENIED
+        if self.is_bot_agent(user_agent or ""):
+            return BOT
+        return None
+
+    def admit(self, ip_addr: str, user_agent: str) -> bool:
+        """Classify a visit, counting it if it is filtered; return whether to record it."""
+
+        reason = self.classify(ip_addr, user_agent)
+        if reason is None:
+            return True
+        self.counter.record(reason)
+        return False
+
+
+_traffic_filter: Optional[TrafficFilter] = None
+_filter_lock = threading.Lock()
+
+
+def get_traffic_filter() -> TrafficFilter:
+    global _traffic_filter
+    if _traffic_filter is None:
+        with _filter_lock:
+            if _traffic_filter is None:
+                _traffic_filter = TrafficFilter.from_settings()
+    return _traffic_filter
+
+
+def _reset_traffic_filter(*, setting: str, **kwargs) -> None:
+    global _traffic_filter
+    if setting.startswith("VISITOR_") and _traffic_filter is not None:
+        _traffic_filter.counter.stop()
+        _traffic_filter = None
+
+
+setting_changed.connect(_reset_traffic_filter)
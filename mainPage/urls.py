@@ -1,10 +1,16 @@
+from django.conf import settings
 from django.urls import path
 
 from mainPage import views
 
 app_name = 'mainPage'
 
+if getattr(settings, 'ASYNC_VIEWS', False):
+    index, serve_image = views.aindex, views.aserve_image
+else:
+    index, serve_image = views.index, views.serve_image
+
 urlpatterns = [
-    path('', views.index, name='index'),
-    path('getImg/<str:types>', views.serve_image, name='serve_image')
+    path('', index, name='index'),
+    path('getImg/<str:types>', serve_image, name='serve_image')
 ]
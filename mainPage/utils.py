@@ -5,7 +5,8 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Dict, Optional
 
-from ip2geotools.databases.noncommercial import DbIpCity
+from mainPage.geo import get_resolver
+from mainPage.middleware import client_address
 
 
 @dataclass(frozen=True)
@@ -20,12 +21,13 @@ class Utility:
     """Collection of helpers used across the app."""
 
     def get_client_ip_address(self, request) -> str:
-        """Return the visitor IP, accounting for proxied requests."""
+        """Return the visitor IP, accounting for proxied requests.
 
-        x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
-        if x_forwarded_for:
-            return x_forwarded_for.split(",")[0].strip()
-        return request.META.get("REMOTE_ADDR", "")
+        Only the ``X-Forwarded-For`` entries the trusted proxies added count;
+        the leftmost one is whatever the client sent.
+        """
+
+        return client_address(request.META)
 
     def get_user_agent(self, request) -> str:
         """Return the raw user agent string for the request."""
@@ -34,21 +36,9 @@ class Utility:
 
     @staticmethod
     def get_location_via_ip(ip_addr: str) -> Optional[Dict[str, str]]:
-        """Resolve a location dictionary for the provided IP address."""
-
-        if not ip_addr:
-            return None
-
-        try:
-            response = DbIpCity.get(str(ip_addr), api_key="free")
-        except Exception:  # pragma: no cover - defensive against API errors.
-            return None
+        """Resolve a location dictionary for the provided IP address (cached)."""
 
-        return {
-            "city": response.city,
-            "region": response.region,
-            "country": response.country,
-        }
+        return get_resolver().resolve(ip_addr)
 
 
 # Backwards compatibility with the previous import style.
@@ -0,0 +1,177 @@
+"""Responsive width/format variants of uploaded images.
+
+Once an upload has been compressed, the image job (``mainPage.imagejobs``)
+writes downscaled copies next to it, one per configured width and format (``photo_w480.webp``,
+``photo_w480.jpg``, ...). ``serve_image`` then picks the smallest variant at
+least as wide as the requested ``w`` in the best format the client accepts,
+falling back to the original until the variants exist.
+"""
+
+from __future__ import annotations
+
+import logging
+import mimetypes
+import os
+import threading
+from functools import lru_cache
+from io import BytesIO
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.signals import setting_changed
+from PIL import Image, ImageOps, features
+
+
+log = logging.getLogger(__name__)
+
+# Preferred first; the MIME type decides what a client's Accept header allows.
+FORMATS = {
+    "avif": ("AVIF", "image/avif", {"quality": 50}),
+    "webp": ("WEBP", "image/webp", {"quality": 70, "method": 4}),
+    "jpg": ("JPEG", "image/jpeg", {"quality": 70, "optimize": True, "progressive": True}),
+}
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+
+def variant_widths() -> Sequence[int]:
+    return tuple(sorted(getattr(settings, "IMAGE_VARIANT_WIDTHS", (480, 960, 1600))))
+
+
+def _supported(ext: str) -> bool:
+    return ext == "jpg" or bool(features.check(ext))
+
+
+def variant_formats() -> List[str]:
+    configured = getattr(settings, "IMAGE_VARIANT_FORMATS", ("webp", "jpg"))
+    return [ext for ext in FORMATS if ext in configured and _supported(ext)]
+
+
+def variant_name(name: str, width: int, ext: str) -> str:
+    root, _ = os.path.splitext(name)
+    return f"{root}_w{width}.{ext}"
+
+
+def variant_names(name: str) -> Iterable[str]:
+    for width in variant_widths():
+        for ext in FORMATS:
+            yield variant_name(name, width, ext)
+
+
+class VariantCache:
+    """Per-process record of the variants that exist for each image name."""
+
+    def __init__(self) -> None:
+        self._existing: Dict[str, FrozenSet[str]] = {}
+        self._lock = threading.Lock()
+
+    def existing(self, storage, name: str) -> FrozenSet[str]:
+        found = self._existing.get(name)
+        if found is None:
+            found = frozenset(target for target in variant_names(name) if storage.exists(target))
+            with self._lock:
+                self._existing[name] = found
+        return found
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        with self._lock:
+            if name is None:
+                self._existing.clear()
+            else:
+                self._existing.pop(name, None)
+
+
+variant_cache = VariantCache()
+
+
+def _reset_variant_cache(*, setting: str, **kwargs) -> None:
+    if setting in ("MEDIA_ROOT", "STORAGES") or setting.startswith("IMAGE_VARIANT_"):
+        variant_cache.invalidate()
+
+
+setting_changed.connect(_reset_variant_cache)
+
+
+def generate_variants(storage, name: str) -> List[str]:
+    """Write every configured variant of ``name`` that is narrower than the original."""
+
+    with storage.open(name, "rb") as handle, Image.open(handle) as source:
+        image = ImageOps.exif_transpose(source).convert("RGB")
+
+    written = []
+    for width in variant_widths():
+        if width >= image.width:
+            continue
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        for ext in variant_formats():
+            pil_format, _, options = FORMATS[ext]
+            buffer = BytesIO()
+            resized.save(buffer, format=pil_format, **options)
+            target = variant_name(name, width, ext)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(buffer.getvalue()))
+            written.append(target)
+    variant_cache.invalidate(name)
+    return written
+
+
+def delete_variants(storage, name: str) -> None:
+    for target in variant_names(name):
+        if storage.exists(target):
+            storage.delete(target)
+    variant_cache.invalidate(name)
+
+
+@lru_cache(maxsize=256)
+def accepted_types(accept: str) -> FrozenSet[str]:
+    """The media types an ``Accept`` header names with a nonzero q-value."""
+
+    accepted = set()
+    for media_range in accept.split(","):
+        media_type, *params = media_range.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(media_type.strip().lower())
+    return frozenset(accepted)
+
+
+def _accepts(accept: str, mime: str) -> bool:
+    # Only formats a client names explicitly; "*/*" is no promise of WebP.
+    return mime == "image/jpeg" or mime in accepted_types(accept)
+
+
+def pick_variant(field, accept: str, width: Optional[int]) -> Tuple[Optional[str], Optional[str]]:
+    """Return ``(name, content_type)`` of the best existing variant, or ``(None, None)``."""
+
+    widths = variant_widths()
+    if not widths:
+        return None, None
+    if width is None:
+        width = widths[-1]
+    candidates = [candidate for candidate in widths if candidate >= width]
+    if not candidates:
+        return None, None
+
+    existing = variant_cache.existing(field.storage, field.name)
+    if not existing:
+        return None, None
+    for ext in variant_formats():
+        _, mime, _ = FORMATS[ext]
+        if not _accepts(accept, mime):
+            continue
+        for candidate in candidates:
+            name = variant_name(field.name, candidate, ext)
+            if name in existing:
+                return name, mime
+    return None, None
@@ -0,0 +1,40 @@
+"""Validators used for ``ETag``/``Last-Modified`` conditional GETs.
+
+The index page is tagged with the version ``pagecache`` keeps with its cached
+HTML, a hash of the rendered page, so every edit it shows (deletions
+included) changes the tag. It has no ``Last-Modified``: no timestamp moves
+when a row is deleted. Images are versioned by their file's modification time
+and size.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime
+from typing import Optional, Tuple
+
+from django.middleware.csrf import get_token
+
+
+def index_etag_for(request, version: str) -> str:
+    # The body embeds a token derived from the visitor's CSRF cookie, so the
+    # tag must change with it. get_token() also covers the first visit, where
+    # the cookie is only being issued by this response.
+    get_token(request)
+    csrf_secret = request.META.get("CSRF_COOKIE", "")
+    return hashlib.sha1(f"{version}:{csrf_secret}".encode()).hexdigest()
+
+
+def file_version(field) -> Tuple[str, Optional[datetime]]:
+    """Return ``(etag, last_modified)`` for a stored file."""
+
+    storage = field.storage
+    try:
+        modified = storage.get_modified_time(field.name)
+    except (NotImplementedError, OSError):
+        modified = None
+    size = field.size
+    etag = hashlib.sha1(
+        f"{field.name}:{size}:{modified and modified.timestamp()}".encode()
+    ).hexdigest()
+    return etag, modified
@@ -1,20 +1,35 @@
-"""Views for the portfolio application."""
+"""Views for the portfolio application.
+
+``aindex`` and ``aserve_image`` are the async versions of ``index`` and
+``serve_image``, routed instead of them when ``ASYNC_VIEWS`` is set (as
+``portfolio.asgi`` does). They read through the async ORM and caches, write
+the visit in a background task and stream uncached image files.
+"""
 
 from __future__ import annotations
 
-from typing import Dict, Iterable, List
+from typing import Dict, List, Optional
 
-from django.http import FileResponse, Http404
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, quote_etag
 from django.views.decorators.cache import never_cache
 
-from mainPage.log import VisitorLogger
+from mainPage import imageserve
+from mainPage.log import get_visitor_logger
 from mainPage.models import About, Background_img, Blog, Contact, Portfolio
+from mainPage.pagecache import acached_page, add_csrf_token, cached_page
+from mainPage.sampler import background_sampler
 from mainPage.utils import ClientMeta, Utility
+from mainPage.variants import pick_variant, variant_cache, variant_widths
+from mainPage.versioning import index_etag_for
 
 
 utility = Utility()
-visitor_logger = VisitorLogger()
+visitor_logger = get_visitor_logger()
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
 
 
 def _build_about_sections(about: About | None) -> List[str]:
@@ -23,62 +38,199 @@ def _build_about_sections(about: About | None) -> List[str]:
     return [segment.strip() for segment in about.content.splitlines() if segment.strip()]
 
 
-def _get_contacts() -> Iterable[Contact]:
-    return Contact.objects.order_by("types")
+def _get_contacts() -> List[Contact]:
+    return list(Contact.objects.order_by("types"))
 
 
-@never_cache
-def index(request):
-    client = ClientMeta(
-        ip_address=utility.get_client_ip_address(request),
-        user_agent=utility.get_user_agent(request),
-    )
-
-    portfolio = Portfolio.objects.first()
-    specialisations = portfolio.specialisation_set.all() if portfolio else []
-    about = About.objects.first()
-    blogs = Blog.objects.order_by("-pub_date")
+def _build_context() -> Dict[str, object]:
+    # Querysets are evaluated here so the template cannot add queries.
+    portfolio = Portfolio.objects.current()
+    specialisations = list(portfolio.specialisation_set.all()) if portfolio else []
+    about = About.objects.current()
+    blogs = list(Blog.objects.order_by("-pub_date"))
     contacts = _get_contacts()
 
-    context: Dict[str, object] = {
+    return {
         "portfolio": portfolio,
         "about": _build_about_sections(about),
+        "about_version": int(about.last_updated.timestamp()) if about else None,
+        "image_widths": variant_widths(),
         "specialisations": specialisations,
         "blogs": blogs,
         "contacts": contacts,
     }
 
-    if request.method == "POST":
-        name = request.POST.get("name", "").strip()
-        email = request.POST.get("email", "").strip()
-        message = request.POST.get("message", "").strip()
 
-        feedback = {"name": name, "email": email, "message": message}
-        visitor_logger.add(client.ip_address, client.user_agent, feedback=feedback)
+async def _abuild_context() -> Dict[str, object]:
+    portfolio = await Portfolio.objects.acurrent()
+    specialisations = [item async for item in portfolio.specialisation_set.all()] if portfolio else []
+    about = await About.objects.acurrent()
+    blogs = [blog async for blog in Blog.objects.order_by("-pub_date")]
+    contacts = [contact async for contact in Contact.objects.order_by("types")]
 
-        context["response"] = "Thanks! I'll be in touch shortly."
-    else:
-        visitor_logger.add(client.ip_address, client.user_agent)
+    return {
+        "portfolio": portfolio,
+        "about": _build_about_sections(about),
+        "about_version": int(about.last_updated.timestamp()) if about else None,
+        "image_widths": variant_widths(),
+        "specialisations": specialisations,
+        "blogs": blogs,
+        "contacts": contacts,
+    }
 
-    return render(request, "mainPage/index.html", context)
+
+def _client(request) -> ClientMeta:
+    return ClientMeta(
+        ip_address=utility.get_client_ip_address(request),
+        user_agent=utility.get_user_agent(request),
+    )
+
+
+def _log_visit(request, feedback: Dict[str, str] | None = None) -> None:
+    client = _client(request)
+    visitor_logger.add(client.ip_address, client.user_agent, feedback=feedback)
 
 
 @never_cache
-def serve_image(request, types: str):
-    image_field = None
-
-    if types == "bg":
-        background = Background_img.random()
-        if background:
-            image_field = background.image
-    elif types == "ab":
-        about = About.objects.first()
-        if about:
-            image_field = about.image
-
-    if not image_field:
+def _submit_feedback(request):
+    name = request.POST.get("name", "").strip()
+    email = request.POST.get("email", "").strip()
+    message = request.POST.get("message", "").strip()
+
+    feedback = {"name": name, "email": email, "message": message}
+    _log_visit(request, feedback)
+
+    context = _build_context()
+    context["response"] = "Thanks! I'll be in touch shortly."
+    return render(request, "mainPage/index.html", context)
+
+
+def _page_response(request, html: str, version: str) -> HttpResponse:
+    # What the condition() and cache_control() decorators would do, with the
+    # ETag taken from the cached page itself.
+    etag = quote_etag(index_etag_for(request, version))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(add_csrf_token(request, html))
+    if request.method in ("GET", "HEAD"):
+        response.headers.setdefault("ETag", etag)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _render_index(request):
+    html, version = cached_page("index", "mainPage/index.html", _build_context)
+    return _page_response(request, html, version)
+
+
+def index(request):
+    if request.method == "POST":
+        return _submit_feedback(request)
+
+    # Logged before the conditional check so 304 responses still count.
+    _log_visit(request)
+    return _render_index(request)
+
+
+async def _arender_index(request) -> HttpResponse:
+    html, version = await acached_page("index", "mainPage/index.html", _abuild_context)
+    return _page_response(request, html, version)
+
+
+async def aindex(request):
+    if request.method == "POST":
+        # Feedback is rare and rendered uncached; keep the sync path.
+        return await sync_to_async(_submit_feedback)(request)
+
+    client = _client(request)
+    await visitor_logger.aadd(client.ip_address, client.user_agent)
+    return await _arender_index(request)
+
+
+def _image_field(instance) -> Optional[object]:
+    if instance and instance.image:
+        return instance.image
+    return None
+
+
+def _pick_width(request) -> Optional[int]:
+    try:
+        return int(request.GET["w"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _variant_field(image_field, variant: Optional[str]):
+    if not variant:
+        return image_field
+    return image_field.field.attr_class(image_field.instance, image_field.field, variant)
+
+
+def _about_version(instance) -> Optional[str]:
+    if isinstance(instance, About):
+        return str(int(instance.last_updated.timestamp()))
+    return None
+
+
+def _patch_image_headers(request, response, instance, variant: Optional[str]) -> HttpResponse:
+    patch_vary_headers(response, ("Accept",))
+    version = _about_version(instance)
+    if variant and version is not None and request.GET.get("v") == version:
+        # The page links the about image with a version that changes on every
+        # About save, so once its variant exists that URL's content never
+        # changes. Until then the original is served and must be revalidated,
+        # and so must any other version, which may name an older image.
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def _forget_missing(types: str, image_field, retried: bool) -> None:
+    # Another worker deleted the file; the lists naming it here are stale.
+    variant_cache.invalidate(image_field.name)
+    if types != "bg" or retried:
         raise Http404
+    background_sampler.invalidate()
 
-    image_file = image_field.open("rb")
-    return FileResponse(image_file, content_type="image/jpeg")
 
+def serve_image(request, types: str):
+    for retried in (False, True):
+        instance = None
+        if types == "bg":
+            instance = Background_img.random()
+        elif types == "ab":
+            instance = About.objects.current()
+        image_field = _image_field(instance)
+        if not image_field:
+            raise Http404
+
+        variant, _ = pick_variant(image_field, request.META.get("HTTP_ACCEPT", ""), _pick_width(request))
+        try:
+            response = imageserve.serve(request, _variant_field(image_field, variant))
+        except FileNotFoundError:
+            _forget_missing(types, image_field, retried)
+            continue
+        return _patch_image_headers(request, response, instance, variant)
+
+
+async def aserve_image(request, types: str):
+    for retried in (False, True):
+        instance = None
+        if types == "bg":
+            instance = await Background_img.arandom()
+        elif types == "ab":
+            instance = await About.objects.acurrent()
+        image_field = _image_field(instance)
+        if not image_field:
+            raise Http404
+
+        variant, _ = await sync_to_async(pick_variant, thread_sensitive=False)(
+            image_field, request.META.get("HTTP_ACCEPT", ""), _pick_width(request)
+        )
+        try:
+            response = await imageserve.aserve(request, _variant_field(image_field, variant))
+        except FileNotFoundError:
+            _forget_missing(types, image_field, retried)
+            continue
+        return _patch_image_headers(request, response, instance, variant)
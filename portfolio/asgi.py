@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'portfolio.settings')
+# Route the async views; see ASYNC_VIEWS in settings.
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -53,11 +53,21 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'mainPage.middleware.RemoteAddrMiddleware',
-    
+    'mainPage.throttle.ThrottleMiddleware',
+    'mainPage.queries.QueryBudgetMiddleware',
 ]
 
+# Proxies in front of the site that append to X-Forwarded-For. RemoteAddrMiddleware
+# takes the client address that many entries from the right; 0 ignores the header.
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', '1'))
+
 ROOT_URLCONF = 'portfolio.urls'
 
+# Serve the index and images with the async views (mainPage.views.aindex and
+# aserve_image). portfolio.asgi turns this on; under WSGI the sync views avoid
+# an event loop per request.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '') == '1'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -80,12 +90,140 @@ WSGI_APPLICATION = 'portfolio.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': str(BASE_DIR / 'db.sqlite3'),
+# PostgreSQL is used when POSTGRES_DB is set, otherwise SQLite at SQLITE_PATH.
+# Connections are kept for DATABASE_CONN_MAX_AGE seconds and checked before
+# reuse. Set DATABASE_POOL=pgbouncer when connecting through PgBouncer in
+# transaction pooling mode.
+
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', '60'))
+
+if os.environ.get('POSTGRES_DB'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ['POSTGRES_DB'],
+            'USER': os.environ.get('POSTGRES_USER', ''),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', ''),
+            'PORT': os.environ.get('POSTGRES_PORT', ''),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'connect_timeout': 5},
+        }
+    }
+    if os.environ.get('DATABASE_POOL') == 'pgbouncer':
+        # Server-side cursors do not survive PgBouncer moving the connection
+        # to another client between transactions.
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            # A file rather than SQLite's shared in-memory database, whose table
+            # locks fail concurrent writers at once instead of waiting; the
+            # concurrency tests need real connections per thread.
+            'TEST': {'NAME': str(BASE_DIR / 'test_db.sqlite3')},
+        }
+    }
+
+# PRAGMAs run on every new SQLite connection (mainPage.dbtuning): WAL lets
+# page views read while a visit is written, and writers wait for the lock
+# instead of failing. SQLITE_TUNED=0 keeps SQLite's defaults.
+if os.environ.get('SQLITE_TUNED', '1') == '1':
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -16000,
+        'temp_store': 'memory',
+    }
+else:
+    SQLITE_PRAGMAS = {}
+
+
+# Cache
+# The rendered page and its content generation live here; use a shared
+# backend in production so an admin edit invalidates every worker.
+
+if os.environ.get('MEMCACHED_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': os.environ['MEMCACHED_LOCATION'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
+
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_TIMEOUT = 24 * 60 * 60
+# How long a content generation lasts. Edits reach other workers of a
+# per-process cache only when it expires; with memcached it bounds how long an
+# edit made outside the admin (without signals) stays unseen.
+PAGE_CACHE_GENERATION_TIMEOUT = 60
+# Most SQL queries a request to each URL name may run. The tests hold every
+# endpoint to its budget and QueryBudgetMiddleware logs production requests
+# that exceed it (QUERY_BUDGET_DEFAULT applies to unlisted URLs).
+QUERY_BUDGETS = {
+    # A first visit from a new address, with the page cache cold.
+    'mainPage:index': 10,
+    'mainPage:serve_image': 2,
+    'admin:mainPage_visit_detail_changelist': 5,
+    'admin:mainPage_people_changelist': 6,
+    'admin:mainPage_background_img_changelist': 5,
+    'admin:mainPage_about_changelist': 5,
+    'admin:mainPage_blog_changelist': 5,
+    'admin:mainPage_contact_changelist': 5,
+    'admin:mainPage_portfolio_changelist': 5,
+    'admin:mainPage_visitrollup_changelist': 6,
+    'admin:admin_honeypot_attackerstat_changelist': 10,
 }
+QUERY_BUDGET_DEFAULT = None
+
+# Portfolio and About rows are kept in process memory per content generation,
+# for at most SINGLETON_CACHE_TIMEOUT seconds; name a cache alias here to also
+# share them between workers.
+SINGLETON_CACHE_ALIAS = None
+SINGLETON_CACHE_TIMEOUT = 60
+
+# Seconds a process keeps its in-memory list of backgrounds before reloading;
+# edits made in the same process invalidate it immediately.
+BACKGROUND_SAMPLER_TTL = 300
+
+# Images are served from an in-process byte cache. Set IMAGE_SENDFILE to
+# 'x-sendfile' (Apache/lighttpd) or 'x-accel-redirect' (nginx, with an
+# internal location at IMAGE_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT) to
+# let the front-end server send the bytes instead.
+IMAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+IMAGE_CACHE_MAX_ITEM_BYTES = 4 * 1024 * 1024
+IMAGE_CACHE_TTL = 60 * 60
+IMAGE_SENDFILE = os.environ.get('IMAGE_SENDFILE') or None
+IMAGE_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Downscaled copies written next to each uploaded image by its compression
+# job; serve_image picks one from ?w= and the Accept header. 'avif' can be
+# added to the formats when Pillow is built with AVIF support.
+IMAGE_VARIANT_WIDTHS = (480, 960, 1600)
+IMAGE_VARIANT_FORMATS = ('webp', 'jpg')
+
+# Uploaded images are compressed after the admin save commits. 'process' runs
+# the encoding in a pool of IMAGE_JOBS_PROCESSES worker processes fed by
+# IMAGE_JOBS_DISPATCHERS threads, 'thread' keeps it on those threads and
+# 'sync' runs each job inline on commit.
+IMAGE_JOBS_MODE = os.environ.get('IMAGE_JOBS_MODE', 'process')
+IMAGE_JOBS_DISPATCHERS = 2
+IMAGE_JOBS_PROCESSES = 2
+# Longest side, in pixels, of the stored JPEG; larger uploads are downscaled
+# while they are decoded. 0 keeps the original resolution.
+IMAGE_MAX_DIMENSION = 2560
 
 
 # Password validation
@@ -133,4 +271,110 @@ STATIC_ROOT = os.path.join(PROJECT_DIR, 'static')
 SESSION_COOKIE_AGE = 5 * 60
 
 MFA_ISSUER_NAME = "Portfolio"
+# Loads each user's MFA configuration with the user, for the admin login form.
+AUTHENTICATION_BACKENDS = ['accounts.backends.MFAModelBackend']
+# After MFA_LOCKOUT_THRESHOLD wrong one-time codes in a row, a user's codes are
+# refused for MFA_LOCKOUT_BACKOFF seconds, doubling with each further wrong
+# code up to MFA_LOCKOUT_MAX_BACKOFF. Counts expire MFA_LOCKOUT_WINDOW seconds
+# after the last failure and are kept in the MFA_LOCKOUT_CACHE_ALIAS cache,
+# which must be shared (memcached) for the limit to hold across workers; with
+# the local-memory cache each process keeps its own counts.
+MFA_LOCKOUT_THRESHOLD = 5
+MFA_LOCKOUT_BACKOFF = 30
+MFA_LOCKOUT_MAX_BACKOFF = 60 * 60
+MFA_LOCKOUT_WINDOW = 15 * 60
+MFA_LOCKOUT_CACHE_ALIAS = 'default'
+
+# Visitor logging: 'mainPage.log.BufferedVisitorLogger' moves the writes off
+# the request thread into a batching background worker.
+VISITOR_LOGGER = os.environ.get('VISITOR_LOGGER', 'mainPage.log.VisitorLogger')
+VISITOR_LOGGER_OPTIONS = {}
+# Visits from bots (user agents matching VISITOR_BOT_PATTERNS, defaulting to
+# mainPage.traffic.DEFAULT_BOT_PATTERNS, or no user agent at all) and from
+# VISITOR_DENY_NETWORKS are only counted per day in FilteredVisit, flushed by a
+# background thread every VISITOR_FILTER_FLUSH_INTERVAL seconds.
+# VISITOR_ALLOW_NETWORKS are always recorded. Networks are CIDR strings, e.g.
+# '10.0.0.0/8'.
+VISITOR_ALLOW_NETWORKS = []
+VISITOR_DENY_NETWORKS = []
+VISITOR_AGENT_CACHE_SIZE = 1024
+VISITOR_FILTER_FLUSH_INTERVAL = 60
+
+# Throttling: POSTs to the THROTTLE_VIEWS URL names are rejected with 429
+# once a token bucket of their scope is empty. THROTTLE_RATES gives each scope
+# a (burst, seconds) bucket per address and per subnet (THROTTLE_SUBNET_PREFIXES
+# for IPv4 and IPv6), kept in the THROTTLE_CACHE_ALIAS cache.
+THROTTLE_ENABLED = os.environ.get('THROTTLE_ENABLED', '1') == '1'
+THROTTLE_VIEWS = {
+    'mainPage:index': 'contact',
+    'admin_honeypot:login': 'honeypot',
+    'admin_honeypot:index': 'honeypot',
+}
+THROTTLE_RATES = {
+    'contact': {'ip': (3, 10 * 60), 'subnet': (20, 10 * 60)},
+    'honeypot': {'ip': (5, 5 * 60), 'subnet': (30, 5 * 60)},
+}
+THROTTLE_SUBNET_PREFIXES = (24, 64)
+THROTTLE_CACHE_ALIAS = 'default'
+
+# Honeypot login attempts: 'admin_honeypot.ingest.BufferedAttemptRecorder'
+# writes them in batches from a background worker, storing repeats of the same
+# address, username and path as one row with an attempts count.
+ADMIN_HONEYPOT_RECORDER = os.environ.get('ADMIN_HONEYPOT_RECORDER', 'admin_honeypot.ingest.AttemptRecorder')
+ADMIN_HONEYPOT_RECORDER_OPTIONS = {}
+# Keep per-address, subnet, username and path totals of the attempts for the
+# admin's attacker summary and its CSV/JSON export.
+ADMIN_HONEYPOT_AGGREGATES = True
+
+# Honeypot alerts: login attempts are mailed to ADMINS in one digest per
+# address every ADMIN_HONEYPOT_ALERT_WINDOW seconds, at most
+# ADMIN_HONEYPOT_ALERT_MAX_PER_HOUR emails an hour, by a background worker that
+# retries failed sends ADMIN_HONEYPOT_ALERT_RETRIES times.
+ADMIN_HONEYPOT_ALERT_WINDOW = 5 * 60
+ADMIN_HONEYPOT_ALERT_MAX_PER_HOUR = 12
+ADMIN_HONEYPOT_ALERT_RETRIES = 3
+ADMIN_HONEYPOT_ALERT_RETRY_DELAY = 30
+
+# Analytics: `manage.py rollup_visits` maintains hourly and daily rollups of
+# the visits for the admin dashboard. Days that ended less than
+# ANALYTICS_SETTLE_SECONDS before its previous run are recomputed too, to
+# pick up locations resolved after the visit was saved.
+ANALYTICS_SETTLE_SECONDS = 60 * 60
+
+# Retention: `manage.py apply_retention` deletes rows older than max_age_days
+# and beyond the newest max_rows, RETENTION_BATCH_SIZE at a time, after
+# appending them to gzipped JSON Lines files in RETENTION_ARCHIVE_DIR.
+# Visits are kept until rollup_visits has counted them. archive_fields adds
+# values from related rows to each archived record.
+RETENTION_POLICIES = {
+    'mainPage.Visit_detail': {
+        'field': 'visit_time',
+        'max_age_days': 365,
+        'max_rows': 1_000_000,
+        'after_rollup': True,
+        'archive_fields': {'ip_address': 'people__ip_address'},
+    },
+    'admin_honeypot.LoginAttempt': {
+        'field': 'timestamp',
+        'max_age_days': 180,
+        'max_rows': 500_000,
+    },
+}
+RETENTION_BATCH_SIZE = 1000
+RETENTION_BATCH_PAUSE = 0.05
+RETENTION_ARCHIVE_DIR = os.environ.get('RETENTION_ARCHIVE_DIR', str(BASE_DIR / 'archive'))
+
+# Geo-IP resolution: backends are tried in order, results are cached in
+# memory (and in the IpLocation table when GEOIP_PERSISTENT_CACHE is set).
+# With GEOIP_DEFERRED visits are saved immediately and enriched by a worker.
+# GEOIP_INDEX points at an index built by `manage.py build_geoindex`, which is
+# then consulted before the remote API.
+GEOIP_BACKENDS = ['mainPage.geo.DbIpCityBackend']
+if os.environ.get('GEOIP_INDEX'):
+    GEOIP_BACKENDS.insert(0, ('mainPage.geo.RangeFileBackend', {'path': os.environ['GEOIP_INDEX']}))
+GEOIP_CACHE_SIZE = 4096
+GEOIP_CACHE_TTL = 24 * 60 * 60
+GEOIP_NEGATIVE_TTL = 10 * 60
+GEOIP_PERSISTENT_CACHE = os.environ.get('GEOIP_PERSISTENT_CACHE', '') == '1'
+GEOIP_DEFERRED = os.environ.get('GEOIP_DEFERRED', '') == '1'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'